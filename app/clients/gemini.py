@@ -1,22 +1,38 @@
+import time
+from typing import Optional
+
 import httpx
-from app.core.config import GOOGLE_API_KEY
+from app.core.config import GEMINI_BASE_URL
+from app.core.tenants import current_tenant
+from app.core.metrics import span
+from app.core.llm_usage import record_llm_call
+from app.core.logger import get_logger
+from app.clients.http import get_http_client
+
+log = get_logger("gemini")
 
-async def ask_gemini_with_history(history_messages: list[dict]) -> str:
+async def ask_gemini_with_history(
+    history_messages: list[dict],
+    purpose: str = "chat",
+    conversation_id: Optional[str] = None,
+) -> str:
+    """
+    Envía el historial a Gemini y devuelve el texto de la respuesta.
+    `purpose` (ej. "sales", "image_intent") y `conversation_id` (teléfono) sólo se
+    usan para la contabilidad de tokens.
+    """
+    tenant = current_tenant()
+    if conversation_id:
+        conversation_id = tenant.key_prefix + conversation_id
     url = (
-        "https://generativelanguage.googleapis.com"
-        f"/v1/models/gemini-2.0-flash-lite:generateContent?key={GOOGLE_API_KEY}"
+        f"{GEMINI_BASE_URL}"
+        f"/v1/models/gemini-2.0-flash-lite:generateContent?key={tenant.google_api_key}"
     )
 
-    # 🧠 Prompt inicial para guiar la conversación
+    # 🧠 Prompt inicial para guiar la conversación (persona de la tienda)
     system_prompt = {
         "role": "user",  # Gemini no permite 'system'
-        "parts": [{
-            "text": (
-                "Eres un vendedor de una licorera llamada licores el roble, "
-                "Respuestas hamanas y cortas y si alguien te pregunta por algun licor respondes como experto"
-                
-            )
-        }]
+        "parts": [{"text": tenant.persona_prompt}]
     }
 
     # 🧾 Construir el historial para enviar a Gemini
@@ -25,24 +41,41 @@ async def ask_gemini_with_history(history_messages: list[dict]) -> str:
         for msg in history_messages
     ]
 
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(url, json={"contents": contents})
+    with span("client.gemini") as s:
+        started = time.perf_counter()
+        recorded = False
+        try:
+            response = await get_http_client().post(url, json={"contents": contents}, timeout=10.0)
             result = response.json()
 
-            print("🧠 Respuesta completa de Gemini:", result)
+            log.debug("🧠 Respuesta completa de Gemini: %s", result)
+            record_llm_call(
+                purpose,
+                conversation_id,
+                result.get("usageMetadata"),
+                time.perf_counter() - started,
+                outcome="ok" if result.get("candidates") else "no_candidates",
+            )
+            recorded = True
 
             # ✅ Extraer texto de forma segura
             if "candidates" in result and result["candidates"]:
                 return result["candidates"][0]["content"]["parts"][0]["text"]
 
-            print("⚠️ Respuesta sin candidatos válidos.")
+            log.warning("⚠️ Respuesta sin candidatos válidos.")
+            s.outcome = "no_candidates"
             return "Lo siento, no pude generar una respuesta en este momento."
 
-    except httpx.HTTPError as e:
-        print("❌ Error HTTP al llamar a Gemini:", str(e))
-        return "Hubo un problema de conexión al generar la respuesta."
+        except httpx.HTTPError as e:
+            log.error("❌ Error HTTP al llamar a Gemini: %s", e)
+            s.outcome = "http_error"
+            record_llm_call(purpose, conversation_id, None, time.perf_counter() - started, outcome="http_error")
+            return "Hubo un problema de conexión al generar la respuesta."
 
-    except Exception as e:
-        print("❌ Error inesperado en Gemini:", str(e))
-        return "Lo siento, ocurrió un error al generar la respuesta."
+        except Exception as e:
+            log.error("❌ Error inesperado en Gemini: %s", e)
+            s.outcome = "error"
+            if not recorded:
+                # Ej. respuesta que no es JSON: la llamada cuenta igual (sin tokens)
+                record_llm_call(purpose, conversation_id, None, time.perf_counter() - started, outcome="error")
+            return "Lo siento, ocurrió un error al generar la respuesta."
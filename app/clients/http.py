@@ -0,0 +1,34 @@
+# app/clients/http.py
+"""
+Cliente httpx compartido para las llamadas salientes a Gemini y WhatsApp.
+
+Se crea con la primera llamada (no al importar) y reutiliza las conexiones
+keep-alive entre mensajes, en vez de abrir TLS nuevo en cada envío. Un
+AsyncClient queda atado al event loop donde abrió conexiones, así que si el loop
+cambia (tests, runtimes que crean un loop por invocación) se crea otro.
+"""
+import asyncio
+
+import httpx
+
+_TIMEOUT = httpx.Timeout(10.0)
+_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=10)
+
+_client = None
+_loop = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _loop is not loop:
+        _client = httpx.AsyncClient(timeout=_TIMEOUT, limits=_LIMITS)
+        _loop = loop
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client, _loop
+    if _client is not None and not _client.is_closed and _loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = _loop = None
@@ -1,13 +1,22 @@
 # app/clients/whatsapp.py
 
-import requests
-from app.core.config import WHATSAPP_TOKEN, WHATSAPP_PHONE_NUMBER_ID
+from typing import Optional
 
-def send_whatsapp_message(to: str, message: str):
+import httpx
+from app.core.config import WHATSAPP_API_BASE_URL
+from app.core.tenants import current_tenant
+from app.core.metrics import span
+from app.core.logger import get_logger
+from app.clients.http import get_http_client
+
+log = get_logger("whatsapp")
+
+async def send_whatsapp_message(to: str, message: str):
     """Envía un mensaje de texto simple por WhatsApp."""
-    url = f"https://graph.facebook.com/v18.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
+    tenant = current_tenant()
+    url = f"{WHATSAPP_API_BASE_URL}/{tenant.phone_number_id}/messages"
     headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
+        "Authorization": f"Bearer {tenant.whatsapp_token}",
         "Content-Type": "application/json"
     }
     data = {
@@ -16,24 +25,27 @@ def send_whatsapp_message(to: str, message: str):
         "type": "text",
         "text": {"body": message}
     }
-    try:
-        resp = requests.post(url, headers=headers, json=data)
-        resp.raise_for_status()
-        print(f"✅ Texto enviado a {to}: {resp.status_code}")
-    except requests.RequestException as e:
-        print(f"❌ Error enviando texto a {to}: {e}")
-        print("⚠️ Respuesta:", resp.text if 'resp' in locals() else 'No response')
+    with span("client.whatsapp.text") as s:
+        resp = None
+        try:
+            resp = await get_http_client().post(url, headers=headers, json=data)
+            resp.raise_for_status()
+            log.debug("✅ Texto enviado a %s: %s", to, resp.status_code)
+        except httpx.HTTPError as e:
+            s.outcome = "http_error"
+            log.error("❌ Error enviando texto a %s: %s | Respuesta: %s", to, e, resp.text if resp is not None else 'No response')
 
 
-def send_whatsapp_image(to: str, image_url: str, caption: str = None):
+async def send_whatsapp_image(to: str, image_url: str, caption: str = None):
     """
     Envía una imagen por WhatsApp.
     - `image_url` debe ser una URL pública accesible (HTTPS).
     - `caption` es opcional.
     """
-    url = f"https://graph.facebook.com/v18.0/{WHATSAPP_PHONE_NUMBER_ID}/messages"
+    tenant = current_tenant()
+    url = f"{WHATSAPP_API_BASE_URL}/{tenant.phone_number_id}/messages"
     headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
+        "Authorization": f"Bearer {tenant.whatsapp_token}",
         "Content-Type": "application/json"
     }
 
@@ -48,11 +60,28 @@ def send_whatsapp_image(to: str, image_url: str, caption: str = None):
         "image": image_payload
     }
 
-    try:
-        resp = requests.post(url, headers=headers, json=data)
-        resp.raise_for_status()
-        print(f"✅ Imagen enviada a {to}: {image_url}")
-    except requests.RequestException as e:
-        print(f"❌ Error enviando imagen a {to}: {e}")
-        print("📸 URL:", image_url)
-        print("⚠️ Respuesta:", resp.text if 'resp' in locals() else 'No response')
+    with span("client.whatsapp.image") as s:
+        resp = None
+        try:
+            resp = await get_http_client().post(url, headers=headers, json=data)
+            resp.raise_for_status()
+            log.debug("✅ Imagen enviada a %s: %s", to, image_url)
+        except httpx.HTTPError as e:
+            s.outcome = "http_error"
+            log.error("❌ Error enviando imagen a %s: %s | 📸 URL: %s | Respuesta: %s", to, e, image_url, resp.text if resp is not None else 'No response')
+
+
+async def post_whatsapp_payload(data: dict, client: Optional[httpx.AsyncClient] = None) -> httpx.Response:
+    """
+    Envía un cuerpo ya armado a /messages con las credenciales de la tienda actual y
+    devuelve la respuesta tal cual (no captura errores: los maneja quien llama).
+    `client` permite usar un pool propio, ej. el de las campañas, para no ocupar
+    las conexiones de las respuestas en vivo.
+    """
+    tenant = current_tenant()
+    url = f"{WHATSAPP_API_BASE_URL}/{tenant.phone_number_id}/messages"
+    headers = {
+        "Authorization": f"Bearer {tenant.whatsapp_token}",
+        "Content-Type": "application/json"
+    }
+    return await (client or get_http_client()).post(url, headers=headers, json=data)
@@ -1,5 +1,6 @@
  
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +9,111 @@ WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
 WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# URLs base de las APIs externas (se cambian para apuntar a servidores de prueba, ver benchmarks/loadtest)
+WHATSAPP_API_BASE_URL = os.getenv("WHATSAPP_API_BASE_URL", "https://graph.facebook.com/v18.0")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+
 # Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
\ No newline at end of file
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+# Varias tiendas en un despliegue: ruta a un JSON (o el JSON en línea) con una entrada por tienda
+# (ver app/core/tenants.py). Sin definir, una sola tienda con las variables de arriba
+TENANTS_CONFIG = os.getenv("TENANTS_CONFIG", "")
+# Conversaciones guardadas a la vez por tienda con SESSION_BACKEND=memory; al superarlo se olvida
+# la menos reciente (0 = sin límite). Con sqlite no aplica: el estado está en disco y lo comparten los workers
+TENANT_MAX_SESSIONS = int(os.getenv("TENANT_MAX_SESSIONS", "0"))
+# Segundos sin uso tras los que se libera el catálogo en memoria de una tienda (0 = nunca)
+TENANT_CATALOG_IDLE_SECONDS = float(os.getenv("TENANT_CATALOG_IDLE_SECONDS", "1800"))
+
+# Estado de conversación: "memory" (un solo worker) o "sqlite" (compartido entre workers)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(tempfile.gettempdir(), "chatbot_sessions.db"))
+# Vencimiento del bloqueo por cliente con SQLite: el dueño lo renueva mientras trabaja, así que
+# sólo cuenta si el worker muere (otro lo retoma pasado este tiempo)
+SESSION_LOCK_TTL_SECONDS = float(os.getenv("SESSION_LOCK_TTL_SECONDS", "60"))
+
+# Segundos que se reutiliza el catálogo descargado antes de volver a pedirlo
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", "60"))
+# Snapshot del catálogo en disco para arranques en frío ("" lo desactiva) y uno opcional generado al desplegar
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "chatbot_catalog_snapshot.json"))
+CATALOG_BUNDLED_SNAPSHOT_PATH = os.getenv("CATALOG_BUNDLED_SNAPSHOT_PATH", "")
+
+# Catálogo en el prompt de ventas: "markdown" (detallado) o "compact" (una línea por variante con id corto)
+PROMPT_CATALOG_FORMAT = os.getenv("PROMPT_CATALOG_FORMAT", "markdown")
+# Con "false" los productos/variantes sin stock no se incluyen en el catálogo compacto
+PROMPT_CATALOG_INCLUDE_OUT_OF_STOCK = os.getenv("PROMPT_CATALOG_INCLUDE_OUT_OF_STOCK", "true").lower() not in ("0", "false", "no")
+
+# Costo fijo de envío (COP) que suma el carrito a cada pedido
+SHIPPING_COST = float(os.getenv("SHIPPING_COST", "5000"))
+
+# Importación masiva de productos: filas por lote y lotes escritos en paralelo
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "200"))
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+
+# Subida de imágenes: subidas simultáneas por request y tamaño de cada trozo leído
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv("IMAGE_UPLOAD_CONCURRENCY", "4"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+
+# Respuestas de al menos este tamaño (bytes) se comprimen con br/gzip
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Tiempo máximo de cada etapa de un mensaje: cargar/refrescar el catálogo (al vencer se usa el
+# último cargado) y armar y enviar la respuesta (se recorta al 80% de SESSION_LOCK_TTL_SECONDS;
+# un pedido que ya se empezó a registrar se termina aunque se pase)
+CONVERSATION_CATALOG_TIMEOUT_SECONDS = float(os.getenv("CONVERSATION_CATALOG_TIMEOUT_SECONDS", "8"))
+CONVERSATION_REPLY_TIMEOUT_SECONDS = float(os.getenv("CONVERSATION_REPLY_TIMEOUT_SECONDS", "45"))
+
+# Campañas de difusión: tope de mensajes por segundo (por defecto de cada campaña), envíos en
+# paralelo, destinatarios por lote (cada lote se guarda de una vez) y duración del lease del worker
+CAMPAIGN_MESSAGES_PER_SECOND = float(os.getenv("CAMPAIGN_MESSAGES_PER_SECOND", "20"))
+CAMPAIGN_CONCURRENCY = int(os.getenv("CAMPAIGN_CONCURRENCY", "16"))
+CAMPAIGN_BATCH_SIZE = int(os.getenv("CAMPAIGN_BATCH_SIZE", "200"))
+CAMPAIGN_LEASE_SECONDS = float(os.getenv("CAMPAIGN_LEASE_SECONDS", "120"))
+# Tope por número de WhatsApp, sumando todas sus campañas y workers (cubeta compartida en Supabase)
+CAMPAIGN_NUMBER_MESSAGES_PER_SECOND = float(os.getenv("CAMPAIGN_NUMBER_MESSAGES_PER_SECOND", os.getenv("CAMPAIGN_MESSAGES_PER_SECOND", "20")))
+# Enviar en una tarea de fondo del proceso que inicia la campaña. En serverless (Vercel) esa tarea
+# se congela al responder, así que allí se envía sólo desde /campaigns/tick (cron)
+CAMPAIGN_BACKGROUND_SENDING = os.getenv("CAMPAIGN_BACKGROUND_SENDING", "false" if os.getenv("VERCEL") else "true").lower() not in ("0", "false", "no")
+# Segundos de envío por cada llamada a /campaigns/tick, y secreto con que la invoca el cron de Vercel
+CAMPAIGN_TICK_SECONDS = float(os.getenv("CAMPAIGN_TICK_SECONDS", "25"))
+CRON_SECRET = os.getenv("CRON_SECRET")
+# Indicativo que se antepone a los teléfonos guardados sin él (ej. 3001112233 -> 573001112233)
+CAMPAIGN_DEFAULT_COUNTRY_CODE = os.getenv("CAMPAIGN_DEFAULT_COUNTRY_CODE", "57")
+
+# Estado de entrega (callbacks `statuses`): cada cuántos segundos se escriben los cambios, cuántos
+# por llamada (al juntarse ese número se escriben sin esperar) y cuántos mensajes se recuerdan en memoria
+DELIVERY_FLUSH_SECONDS = float(os.getenv("DELIVERY_FLUSH_SECONDS", "5"))
+DELIVERY_FLUSH_BATCH = int(os.getenv("DELIVERY_FLUSH_BATCH", "500"))
+DELIVERY_STATES_KEPT = int(os.getenv("DELIVERY_STATES_KEPT", "20000"))
+# Escribir los estados desde una tarea de fondo. En serverless (Vercel) esa tarea se congela al
+# responder, así que allí el webhook los escribe antes de responder
+DELIVERY_BACKGROUND_FLUSH = os.getenv("DELIVERY_BACKGROUND_FLUSH", "false" if os.getenv("VERCEL") else "true").lower() not in ("0", "false", "no")
+
+# Cada cuántos segundos se traen de Supabase los pedidos nuevos para la analítica de ventas (0 = nunca)
+ANALYTICS_RECONCILE_SECONDS = float(os.getenv("ANALYTICS_RECONCILE_SECONDS", "900"))
+# Cada cuántos segundos se recalcula todo desde cero (corrige pedidos borrados o editados a mano)
+ANALYTICS_FULL_RECONCILE_SECONDS = float(os.getenv("ANALYTICS_FULL_RECONCILE_SECONDS", "86400"))
+
+# OpenTelemetry opcional: si hay endpoint OTLP (ej. http://localhost:4318) se exportan los spans
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "whatsapp-chatbot")
+
+# Logging: nivel, largo máximo por mensaje y muestreo por categoría ("webhook=0.1,gemini=0.5")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+# Presupuestos de tokens del LLM (0 = sin alarma) y precio por millón de tokens para estimar costo
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_DAILY_TOKEN_BUDGET", "0"))
+LLM_CONVERSATION_TOKEN_BUDGET = int(os.getenv("LLM_CONVERSATION_TOKEN_BUDGET", "0"))
+LLM_PROMPT_COST_PER_MTOK = float(os.getenv("LLM_PROMPT_COST_PER_MTOK", "0.075"))
+LLM_COMPLETION_COST_PER_MTOK = float(os.getenv("LLM_COMPLETION_COST_PER_MTOK", "0.30"))
+
+# Token para los endpoints /admin (cabecera X-Admin-Token); sin definir, /admin queda deshabilitado
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Profiler por muestreo: fracción de requests perfilados (0 = sólo con X-Profile), intervalo y perfiles guardados
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
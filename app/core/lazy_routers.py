@@ -0,0 +1,51 @@
+# app/core/lazy_routers.py
+"""
+Carga perezosa de routers para reducir el arranque en frío (Vercel).
+
+`LazyRouterMiddleware` recibe un mapa prefijo -> módulo ("/orders" ->
+"app.routes.orders"). El módulo se importa, y su `router` se incluye en la app,
+la primera vez que llega un request bajo ese prefijo; así un webhook de WhatsApp
+no paga la importación de productos, órdenes, importación masiva, etc.
+
+Las rutas de documentación (/docs, /redoc, /openapi.json) cargan todos los
+routers para que el esquema quede completo.
+"""
+import importlib
+from typing import Dict
+
+from app.core.logger import get_logger
+
+log = get_logger("startup")
+
+_DOCS_PATHS = ("/docs", "/redoc", "/openapi.json")
+
+
+class LazyRouterMiddleware:
+    """Middleware ASGI que incluye cada router en `target` al primer request que lo necesita."""
+
+    def __init__(self, app, target, routers: Dict[str, str]):
+        self.app = app
+        self.target = target
+        self.pending = dict(routers)
+
+    def _load(self, prefix: str) -> None:
+        module = importlib.import_module(self.pending[prefix])
+        self.target.include_router(module.router)
+        # La importación es síncrona (no hay await en medio): no se incluye dos veces
+        del self.pending[prefix]
+        self.target.openapi_schema = None
+        log.info("Router %s cargado", prefix)
+
+    def _match(self, path: str):
+        if path.startswith(_DOCS_PATHS):
+            return list(self.pending)
+        return [
+            prefix for prefix in self.pending
+            if path == prefix or path.startswith(prefix.rstrip("/") + "/")
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if self.pending and scope["type"] == "http":
+            for prefix in self._match(scope["path"]):
+                self._load(prefix)
+        await self.app(scope, receive, send)
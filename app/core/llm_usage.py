@@ -0,0 +1,139 @@
+# app/core/llm_usage.py
+"""
+Contabilidad de tokens, latencia y costo de cada llamada al LLM.
+
+`record_llm_call()` se llama desde el cliente de Gemini con el `usageMetadata`
+de la respuesta. Los totales se agregan por día (UTC) y propósito, y por
+conversación (número de teléfono); también se exponen como métricas Prometheus.
+Si se supera LLM_DAILY_TOKEN_BUDGET o LLM_CONVERSATION_TOKEN_BUDGET se registra
+una alarma (una vez por día / conversación).
+"""
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.config import (
+    LLM_DAILY_TOKEN_BUDGET,
+    LLM_CONVERSATION_TOKEN_BUDGET,
+    LLM_PROMPT_COST_PER_MTOK,
+    LLM_COMPLETION_COST_PER_MTOK,
+)
+from app.core.logger import get_logger
+from app.core.metrics import Counter, Histogram, register
+
+log = get_logger("llm_usage")
+
+# Conversaciones cuyo consumo se recuerda (las menos recientes se descartan)
+_MAX_CONVERSATIONS = 10000
+_DAYS_KEPT = 31
+
+LLM_TOKENS = register(Counter(
+    "chatbot_llm_tokens_total", "Tokens consumidos por llamadas al LLM", labels=("purpose", "kind"),
+))
+LLM_CALLS = register(Counter(
+    "chatbot_llm_calls_total", "Llamadas al LLM por propósito y resultado", labels=("purpose", "outcome"),
+))
+LLM_LATENCY = register(Histogram(
+    "chatbot_llm_latency_seconds", "Latencia de las llamadas al LLM", labels=("purpose",),
+))
+LLM_BUDGET_EXCEEDED = register(Counter(
+    "chatbot_llm_budget_exceeded_total", "Veces que se superó un presupuesto de tokens", labels=("scope",),
+))
+
+
+def _empty_totals() -> dict:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "latency_seconds": 0.0, "cost": 0.0}
+
+
+def _add(totals: dict, prompt: int, completion: int, total: int, latency: float, cost: float) -> None:
+    totals["calls"] += 1
+    totals["prompt_tokens"] += prompt
+    totals["completion_tokens"] += completion
+    totals["total_tokens"] += total
+    totals["latency_seconds"] += latency
+    totals["cost"] += cost
+
+
+# día -> propósito -> totales
+_by_day: "OrderedDict[str, dict]" = OrderedDict()
+# teléfono -> {"totals": ..., "by_purpose": ..., "last_call": ts}
+_by_conversation: "OrderedDict[str, dict]" = OrderedDict()
+_alarmed_days: set = set()
+
+
+def record_llm_call(
+    purpose: str,
+    conversation_id: Optional[str],
+    usage: Optional[dict],
+    latency: float,
+    outcome: str = "ok",
+) -> None:
+    """Registra una llamada. `usage` es el `usageMetadata` de Gemini (puede faltar)."""
+    usage = usage or {}
+    prompt = int(usage.get("promptTokenCount") or 0)
+    completion = int(usage.get("candidatesTokenCount") or 0)
+    total = int(usage.get("totalTokenCount") or prompt + completion)
+    cost = (prompt * LLM_PROMPT_COST_PER_MTOK + completion * LLM_COMPLETION_COST_PER_MTOK) / 1_000_000
+
+    LLM_CALLS.inc(purpose=purpose, outcome=outcome)
+    LLM_TOKENS.inc(prompt, purpose=purpose, kind="prompt")
+    LLM_TOKENS.inc(completion, purpose=purpose, kind="completion")
+    LLM_LATENCY.observe(latency, purpose=purpose)
+
+    day = datetime.now(timezone.utc).date().isoformat()
+    day_stats = _by_day.get(day)
+    if day_stats is None:
+        day_stats = _by_day[day] = defaultdict(_empty_totals)
+        while len(_by_day) > _DAYS_KEPT:
+            _by_day.popitem(last=False)
+    _add(day_stats[purpose], prompt, completion, total, latency, cost)
+    _add(day_stats["all"], prompt, completion, total, latency, cost)
+
+    if LLM_DAILY_TOKEN_BUDGET and day not in _alarmed_days and day_stats["all"]["total_tokens"] > LLM_DAILY_TOKEN_BUDGET:
+        _alarmed_days.add(day)
+        LLM_BUDGET_EXCEEDED.inc(scope="daily")
+        log.warning("💸 Presupuesto diario de tokens superado (%s > %s)", day_stats["all"]["total_tokens"], LLM_DAILY_TOKEN_BUDGET)
+
+    if conversation_id:
+        conv = _by_conversation.pop(conversation_id, None) or {
+            "totals": _empty_totals(), "by_purpose": defaultdict(_empty_totals), "alarmed": False,
+        }
+        _by_conversation[conversation_id] = conv
+        while len(_by_conversation) > _MAX_CONVERSATIONS:
+            _by_conversation.popitem(last=False)
+        _add(conv["totals"], prompt, completion, total, latency, cost)
+        _add(conv["by_purpose"][purpose], prompt, completion, total, latency, cost)
+        conv["last_call"] = time.time()
+        if LLM_CONVERSATION_TOKEN_BUDGET and not conv["alarmed"] and conv["totals"]["total_tokens"] > LLM_CONVERSATION_TOKEN_BUDGET:
+            conv["alarmed"] = True
+            LLM_BUDGET_EXCEEDED.inc(scope="conversation")
+            log.warning("💸 Conversación %s superó el presupuesto de tokens (%s > %s)",
+                        conversation_id, conv["totals"]["total_tokens"], LLM_CONVERSATION_TOKEN_BUDGET)
+
+
+def usage_summary(top: int = 20) -> dict:
+    """Consumo por día y propósito, y las conversaciones que más tokens gastan."""
+    conversations = sorted(
+        _by_conversation.items(), key=lambda kv: kv[1]["totals"]["total_tokens"], reverse=True
+    )[:top]
+    return {
+        "budgets": {"daily_tokens": LLM_DAILY_TOKEN_BUDGET, "conversation_tokens": LLM_CONVERSATION_TOKEN_BUDGET},
+        "days": {day: dict(stats) for day, stats in _by_day.items()},
+        "top_conversations": [
+            {"conversation_id": cid, **conv["totals"], "last_call": conv.get("last_call")}
+            for cid, conv in conversations
+        ],
+    }
+
+
+def conversation_usage(conversation_id: str) -> Optional[dict]:
+    conv = _by_conversation.get(conversation_id)
+    if conv is None:
+        return None
+    return {
+        "conversation_id": conversation_id,
+        "totals": conv["totals"],
+        "by_purpose": dict(conv["by_purpose"]),
+        "last_call": conv.get("last_call"),
+    }
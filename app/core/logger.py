@@ -0,0 +1,146 @@
+# app/core/logger.py
+"""
+Logging estructurado (una línea JSON por evento) que no bloquea el event loop.
+
+- El código llama `log = get_logger("conversation")` y `log.info("...", valor)`.
+- Los registros se encolan (QueueHandler) con el mensaje ya armado y un hilo
+  aparte los formatea, redacta y escribe en stdout (QueueListener).
+- Redacción: números de teléfono (se dejan los últimos 4 dígitos), tokens Bearer,
+  `key=`/`access_token=` en URLs y los secretos configurados.
+- Truncado: mensajes de más de LOG_MAX_CHARS caracteres se recortan.
+- Muestreo por categoría para niveles < WARNING: LOG_SAMPLE_RATES="webhook=0.1,gemini=0.5".
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+
+from app.core.config import (
+    LOG_LEVEL,
+    LOG_MAX_CHARS,
+    LOG_SAMPLE_RATES,
+    WHATSAPP_TOKEN,
+    GOOGLE_API_KEY,
+    SUPABASE_KEY,
+)
+
+ROOT_LOGGER = "chatbot"
+
+_PHONE_RE = re.compile(r"(?<![\w-])\+?\d{7,11}(\d{4})(?![\w-])")
+_TOKEN_RES = [
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9._\-]+"), r"\1[REDACTED]"),
+    (re.compile(r"((?:key|access_token|apikey)=)[^&\s'\"]+", re.IGNORECASE), r"\1[REDACTED]"),
+    (re.compile(r"\bAIza[0-9A-Za-z_\-]{20,}"), "[REDACTED]"),
+    (re.compile(r"\bEAA[0-9A-Za-z]{20,}"), "[REDACTED]"),
+]
+_SECRETS = [s for s in (WHATSAPP_TOKEN, GOOGLE_API_KEY, SUPABASE_KEY) if s and len(s) >= 8]
+
+
+def add_secrets(secrets) -> None:
+    """Agrega credenciales (ej. las de cada tienda) a las que se ocultan en los logs."""
+    for secret in secrets:
+        if secret and len(secret) >= 8 and secret not in _SECRETS:
+            _SECRETS.append(secret)
+
+
+def redact(text: str) -> str:
+    for secret in _SECRETS:
+        text = text.replace(secret, "[REDACTED]")
+    for pattern, replacement in _TOKEN_RES:
+        text = pattern.sub(replacement, text)
+    return _PHONE_RE.sub(r"***\1", text)
+
+
+def _parse_sample_rates(raw: str) -> dict:
+    rates = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            category, _, rate = part.partition("=")
+            try:
+                rates[f"{ROOT_LOGGER}.{category.strip()}"] = float(rate)
+            except ValueError:
+                pass
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Descarta al azar registros de bajo nivel según la tasa de su categoría."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatea, trunca y redacta en el hilo del listener (fuera del event loop)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        # Redactar antes de truncar para no dejar medio secreto al final del corte
+        message = redact(message)
+        if len(message) > LOG_MAX_CHARS:
+            message = message[:LOG_MAX_CHARS] + f"… [{len(message) - LOG_MAX_CHARS} chars truncated]"
+        return json.dumps({
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "category": record.name[len(ROOT_LOGGER) + 1:] or ROOT_LOGGER,
+            "msg": message,
+        }, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Como QueueHandler, fija `msg % args` al encolar (un argumento que se mute
+    después no cambia lo que se loguea), pero deja la traza de la excepción, la
+    redacción y el JSON para el hilo del listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener = None
+
+
+def configure_logging() -> None:
+    """Instala la cola y el hilo escritor (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    handler = _DeferredQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(_parse_sample_rates(LOG_SAMPLE_RATES)))
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL.upper())
+    root.propagate = False
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Logger de una categoría (webhook, conversation, gemini, whatsapp, supabase, ...)."""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
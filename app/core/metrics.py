@@ -0,0 +1,156 @@
+# app/core/metrics.py
+"""
+Instrumentación: duración por etapa y resultado, expuesta en formato Prometheus.
+
+Uso:
+    with span("conversation.sales_llm"):
+        ...
+    with span("client.whatsapp") as s:
+        ...
+        s.outcome = "http_error"   # resultado distinto de ok/error sin lanzar excepción
+
+Si OTEL_EXPORTER_OTLP_ENDPOINT está definido y el paquete `opentelemetry` está
+instalado, cada span también se exporta por OTLP (p.ej. a un collector local).
+"""
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Tuple
+
+from app.core.config import OTEL_EXPORTER_OTLP_ENDPOINT, OTEL_SERVICE_NAME
+from app.core.logger import get_logger
+
+log = get_logger("metrics")
+
+# Límites de los buckets en segundos (de 5 ms a 30 s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels_text(self.labels, key)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = tuple(buckets)
+        # clave de labels -> [conteo por bucket..., conteo total, suma]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, le)} {cumulative}")
+            count = cumulative + series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.labels, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, key)} {count}")
+        return "\n".join(lines)
+
+
+_registry: list = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render_prometheus() -> str:
+    """Todas las métricas registradas en formato de exposición de Prometheus."""
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+STAGE_DURATION = register(Histogram(
+    "chatbot_stage_duration_seconds",
+    "Duración de cada etapa del manejo de mensajes y de cada llamada saliente",
+    labels=("stage", "outcome"),
+))
+
+
+# --- OpenTelemetry (opcional) ---
+
+def _init_tracer():
+    if not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        log.warning("⚠️ OTEL_EXPORTER_OTLP_ENDPOINT definido pero opentelemetry no está instalado")
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    # El exportador lee OTEL_EXPORTER_OTLP_ENDPOINT del entorno
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("chatbot")
+
+
+_tracer = _init_tracer()
+
+
+class Span:
+    __slots__ = ("stage", "outcome")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.outcome = "ok"
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Mide la duración del bloque y la registra con su resultado (ok/error/cancelled)."""
+    current = Span(stage)
+    otel_span = _tracer.start_as_current_span(stage, attributes=attributes) if _tracer else nullcontext()
+    start = time.perf_counter()
+    with otel_span:
+        try:
+            yield current
+        except asyncio.CancelledError:
+            current.outcome = "cancelled"
+            raise
+        except BaseException:
+            current.outcome = "error"
+            raise
+        finally:
+            STAGE_DURATION.observe(time.perf_counter() - start, stage=stage, outcome=current.outcome)
@@ -0,0 +1,144 @@
+# app/core/profiling.py
+"""
+Profiler por muestreo, opcional, para requests en producción.
+
+`ProfilingMiddleware` perfila una fracción PROFILE_SAMPLE_RATE de los requests, o
+cualquier request con `X-Profile: 1` y un `X-Admin-Token` válido. Mientras dura
+el request, un hilo toma cada PROFILE_INTERVAL_SECONDS la pila del hilo del
+event loop (`sys._current_frames`) y cuenta las pilas repetidas; no instrumenta
+cada llamada, así que el costo es bajo y acotado.
+
+Los últimos PROFILE_BUFFER_SIZE perfiles quedan en un buffer circular y se sirven
+en formato "folded" (una pila por línea: `raíz;...;hoja N`), que aceptan
+flamegraph.pl, speedscope e inferno. Como el loop es compartido, las muestras
+pueden incluir trabajo de otros requests concurrentes.
+"""
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+from app.core.config import (
+    ADMIN_TOKEN,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_INTERVAL_SECONDS,
+    PROFILE_BUFFER_SIZE,
+)
+
+_MAX_DEPTH = 128
+
+_profiles: deque = deque(maxlen=PROFILE_BUFFER_SIZE)
+_ids = itertools.count(1)
+# Un solo perfil a la vez: acota el overhead aunque lleguen muchos requests muestreados
+_busy = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Muestrea la pila de un hilo desde un hilo aparte."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None and len(labels) < _MAX_DEPTH:
+                if frame.f_code.co_filename != __file__:
+                    labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+                self.samples += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def list_profiles() -> List[dict]:
+    return [{k: v for k, v in p.items() if k != "stacks"} for p in reversed(_profiles)]
+
+
+def get_profile(profile_id: int) -> Optional[dict]:
+    for p in _profiles:
+        if p["id"] == profile_id:
+            return p
+    return None
+
+
+def folded(profile: dict) -> str:
+    """Pilas en formato folded/collapsed para generar un flame graph."""
+    return "\n".join(f"{stack} {count}" for stack, count in profile["stacks"].most_common()) + "\n"
+
+
+def _should_profile(headers: Dict[str, str]) -> bool:
+    if headers.get("x-profile") == "1" and ADMIN_TOKEN:
+        token = headers.get("x-admin-token") or ""
+        if hmac.compare_digest(token, ADMIN_TOKEN):
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila los requests elegidos y guarda el resultado."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        if not _should_profile(headers) or not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(threading.get_ident())
+        status = {"code": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started_at = time.time()
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            _busy.release()
+            _profiles.append({
+                "id": next(_ids),
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "status": status["code"],
+                "started_at": started_at,
+                "duration_seconds": time.perf_counter() - start,
+                "samples": profiler.samples,
+                "interval_seconds": profiler.interval,
+                "stacks": profiler.stacks,
+            })
@@ -0,0 +1,128 @@
+# app/core/responses.py
+"""
+Serialización JSON rápida (orjson) y compresión gzip/brotli de respuestas.
+
+- `CompressionMiddleware` comprime las respuestas de más de COMPRESSION_MIN_SIZE
+  bytes según `Accept-Encoding` (br si el cliente lo acepta, si no gzip). Deja
+  pasar sin tocar las respuestas en streaming y las que ya traen Content-Encoding.
+- `EncodedBody` guarda un JSON ya serializado y sus versiones comprimidas, para
+  reutilizarlas entre requests (ej. el catálogo en caché).
+"""
+import gzip
+from typing import Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.core.config import COMPRESSION_MIN_SIZE
+
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+
+
+def dumps(content) -> bytes:
+    """JSON en bytes con orjson (datetime, uuid y dataclasses incluidos)."""
+    return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """'br', 'gzip' o None según lo que acepte el cliente."""
+    if not accept_encoding:
+        return None
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        import brotli  # se importa al primer uso: no pesa en el arranque en frío
+        return brotli.compress(body, quality=_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=_GZIP_LEVEL)
+
+
+class EncodedBody:
+    """JSON serializado una vez, con sus variantes comprimidas calculadas a demanda."""
+
+    def __init__(self, content):
+        self.body = dumps(content)
+        self._compressed: Dict[str, bytes] = {}
+
+    def response(self, request: Request, headers: Optional[dict] = None) -> Response:
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept-Encoding"
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        if encoding is None or len(self.body) < COMPRESSION_MIN_SIZE:
+            return Response(content=self.body, media_type="application/json", headers=headers)
+        if encoding not in self._compressed:
+            self._compressed[encoding] = compress(self.body, encoding)
+        headers["Content-Encoding"] = encoding
+        return Response(content=self._compressed[encoding], media_type="application/json", headers=headers)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI de compresión gzip/brotli por encima de un tamaño mínimo."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        encoding = choose_encoding(request_headers.get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = {k.decode("latin-1").lower() for k, _ in message.get("headers", [])}
+                if "content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streaming o respuesta pequeña: se envía tal cual
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            headers = [
+                (k, v) for k, v in start_message.get("headers", [])
+                if k.decode("latin-1").lower() != "content-length"
+            ]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start_message, "headers": headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
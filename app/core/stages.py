@@ -0,0 +1,79 @@
+# app/core/stages.py
+"""
+Etapas async con dependencias, ejecutadas en un `asyncio.TaskGroup`.
+
+Cada etapa arranca apenas terminan las que declara en `after` (recibe sus
+resultados como argumentos con el mismo nombre), así que las independientes
+corren a la vez y el tiempo total es el de la ruta más larga.
+
+    graph = StageGraph("conversation")
+    graph.add("catalog", get_catalog, timeout=8, fallback=lambda e: None)
+    graph.add("persist", lambda: save_message(...), timeout=5, fallback=lambda e: None)
+    graph.add("reply", lambda catalog: reply(catalog), after=("catalog",))
+    results = await graph.run()
+
+- `timeout`: segundos para la etapa (cuenta desde que arranca, no la espera de
+  sus dependencias); al vencer se cancela y lanza TimeoutError.
+- `fallback(exc)`: si la etapa falla o vence, su resultado pasa a ser lo que
+  devuelva `fallback` y las demás siguen. Sin `fallback` la etapa es
+  obligatoria: su error cancela las que sigan corriendo y `run()` lo relanza tal
+  cual (no como ExceptionGroup).
+
+Cada etapa se mide con `span("<grafo>.<etapa>")`.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from app.core.logger import get_logger
+from app.core.metrics import span
+
+log = get_logger("stages")
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable[..., Awaitable[Any]], after: tuple,
+                 timeout: Optional[float], fallback: Optional[Callable[[BaseException], Any]]):
+        self.name, self.fn, self.after, self.timeout, self.fallback = name, fn, after, timeout, fallback
+
+
+class StageGraph:
+    def __init__(self, name: str):
+        self.name = name
+        self._stages: Dict[str, _Stage] = {}
+
+    def add(self, name: str, fn: Callable[..., Awaitable[Any]], after: Iterable[str] = (),
+            timeout: Optional[float] = None, fallback: Optional[Callable[[BaseException], Any]] = None) -> "StageGraph":
+        after = tuple(after)
+        missing = [dep for dep in after if dep not in self._stages]
+        if name in self._stages or missing:
+            # Las dependencias se declaran antes: así el grafo no puede tener ciclos
+            raise ValueError(f"Etapa repetida o dependencias desconocidas en {self.name}.{name}: {missing}")
+        self._stages[name] = _Stage(name, fn, after, timeout, fallback)
+        return self
+
+    async def _run_stage(self, stage: _Stage, tasks: Dict[str, asyncio.Task]) -> Any:
+        kwargs = {dep: await tasks[dep] for dep in stage.after}
+        with span(f"{self.name}.{stage.name}") as s:
+            try:
+                if stage.timeout is None:
+                    return await stage.fn(**kwargs)
+                async with asyncio.timeout(stage.timeout):
+                    return await stage.fn(**kwargs)
+            except Exception as e:
+                if stage.fallback is None:
+                    raise
+                s.outcome = "timeout" if isinstance(e, TimeoutError) else "fallback"
+                log.warning("⚠️ Etapa %s.%s falló (%s); se sigue sin ella", self.name, stage.name,
+                            "timeout" if isinstance(e, TimeoutError) else e)
+                return stage.fallback(e)
+
+    async def run(self) -> Dict[str, Any]:
+        tasks: Dict[str, asyncio.Task] = {}
+        try:
+            async with asyncio.TaskGroup() as group:
+                for stage in self._stages.values():
+                    tasks[stage.name] = group.create_task(self._run_stage(stage, tasks), name=f"{self.name}.{stage.name}")
+        except BaseExceptionGroup as eg:
+            # La primera falla es la causa; las demás suelen ser dependientes que vieron el mismo error
+            raise eg.exceptions[0]
+        return {name: task.result() for name, task in tasks.items()}
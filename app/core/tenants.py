@@ -0,0 +1,259 @@
+# app/core/tenants.py
+"""
+Varias tiendas (tenants) en un mismo despliegue.
+
+Cada tienda tiene su número de WhatsApp Business y se reconoce por el
+`metadata.phone_number_id` del webhook. Las credenciales (WhatsApp, Supabase,
+Gemini), la persona del vendedor, el costo de envío, el formato del catálogo y
+el presupuesto de memoria son por tienda; el catálogo, la analítica y el estado
+de conversación se guardan aparte para cada una.
+
+Las tiendas se definen en TENANTS_CONFIG (ruta a un JSON o el JSON en línea):
+
+    [
+      {"id": "roble", "phone_number_id": "1234", "whatsapp_token": "...",
+       "supabase_url": "https://x.supabase.co", "supabase_key": "...",
+       "store_name": "licores el roble", "shipping_cost": 5000},
+      {"id": "andina", "phone_number_id": "5678", ...}
+    ]
+
+Con más de una tienda, cada una debe traer sus propios `phone_number_id`,
+`whatsapp_token`, `supabase_url` y `supabase_key`: las tablas (products, orders,
+messages) no tienen columna de tienda, así que dos tiendas con el mismo proyecto
+de Supabase mezclarían catálogo, pedidos y analítica. Los demás campos que falten
+toman el valor de las variables de entorno de siempre (GOOGLE_API_KEY,
+SHIPPING_COST...). Sin TENANTS_CONFIG hay una sola tienda, "default", que usa
+esas variables y guarda el estado con las mismas claves que antes.
+
+La tienda del request en curso se guarda en un ContextVar: `use_tenant(t)` la
+fija (el webhook, `TenantMiddleware` para los demás endpoints) y
+`current_tenant()` la lee desde cualquier servicio; las tareas creadas con
+`asyncio.create_task` la heredan.
+"""
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import (
+    TENANTS_CONFIG,
+    TENANT_MAX_SESSIONS,
+    WHATSAPP_TOKEN,
+    WHATSAPP_PHONE_NUMBER_ID,
+    GOOGLE_API_KEY,
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    SHIPPING_COST,
+    PROMPT_CATALOG_FORMAT,
+    CATALOG_SNAPSHOT_PATH,
+    CATALOG_BUNDLED_SNAPSHOT_PATH,
+)
+from app.core.logger import get_logger, add_secrets
+
+log = get_logger("tenants")
+
+DEFAULT_TENANT_ID = "default"
+DEFAULT_STORE_NAME = "licores el roble"
+DEFAULT_PERSONA_PROMPT = (
+    "Eres un vendedor de una licorera llamada {store_name}, "
+    "Respuestas hamanas y cortas y si alguien te pregunta por algun licor respondes como experto"
+)
+DEFAULT_ASSISTANT_NAME = "Vendebot 🤖"
+# Cabecera con la que los endpoints de administración eligen la tienda
+TENANT_HEADER = "x-tenant-id"
+
+
+def _tenant_snapshot_path(tenant_id: str) -> str:
+    if not CATALOG_SNAPSHOT_PATH:
+        return ""
+    root, ext = os.path.splitext(CATALOG_SNAPSHOT_PATH)
+    return f"{root}.{tenant_id}{ext or '.json'}"
+
+
+class Tenant:
+    """Configuración de una tienda. `key_prefix` separa su estado del de las demás."""
+
+    def __init__(self, config: dict, legacy: bool = False):
+        self.id = str(config.get("id") or DEFAULT_TENANT_ID)
+        self.phone_number_id = str(config.get("phone_number_id") or WHATSAPP_PHONE_NUMBER_ID or "")
+        self.whatsapp_token = config.get("whatsapp_token") or WHATSAPP_TOKEN
+        self.google_api_key = config.get("google_api_key") or GOOGLE_API_KEY
+        self.supabase_url = config.get("supabase_url") or SUPABASE_URL
+        self.supabase_key = config.get("supabase_key") or SUPABASE_KEY
+        self.store_name = config.get("store_name") or DEFAULT_STORE_NAME
+        self.assistant_name = config.get("assistant_name") or DEFAULT_ASSISTANT_NAME
+        self.persona_prompt = (config.get("persona_prompt") or DEFAULT_PERSONA_PROMPT).format(store_name=self.store_name)
+        self.shipping_cost = float(config.get("shipping_cost", SHIPPING_COST))
+        self.catalog_format = config.get("catalog_format") or PROMPT_CATALOG_FORMAT
+        # Presupuesto de memoria: conversaciones (teléfonos) que se guardan a la vez (0 = sin límite)
+        self.max_sessions = int(config.get("max_sessions", TENANT_MAX_SESSIONS))
+        # La tienda única de siempre conserva rutas y claves sin prefijo
+        self.key_prefix = "" if legacy else f"{self.id}:"
+        self.catalog_snapshot_path = config.get(
+            "catalog_snapshot_path", CATALOG_SNAPSHOT_PATH if legacy else _tenant_snapshot_path(self.id)
+        )
+        self.catalog_bundled_snapshot_path = config.get(
+            "catalog_bundled_snapshot_path", CATALOG_BUNDLED_SNAPSHOT_PATH if legacy else ""
+        )
+        self.supabase_headers = {
+            "apikey": self.supabase_key,
+            "Authorization": f"Bearer {self.supabase_key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=representation",
+        }
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.id!r}, phone_number_id={self.phone_number_id!r})"
+
+
+def _read_config(raw: str) -> List[dict]:
+    raw = (raw or "").strip()
+    if not raw:
+        return []
+    if not raw.startswith(("[", "{")):
+        with open(raw, encoding="utf-8") as f:
+            raw = f.read()
+    data = json.loads(raw)
+    return data.get("tenants", []) if isinstance(data, dict) else data
+
+
+# Lo que no puede compartirse entre tiendas (ni tomarse de las variables globales)
+_PER_TENANT_FIELDS = ("phone_number_id", "whatsapp_token", "supabase_url", "supabase_key")
+
+
+def _load_tenants(raw: str) -> Dict[str, Tenant]:
+    configs = _read_config(raw)
+    if not configs:
+        return {DEFAULT_TENANT_ID: Tenant({}, legacy=True)}
+    tenants: Dict[str, Tenant] = {}
+    by_phone: Dict[str, str] = {}
+    for config in configs:
+        if len(configs) > 1:
+            missing = [field for field in _PER_TENANT_FIELDS if not config.get(field)]
+            if missing:
+                raise ValueError(f"Tenant {config.get('id')!r} sin {', '.join(missing)} en TENANTS_CONFIG")
+        tenant = Tenant(config)
+        if tenant.id in tenants:
+            raise ValueError(f"Tenant repetido en TENANTS_CONFIG: {tenant.id}")
+        # El webhook elige la tienda por phone_number_id: repetido, una de las dos nunca recibiría mensajes
+        other = by_phone.setdefault(tenant.phone_number_id, tenant.id)
+        if tenant.phone_number_id and other != tenant.id:
+            raise ValueError(f"Los tenants {other} y {tenant.id} comparten phone_number_id en TENANTS_CONFIG")
+        tenants[tenant.id] = tenant
+    if len(tenants) > 1:
+        # Un mismo token de WhatsApp puede servir a varios números; un mismo proyecto de Supabase no
+        by_project: Dict[str, str] = {}
+        for tenant in tenants.values():
+            other = by_project.setdefault(tenant.supabase_url.rstrip("/"), tenant.id)
+            if other != tenant.id:
+                raise ValueError(f"Los tenants {other} y {tenant.id} comparten supabase_url en TENANTS_CONFIG")
+    return tenants
+
+
+_tenants = _load_tenants(TENANTS_CONFIG)
+_by_phone_number_id = {t.phone_number_id: t for t in _tenants.values() if t.phone_number_id}
+# La primera tienda del archivo atiende los requests que no indican cuál
+_default = next(iter(_tenants.values()))
+_current: ContextVar[Optional[Tenant]] = ContextVar("tenant", default=None)
+
+add_secrets(s for t in _tenants.values() for s in (t.whatsapp_token, t.google_api_key, t.supabase_key))
+if len(_tenants) > 1:
+    log.info("🏬 %s tiendas configuradas: %s", len(_tenants), ", ".join(_tenants))
+
+
+def all_tenants() -> List[Tenant]:
+    return list(_tenants.values())
+
+
+def get_tenant(tenant_id: str) -> Optional[Tenant]:
+    return _tenants.get(tenant_id)
+
+
+def default_tenant() -> Tenant:
+    return _default
+
+
+def current_tenant() -> Tenant:
+    """Tienda del request/tarea en curso (la predeterminada si nadie la fijó)."""
+    return _current.get() or _default
+
+
+@contextmanager
+def use_tenant(tenant: Tenant):
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+def tenant_for_change(value: dict) -> Optional[Tenant]:
+    """
+    Tienda dueña del número de un cambio del webhook (`value.metadata.phone_number_id`).
+    Con una sola tienda configurada siempre es esa; con varias, None si el número
+    no corresponde a ninguna.
+    """
+    if len(_tenants) == 1:
+        return _default
+    metadata = (value or {}).get("metadata") or {}
+    return _by_phone_number_id.get(str(metadata.get("phone_number_id") or ""))
+
+
+def split_webhook_by_tenant(body: dict) -> List[Tuple[Optional[Tenant], dict]]:
+    """
+    Un webhook puede agrupar cambios de varios números (una entrada por cuenta y
+    varios `changes` en cada una). Devuelve, por tienda, un webhook con la misma
+    forma y sólo sus cambios; los de números sin tienda quedan bajo None.
+    """
+    groups: Dict[Optional[str], Tuple[Optional[Tenant], dict]] = {}
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            tenant = tenant_for_change(change.get("value") if isinstance(change, dict) else None)
+            key = tenant.id if tenant else None
+            if key not in groups:
+                groups[key] = (tenant, {**body, "entry": []})
+            entries = groups[key][1]["entry"]
+            if not entries or entries[-1].get("id") != entry.get("id"):
+                entries.append({**entry, "changes": []})
+            entries[-1]["changes"].append(change)
+    return list(groups.values())
+
+
+# Atajos para los clientes de Supabase
+
+def supabase_url() -> str:
+    return current_tenant().supabase_url
+
+
+def supabase_headers() -> dict:
+    return current_tenant().supabase_headers
+
+
+class TenantMiddleware:
+    """
+    Middleware ASGI: fija la tienda de cada request según la cabecera X-Tenant-Id
+    (sin cabecera, la predeterminada). El webhook la vuelve a fijar según el número
+    de destino del mensaje.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        tenant_id = next(
+            (v.decode("latin-1") for k, v in scope.get("headers") or [] if k.decode("latin-1").lower() == TENANT_HEADER),
+            None,
+        )
+        tenant = get_tenant(tenant_id) if tenant_id else _default
+        if tenant is None:
+            body = json.dumps({"detail": f"Tienda desconocida: {tenant_id}"}).encode()
+            await send({"type": "http.response.start", "status": 404,
+                        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        with use_tenant(tenant):
+            await self.app(scope, receive, send)
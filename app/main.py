@@ -1,13 +1,85 @@
 # app/main.py
+import asyncio
+import contextlib
+import sys
+from contextlib import asynccontextmanager
+from typing import Optional
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-from app.routes import webhook
-from app.routes import products
-from app.routes import orders    # 👈 Nuevo import
+from app.core.responses import CompressionMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core.lazy_routers import LazyRouterMiddleware
+from app.core.tenants import TenantMiddleware
 
-app = FastAPI()
+
+async def _stop(task: Optional[asyncio.Task]) -> None:
+    if task is not None:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.core.config import CAMPAIGN_BACKGROUND_SENDING
+    from app.clients.http import close_http_client
+    from app.services.analytics import run_reconciliation_loop
+
+    # Sincroniza la analítica ya cargada con los pedidos de otros workers (la primera carga
+    # la hace la primera consulta, no el arranque)
+    analytics_task = asyncio.create_task(run_reconciliation_loop())
+    # En un proceso de larga vida se retoman solas las campañas cuyo worker murió; en serverless
+    # lo hace el cron de /campaigns/tick
+    campaign_resume_task = None
+    if CAMPAIGN_BACKGROUND_SENDING:
+        from app.services.campaigns import run_resume_loop
+
+        campaign_resume_task = asyncio.create_task(run_resume_loop())
+    try:
+        yield
+    finally:
+        await _stop(analytics_task)
+        await _stop(campaign_resume_task)
+        # Las campañas en curso terminan su lote y guardan resultados (sólo si se usaron)
+        if "app.services.campaigns" in sys.modules:
+            await sys.modules["app.services.campaigns"].stop_all_campaigns()
+        # Mensajes entrantes que aún se están guardando
+        if "app.services.conversation" in sys.modules:
+            await sys.modules["app.services.conversation"].drain_inbound_saves()
+        # Estados de entrega que aún no se escribieron en Supabase
+        if "app.services.delivery_status" in sys.modules:
+            await sys.modules["app.services.delivery_status"].stop_flusher()
+        await close_http_client()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Los routers se importan con el primer request a su prefijo (arranque en frío más corto en Vercel)
+app.add_middleware(
+    LazyRouterMiddleware,
+    target=app,
+    routers={
+        "/webhook": "app.routes.webhook",
+        "/products": "app.routes.products",
+        "/orders": "app.routes.orders",
+        "/analytics": "app.routes.analytics",
+        "/metrics": "app.routes.metrics",
+        "/admin": "app.routes.admin",
+        "/campaigns": "app.routes.campaigns",
+    },
+)
+
+# Tienda de cada request (cabecera X-Tenant-Id); el webhook la toma del número de destino
+app.add_middleware(TenantMiddleware)
+
+# Comprime (br/gzip) las respuestas grandes: catálogo y órdenes son JSON muy repetitivo
+app.add_middleware(CompressionMiddleware)
+
+# Perfila por muestreo los requests elegidos (PROFILE_SAMPLE_RATE o cabecera X-Profile); ver /admin/profiles
+app.add_middleware(ProfilingMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,10 +89,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(webhook.router)
-app.include_router(products.router)
-app.include_router(orders.router)    # 👈 Registramos el router de órdenes
-
 @app.get("/")
 def root():
     return {"status": "ok"}
@@ -0,0 +1,55 @@
+# app/routes/admin.py
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import ADMIN_TOKEN
+from app.core.llm_usage import usage_summary, conversation_usage
+from app.core.tenants import current_tenant
+from app.core.profiling import list_profiles, get_profile, folded
+from app.services.delivery_status import delivery_summary, delivery_state
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Protege /admin con la cabecera X-Admin-Token (deshabilitado si ADMIN_TOKEN no está definido)."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints disabled (ADMIN_TOKEN not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/llm-usage", summary="LLM token usage per day, purpose and conversation")
+async def llm_usage(top: int = 20):
+    return usage_summary(top)
+
+@router.get("/llm-usage/{conversation_id}", summary="LLM token usage of one conversation")
+async def llm_usage_for_conversation(conversation_id: str):
+    usage = conversation_usage(current_tenant().key_prefix + conversation_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No LLM calls recorded for this conversation")
+    return usage
+
+@router.get("/delivery", summary="Delivery status counters and failures by WhatsApp error code")
+async def delivery():
+    return delivery_summary()
+
+@router.get("/delivery/{message_id}", summary="Last known delivery status of one sent message")
+async def delivery_for_message(message_id: str):
+    state = delivery_state(message_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="No status recorded for this message in this process")
+    return state
+
+@router.get("/profiles", summary="Recent request profiles (metadata)")
+async def profiles():
+    return list_profiles()
+
+@router.get("/profiles/{profile_id}", summary="One profile as folded stacks (flame graph input)", response_class=PlainTextResponse)
+async def profile_folded(profile_id: int):
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (may have been evicted)")
+    return PlainTextResponse(folded(profile))
@@ -0,0 +1,21 @@
+# app/routes/analytics.py
+from fastapi import APIRouter, HTTPException
+
+from app.services.analytics import load_sales_analytics, reconcile_analytics
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+@router.get("/", summary="Sales analytics (precomputed)")
+async def sales_summary():
+    """Ingresos por día, productos más vendidos, ticket promedio y métodos de pago."""
+    try:
+        return (await load_sales_analytics()).snapshot()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading analytics: {e}")
+
+@router.post("/reconcile", summary="Recompute analytics from Supabase")
+async def reconcile():
+    try:
+        return await reconcile_analytics()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reconciling analytics: {e}")
@@ -0,0 +1,96 @@
+# app/routes/campaigns.py
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+
+from app.core.config import CRON_SECRET
+from app.routes.admin import require_admin
+from app.services.delivery_status import flush_statuses
+from app.services.campaigns import (
+    CampaignError,
+    run_due_campaigns,
+    create_campaign,
+    get_campaign,
+    list_campaigns,
+    list_recipients,
+    start_campaign,
+    pause_campaign,
+    cancel_campaign,
+)
+
+router = APIRouter(prefix="/campaigns", tags=["campaigns"])
+admin = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def require_cron_or_admin(authorization: str = Header(None), x_admin_token: str = Header(None)):
+    """El cron de Vercel manda `Authorization: Bearer $CRON_SECRET`; a mano vale X-Admin-Token."""
+    if CRON_SECRET and authorization and hmac.compare_digest(authorization, f"Bearer {CRON_SECRET}"):
+        return
+    require_admin(x_admin_token)
+
+
+@router.api_route("/tick", methods=["GET", "POST"], dependencies=[Depends(require_cron_or_admin)],
+                  summary="Send pending campaigns without a live worker for a while (cron)")
+async def tick():
+    claimed = await run_due_campaigns()
+    # Estados de entrega que un webhook no alcanzó a escribir en esta instancia (serverless)
+    statuses = await flush_statuses()
+    return {"claimed": claimed, "statuses_flushed": statuses}
+
+
+@admin.post("/", summary="Create a broadcast campaign (and start it unless start=false)")
+async def create(spec: dict = Body(...), start: bool = Query(True)):
+    """
+    Cuerpo: {"name": ..., "message": {"type": "template", "template": {...}} | {"type": "text", "text": ...},
+    "audience": {"sources": ["orders", "messages"], "since": ..., "phones": [...], "exclude": [...]},
+    "messages_per_second": 20}
+    """
+    try:
+        campaign = await create_campaign(spec)
+        return await start_campaign(campaign["id"]) if start else campaign
+    except CampaignError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@admin.get("/", summary="Recent campaigns with their counters")
+async def list_all(limit: int = Query(50, ge=1, le=500)):
+    return await list_campaigns(limit)
+
+@admin.get("/{campaign_id}", summary="Campaign status and progress")
+async def detail(campaign_id: str):
+    campaign = await get_campaign(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return campaign
+
+@admin.get("/{campaign_id}/recipients", summary="Per-recipient delivery results (cursor in X-Next-Cursor)")
+async def recipients(
+    campaign_id: str,
+    status: Optional[str] = Query(None, description="pending, sending, sent, failed o skipped"),
+    after: Optional[str] = Query(None, description="Cursor: último teléfono de la página anterior"),
+    limit: int = Query(500, ge=1, le=5000),
+):
+    rows, next_cursor = await list_recipients(campaign_id, status, after, limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return ORJSONResponse(rows, headers=headers)
+
+async def _transition(action, campaign_id: str):
+    try:
+        return await action(campaign_id)
+    except CampaignError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@admin.post("/{campaign_id}/start", summary="Start or resume sending")
+async def start(campaign_id: str):
+    return await _transition(start_campaign, campaign_id)
+
+@admin.post("/{campaign_id}/pause", summary="Pause after the message in flight")
+async def pause(campaign_id: str):
+    return await _transition(pause_campaign, campaign_id)
+
+@admin.post("/{campaign_id}/cancel", summary="Cancel; pending recipients are not sent")
+async def cancel(campaign_id: str):
+    return await _transition(cancel_campaign, campaign_id)
+
+router.include_router(admin)
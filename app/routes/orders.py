@@ -1,29 +1,108 @@
 # app/routes/orders.py
-from fastapi import APIRouter, HTTPException
-from typing import List
+import csv
+import io
+import json
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import AsyncIterator, List, Optional
 
-from app.services.orders import get_all_orders, create_order  # reusa create_order si quieres exponerlo aquí
+from app.core.responses import dumps
+from app.services.orders import list_orders as fetch_orders_page, iter_orders, create_order  # reusa create_order si quieres exponerlo aquí
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
-@router.get("/", summary="List all orders")
-async def list_orders():
+# Columnas del export CSV (products va como JSON)
+EXPORT_COLUMNS = ["id", "created_at", "phone_number", "name", "address", "payment_method", "total", "products"]
+
+# Tamaño de página cuando se pide `cursor` sin `limit`
+DEFAULT_PAGE_SIZE = 100
+
+@router.get("/", summary="List orders (filtered, optionally paginated by cursor)")
+async def list_orders(
+    date_from: Optional[str] = Query(None, description="created_at >= (ISO 8601)"),
+    date_to: Optional[str] = Query(None, description="created_at < (ISO 8601)"),
+    phone: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tamaño de página; sin límite devuelve todo"),
+):
+    """
+    Órdenes más recientes primero. Sin `limit` ni `cursor` devuelve todas (como
+    siempre), enviadas a medida que se leen de Supabase; con alguno de los dos
+    devuelve una página y el cursor de la siguiente va en `X-Next-Cursor`.
+    """
+    if limit is None and cursor is None:
+        rows = iter_orders(date_from, date_to, phone, payment_method)
+        try:
+            # La primera página se pide antes de responder: un error de Supabase sigue siendo un 500
+            first = await anext(rows, None)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error fetching orders: {e}")
+        return StreamingResponse(_json_array(first, rows), media_type="application/json")
     try:
-        return await get_all_orders()
+        rows, next_cursor = await fetch_orders_page(
+            date_from, date_to, phone, payment_method, cursor, limit or DEFAULT_PAGE_SIZE
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching orders: {e}")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return ORJSONResponse(rows, headers=headers)
+
+async def _json_array(first: Optional[dict], rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    if first is None:
+        yield b"[]"
+        return
+    yield b"[" + dumps(first)
+    async for row in rows:
+        yield b"," + dumps(row)
+    yield b"]"
+
+@router.get("/export", summary="Stream filtered orders as NDJSON or CSV")
+async def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    date_from: Optional[str] = Query(None, description="created_at >= (ISO 8601)"),
+    date_to: Optional[str] = Query(None, description="created_at < (ISO 8601)"),
+    phone: Optional[str] = None,
+    payment_method: Optional[str] = None,
+):
+    """Recorre Supabase por páginas y envía fila por fila, sin acumular las órdenes en memoria."""
+    rows = iter_orders(date_from, date_to, phone, payment_method)
+    if format == "csv":
+        return StreamingResponse(
+            _csv_lines(rows),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="orders.csv"'},
+        )
+    return StreamingResponse(_ndjson_lines(rows), media_type="application/x-ndjson")
+
+async def _ndjson_lines(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield dumps(row) + b"\n"
+
+async def _csv_lines(rows: AsyncIterator[dict]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow({**row, "products": json.dumps(row.get("products"), ensure_ascii=False)})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
 
 @router.delete("/{order_id}", summary="Delete an order")
 async def delete_order(order_id: str):
     """
     (Opcional) Borra la orden indicada. Úsalo si alguna vez quieres limpiar ventas antiguas.
     """
-    from app.services.supabase import headers, SUPABASE_URL
+    from app.core.tenants import supabase_url, supabase_headers
     import httpx
 
-    url = f"{SUPABASE_URL}/rest/v1/orders?id=eq.{order_id}"
+    url = f"{supabase_url()}/rest/v1/orders?id=eq.{order_id}"
     async with httpx.AsyncClient() as client:
-        resp = await client.delete(url, headers=headers)
+        resp = await client.delete(url, headers=supabase_headers())
         if resp.status_code in (200, 204):
             return {"message": "Order deleted"}
         raise HTTPException(status_code=resp.status_code, detail=resp.text)
@@ -1,28 +1,85 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Request, Response
+from typing import AsyncIterator, List, Optional
+import asyncio
+import hashlib
 import json
-import io
 import csv
 
+import httpx
+
+from app.core.config import IMAGE_UPLOAD_CONCURRENCY, UPLOAD_CHUNK_SIZE
+
 from app.services.products import (
     create_product,
-    get_all_products,
     get_product_by_id,
-    create_variant,
-    create_variant_image,
+    create_variants_bulk,
+    create_variant_images_bulk,
     delete_product
 )
+from app.services.catalog import get_catalog, invalidate_catalog
 from app.services.supabase import upload_image_to_supabase_storage
+from app.services.product_import import import_products
+from app.core.logger import get_logger
+
+log = get_logger("products")
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 @router.get("/", summary="List all products with variants and images")
-async def list_products():
+async def list_products(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tamaño de página; sin límite devuelve todo"),
+    after: Optional[str] = Query(None, description="Cursor: id del último producto de la página anterior"),
+    fields: Optional[str] = Query(None, description="Columnas del producto separadas por coma, ej: id,name,price"),
+    include: str = Query("variants,images", description="Relaciones a incluir: variants, images (vacío = ninguna)"),
+):
+    """
+    Lista paginada por cursor (orden por id). El cursor de la siguiente página va en
+    la cabecera `X-Next-Cursor`. La respuesta lleva un ETag fuerte derivado de la
+    versión del catálogo y de los parámetros; con `If-None-Match` igual responde 304.
+    """
     try:
-        return await get_all_products()
+        catalog = await get_catalog()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching products: {e}")
 
+    wanted_fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    relations = {r.strip() for r in include.split(",") if r.strip()}
+    params_key = f"{limit}|{after}|{','.join(wanted_fields or [])}|{','.join(sorted(relations))}"
+    etag = '"' + catalog.version + "-" + hashlib.sha256(params_key.encode()).hexdigest()[:12] + '"'
+
+    if etag in _parse_if_none_match(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    page, next_cursor = catalog.page(after, limit)
+    # Serializado y comprimido una sola vez por versión del catálogo y parámetros
+    encoded = catalog.encoded(
+        params_key, lambda: [_project_product(p, wanted_fields, relations) for p in page]
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return encoded.response(request, headers)
+
+
+def _parse_if_none_match(value: Optional[str]) -> set:
+    if not value:
+        return set()
+    return {tag.strip() for tag in value.split(",")}
+
+
+def _project_product(product: dict, wanted_fields: Optional[List[str]], relations: set) -> dict:
+    """Copia del producto con sólo las columnas y relaciones pedidas."""
+    if wanted_fields:
+        projected = {k: product[k] for k in wanted_fields if k in product}
+    else:
+        projected = {k: v for k, v in product.items() if k not in ("product_variants", "product_images")}
+    if "variants" in relations:
+        projected["product_variants"] = product.get("product_variants", [])
+    if "images" in relations:
+        projected["product_images"] = product.get("product_images", [])
+    return projected
+
 @router.get("/{product_id}", summary="Get a single product by ID with variants and images")
 async def get_product(product_id: str):
     try:
@@ -48,14 +105,9 @@ async def add_product(
     if price < 0 or stock < 0:
         raise HTTPException(status_code=400, detail="`price` and `stock` must be non-negative")
 
-    # Upload images -> URLs
-    image_urls: List[str] = []
-    for img in images:
-        data = await img.read()
-        ok, url_or_err = await upload_image_to_supabase_storage(data, img.filename, img.content_type)
-        if not ok:
-            raise HTTPException(status_code=500, detail=f"Image upload failed: {url_or_err}")
-        image_urls.append(url_or_err)
+    # Upload images -> URLs (en streaming y en paralelo, hasta IMAGE_UPLOAD_CONCURRENCY a la vez;
+    # las imágenes ya subidas antes se reconocen por su hash y no se vuelven a subir)
+    image_urls = await _upload_images(images)
 
     # Create product record
     new_product = {"name": name, "description": description, "price": price, "stock": stock}
@@ -65,17 +117,15 @@ async def add_product(
         raise HTTPException(status_code=500, detail=f"Error creating product: {e}")
     prod_id = created.get("id")
 
-    # Save general images
-    for url in image_urls:
-        await create_variant_image({
-            "product_id": prod_id,
-            "variant_id": None,
-            "variant_label": None,
-            "url": url,
-        })
+    # General images (se insertan todas juntas al final)
+    image_records = [
+        {"product_id": prod_id, "variant_id": None, "variant_label": None, "url": url}
+        for url in image_urls
+    ]
 
     # Process variants (allow per-variant price/stock)
-    for idx, variant_str in enumerate(variants):
+    variant_rows, variant_labels = [], []
+    for variant_str in variants:
         try:
             parsed = json.loads(variant_str)
         except json.JSONDecodeError:
@@ -92,39 +142,80 @@ async def add_product(
             variant_price = price
             variant_stock = stock
 
+        variant_rows.append({
+            "product_id": prod_id,
+            "options": options,
+            "price": variant_price,
+            "stock": variant_stock,
+        })
         # Build human label
-        variant_label = ",".join(f"{k}:{v}" for k, v in options.items())
+        variant_labels.append(",".join(f"{k}:{v}" for k, v in options.items()))
 
-        # Create variant record
-        try:
-            var = await create_variant({
-                "product_id": prod_id,
-                "options": options,
-                "price": variant_price,
-                "stock": variant_stock,
-            })
-        except Exception as e:
-            print(f"Warning: failed to create variant: {e}")
-            continue
-        var_id = var.get("id")
-
-        # Optionally attach one of the uploaded images to this variant
-        if idx < len(image_urls) and var_id:
-            await create_variant_image({
+    # Create all variant records in one request
+    created_variants = []
+    try:
+        created_variants = await create_variants_bulk(variant_rows)
+    except Exception as e:
+        log.warning("Warning: failed to create variants: %s", e)
+
+    # Optionally attach one of the uploaded images to each variant
+    for idx, var in enumerate(created_variants):
+        if idx < len(image_urls) and var.get("id"):
+            image_records.append({
                 "product_id": prod_id,
-                "variant_id": var_id,
-                "variant_label": variant_label,
+                "variant_id": var["id"],
+                "variant_label": variant_labels[idx],
                 "url": image_urls[idx],
             })
 
+    try:
+        await create_variant_images_bulk(image_records)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving product images: {e}")
+
+    invalidate_catalog()
     return created
 
+
+async def _iter_upload(upload: UploadFile) -> AsyncIterator[bytes]:
+    """Lee el archivo subido por trozos desde el inicio, sin cargarlo completo en memoria."""
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def _upload_images(images: List[UploadFile]) -> List[str]:
+    """Sube todas las imágenes en paralelo y devuelve sus URLs en el mismo orden."""
+    if not images:
+        return []
+    semaphore = asyncio.Semaphore(IMAGE_UPLOAD_CONCURRENCY)
+
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        async def upload(img: UploadFile):
+            async with semaphore:
+                return await upload_image_to_supabase_storage(
+                    lambda: _iter_upload(img), img.filename, img.content_type, size=img.size, client=client
+                )
+
+        results = await asyncio.gather(*(upload(img) for img in images))
+
+    image_urls: List[str] = []
+    for ok, url_or_err in results:
+        if not ok:
+            raise HTTPException(status_code=500, detail=f"Image upload failed: {url_or_err}")
+        image_urls.append(url_or_err)
+    return image_urls
+
 @router.delete("/{product_id}", summary="Eliminar un producto completo")
 async def remove_product(product_id: str):
     try:
         ok = await delete_product(product_id)
         if not ok:
             raise HTTPException(status_code=404, detail="Producto no encontrado o no eliminado")
+        invalidate_catalog()
         return {"message": "Producto eliminado"}
     except HTTPException:
         raise
@@ -135,71 +226,12 @@ async def remove_product(product_id: str):
 async def bulk_import(
     file: UploadFile = File(...),
     format: str = Form(...),  # 'csv' or 'json'
+    dry_run: bool = Form(False),  # solo validar
+    skip_invalid: bool = Form(False),  # importar las filas válidas aunque haya inválidas
 ):
-    content = await file.read()
-    items = []
+    if format not in ("csv", "json"):
+        raise HTTPException(status_code=400, detail="Format must be 'csv' or 'json'")
     try:
-        if format == 'csv':
-            text = content.decode('utf-8')
-            reader = csv.DictReader(io.StringIO(text))
-            for row in reader:
-                items.append(row)
-        elif format == 'json':
-            items = json.loads(content)
-        else:
-            raise HTTPException(status_code=400, detail="Format must be 'csv' or 'json'")
-    except Exception as e:
+        return await import_products(file.file, format, dry_run=dry_run, skip_invalid=skip_invalid)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
         raise HTTPException(status_code=400, detail=f"Error parsing file: {e}")
-
-    results = []
-    for item in items:
-        # Parse global fields
-        name = item.get('name')
-        description = item.get('description')
-        base_price = float(item.get('price', 0))
-        base_stock = int(item.get('stock', 0))
-        variants_json = item.get('variants') or '[]'
-        image_urls = json.loads(item.get('image_urls', '[]'))
-
-        # Create product
-        prod = await create_product({
-            "name": name,
-            "description": description,
-            "price": base_price,
-            "stock": base_stock
-        })
-        pid = prod.get('id')
-
-        # Base images
-        for url in image_urls:
-            await create_variant_image({
-                "product_id": pid,
-                "variant_id": None,
-                "variant_label": None,
-                "url": url
-            })
-
-        # Variants with overrides
-        for v in json.loads(variants_json):
-            if isinstance(v, dict) and 'options' in v:
-                options = v.get('options') or {}
-                variant_price = float(v.get('price', base_price))
-                variant_stock = int(v.get('stock', base_stock))
-            else:
-                options = v if isinstance(v, dict) else {"option": v}
-                variant_price = base_price
-                variant_stock = base_stock
-
-            variant_label = ",".join(f"{k}:{v}" for k, v in options.items())
-            var = await create_variant({
-                "product_id": pid,
-                "options": options,
-                "price": variant_price,
-                "stock": variant_stock
-            })
-            var_id = var.get('id')
-            # no default images for bulk import variants
-
-        results.append({"product_id": pid, "name": name})
-
-    return {"imported": results}
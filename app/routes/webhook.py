@@ -1,6 +1,14 @@
+import orjson
 from fastapi import APIRouter, Request
 from fastapi.responses import PlainTextResponse
 from app.services.conversation import handle_user_message
+from app.services.delivery_status import webhook_statuses, has_messages, record_statuses, flush_statuses
+from app.core.config import DELIVERY_BACKGROUND_FLUSH
+from app.core.metrics import span
+from app.core.logger import get_logger
+from app.core.tenants import split_webhook_by_tenant, use_tenant
+
+log = get_logger("webhook")
 
 router = APIRouter()
 VERIFY_TOKEN = "gemini-bot-token"
@@ -13,7 +21,33 @@ async def verify_webhook(hub_mode: str = None, hub_challenge: str = None, hub_ve
 
 @router.post("/webhook")
 async def receive_message(request: Request):
-    body = await request.json()
-    print("Mensaje recibido:", body)
-    await handle_user_message(body)
+    with span("webhook.parse"):
+        body = orjson.loads(await request.body())
+    groups = split_webhook_by_tenant(body)
+    for tenant, tenant_body in groups:
+        if tenant is None:
+            # Número que no es de ninguna tienda: se confirma igual para que Meta no reintente
+            log.warning("⚠️ Webhook para un phone_number_id sin tienda configurada. Ignorando.")
+            continue
+        # La mayoría de los webhooks son callbacks de estado (sent/delivered/read/failed):
+        # se agregan en memoria y se responde sin pasar por la conversación
+        statuses = webhook_statuses(tenant_body)
+        if statuses:
+            with span("webhook.statuses"):
+                if record_statuses(statuses, tenant) and not DELIVERY_BACKGROUND_FLUSH:
+                    # Serverless: la instancia se congela al responder, así que se escribe ya
+                    await flush_statuses(tenant)
+        if not has_messages(tenant_body):
+            continue
+        # handle_user_message lee el primer cambio: se le pasa cada cambio con mensajes por separado
+        for entry in tenant_body["entry"]:
+            for change in entry["changes"]:
+                if not (change.get("value") or {}).get("messages"):
+                    continue
+                message_body = {**tenant_body, "entry": [{**entry, "changes": [change]}]}
+                log.debug("Mensaje recibido: %s", message_body)
+                with use_tenant(tenant), span("webhook.handle"):
+                    await handle_user_message(message_body)
+    if groups and all(tenant is None for tenant, _ in groups):
+        return {"status": "ignored"}
     return {"status": "received"}
@@ -0,0 +1,235 @@
+# app/services/analytics.py
+"""
+Agregados de ventas mantenidos en memoria, actualizados en cada pedido guardado.
+
+- `record_order(order)` se llama cada vez que `create_order` o
+  `process_order` crean/actualizan un pedido; si el pedido ya se había contado
+  (actualización dentro de la ventana de 5 minutos) primero se descuenta su
+  aporte anterior.
+- `reconcile_analytics()` recalcula todo desde Supabase. No corre al arrancar:
+  `load_sales_analytics()` lo hace con la primera consulta de la analítica, así
+  que un worker o un arranque en frío que nunca la sirve no recorre `orders`.
+- Después, cada ANALYTICS_RECONCILE_SECONDS, `reconcile_analytics(full=False)`
+  trae sólo los pedidos desde el último visto (keyset por created_at, con un
+  margen de RECENT_ORDER_WINDOW para las actualizaciones); así se suman los que
+  guardaron otros workers. Cada ANALYTICS_FULL_RECONCILE_SECONDS se rehace todo.
+- `get_sales_analytics().snapshot()` devuelve el resumen ya calculado; sólo se rehace
+  cuando cambió algo.
+
+Los agregados son por tienda (la de `current_tenant()`); el ciclo de
+reconciliación recorre las tiendas que ya cargaron la suya.
+"""
+import asyncio
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.core.config import ANALYTICS_RECONCILE_SECONDS, ANALYTICS_FULL_RECONCILE_SECONDS
+from app.core.logger import get_logger
+from app.core.tenants import all_tenants, current_tenant, use_tenant
+
+log = get_logger("analytics")
+
+# Aportes de pedidos recientes que se recuerdan para poder corregir actualizaciones
+_RECENT_ORDERS_KEPT = 2000
+_TOP_PRODUCTS = 10
+
+
+def _created_at(order: dict) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat((order.get("created_at") or "").replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _order_contribution(order: dict) -> dict:
+    """Lo que un pedido suma a los agregados (día, total, método de pago, productos)."""
+    products = {}
+    for item in order.get("products") or []:
+        if not isinstance(item, dict):
+            continue
+        name = item.get("name") or "?"
+        try:
+            quantity = int(item.get("quantity") or 0)
+            price_unit = float(item.get("price_unit") or item.get("price") or 0)
+        except (TypeError, ValueError):
+            quantity, price_unit = 0, 0.0
+        units, revenue = products.get(name, (0, 0.0))
+        products[name] = (units + quantity, revenue + quantity * price_unit)
+    try:
+        total = float(order.get("total") or 0)
+    except (TypeError, ValueError):
+        total = 0.0
+    return {
+        "day": (order.get("created_at") or "")[:10] or "unknown",
+        "total": total,
+        "payment_method": order.get("payment_method") or "unknown",
+        "products": products,
+    }
+
+
+class SalesAnalytics:
+    def __init__(self):
+        self.by_day: Dict[str, dict] = defaultdict(lambda: {"orders": 0, "revenue": 0.0})
+        self.by_product: Dict[str, dict] = defaultdict(lambda: {"units": 0, "revenue": 0.0})
+        self.by_payment_method: Dict[str, int] = defaultdict(int)
+        self.orders = 0
+        self.revenue = 0.0
+        self.updated_at: Optional[float] = None
+        self.reconciled_at: Optional[float] = None
+        self.synced_at: Optional[float] = None
+        # created_at más nuevo visto: desde ahí sigue la sincronización incremental
+        self.latest_order_at: Optional[datetime] = None
+        self._recent: "OrderedDict[str, dict]" = OrderedDict()
+        self._snapshot: Optional[dict] = None
+
+    def _apply(self, c: dict, sign: int) -> None:
+        day = self.by_day[c["day"]]
+        day["orders"] += sign
+        day["revenue"] += sign * c["total"]
+        self.by_payment_method[c["payment_method"]] += sign
+        for name, (units, revenue) in c["products"].items():
+            product = self.by_product[name]
+            product["units"] += sign * units
+            product["revenue"] += sign * revenue
+        self.orders += sign
+        self.revenue += sign * c["total"]
+
+    def record(self, order: Optional[dict], remember: bool = True) -> None:
+        """
+        Suma (o corrige, si ya estaba) un pedido guardado en Supabase.
+        Con `remember=False` no se guarda su aporte (no se esperan más cambios).
+        """
+        if not order or not order.get("id"):
+            return
+        order_id = str(order["id"])
+        previous = self._recent.pop(order_id, None)
+        if previous:
+            self._apply(previous, -1)
+        contribution = _order_contribution(order)
+        self._apply(contribution, +1)
+        if remember:
+            self._remember(order_id, contribution)
+        created_at = _created_at(order)
+        if created_at is not None and (self.latest_order_at is None or created_at > self.latest_order_at):
+            self.latest_order_at = created_at
+        self.updated_at = time.time()
+        self._snapshot = None
+
+    def _remember(self, order_id: str, contribution: dict) -> None:
+        self._recent[order_id] = contribution
+        while len(self._recent) > _RECENT_ORDERS_KEPT:
+            self._recent.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        if self._snapshot is None:
+            top = sorted(self.by_product.items(), key=lambda kv: kv[1]["revenue"], reverse=True)
+            self._snapshot = {
+                "orders": self.orders,
+                "revenue": self.revenue,
+                "average_ticket": self.revenue / self.orders if self.orders else 0.0,
+                "daily": {
+                    day: {**v, "average_ticket": v["revenue"] / v["orders"] if v["orders"] else 0.0}
+                    for day, v in sorted(self.by_day.items())
+                },
+                "top_products": [
+                    {"name": name, **v} for name, v in top[:_TOP_PRODUCTS]
+                ],
+                "payment_methods": dict(self.by_payment_method),
+                "updated_at": self.updated_at,
+                "reconciled_at": self.reconciled_at,
+                "synced_at": self.synced_at,
+            }
+        return self._snapshot
+
+
+# Agregados por tienda
+_analytics: Dict[str, SalesAnalytics] = {}
+# Pedidos guardados mientras corre una reconciliación de la tienda (se reaplican al terminar)
+_recorded_during_reconcile: Dict[str, list] = {}
+
+
+def get_sales_analytics() -> SalesAnalytics:
+    tenant_id = current_tenant().id
+    analytics = _analytics.get(tenant_id)
+    if analytics is None:
+        analytics = _analytics[tenant_id] = SalesAnalytics()
+    return analytics
+
+
+def record_order(order: Optional[dict]) -> None:
+    """Punto de entrada para los servicios de pedidos tras crear/actualizar uno."""
+    get_sales_analytics().record(order)
+    pending = _recorded_during_reconcile.get(current_tenant().id)
+    if pending is not None and order:
+        pending.append(order)
+
+
+async def _sync_recent(analytics: SalesAnalytics) -> None:
+    """Suma los pedidos creados o actualizados desde el último visto."""
+    from app.services.orders import iter_orders, RECENT_ORDER_WINDOW  # evita import circular con orders.py
+
+    since = (analytics.latest_order_at - RECENT_ORDER_WINDOW).isoformat().replace("+00:00", "Z")
+    async for order in iter_orders(date_from=since):
+        analytics.record(order)
+    analytics.synced_at = time.time()
+
+
+async def reconcile_analytics(full: bool = True) -> dict:
+    """
+    Recalcula los agregados de la tienda actual recorriendo todas sus órdenes de
+    Supabase o, con `full=False` y agregados ya cargados, sólo las recientes.
+    """
+    from app.services.orders import iter_orders  # evita import circular con orders.py
+
+    tenant_id = current_tenant().id
+    if tenant_id in _recorded_during_reconcile:
+        return get_sales_analytics().snapshot()  # ya hay una reconciliación en curso
+    current = _analytics.get(tenant_id)
+    if not full and current is not None and current.reconciled_at is not None and current.latest_order_at is not None:
+        await _sync_recent(current)
+        return current.snapshot()
+    pending = _recorded_during_reconcile[tenant_id] = []
+    try:
+        fresh = SalesAnalytics()
+        seen = 0
+        # iter_orders va de la más reciente a la más antigua: sólo se recuerdan las recientes
+        async for order in iter_orders():
+            fresh.record(order, remember=seen < _RECENT_ORDERS_KEPT)
+            seen += 1
+        for order in pending:
+            fresh.record(order)
+    finally:
+        del _recorded_during_reconcile[tenant_id]
+    fresh.reconciled_at = fresh.synced_at = fresh.updated_at = time.time()
+    _analytics[tenant_id] = fresh
+    return fresh.snapshot()
+
+
+async def load_sales_analytics() -> SalesAnalytics:
+    """Agregados de la tienda actual, recorriendo sus órdenes la primera vez que se piden."""
+    if get_sales_analytics().reconciled_at is None:
+        await reconcile_analytics()
+    return get_sales_analytics()
+
+
+async def run_reconciliation_loop() -> None:
+    """
+    Sincronización periódica de las tiendas cuya analítica ya se cargó
+    (ANALYTICS_RECONCILE_SECONDS <= 0 la desactiva).
+    """
+    if ANALYTICS_RECONCILE_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(ANALYTICS_RECONCILE_SECONDS)
+        for tenant in all_tenants():
+            analytics = _analytics.get(tenant.id)
+            if analytics is None or analytics.reconciled_at is None:
+                continue
+            full = time.time() - analytics.reconciled_at >= ANALYTICS_FULL_RECONCILE_SECONDS
+            with use_tenant(tenant):
+                try:
+                    await reconcile_analytics(full=full)
+                except Exception as e:
+                    log.warning("⚠️ Error reconciliando analítica de %s: %s", tenant.id, e)
@@ -0,0 +1,711 @@
+# app/services/campaigns.py
+"""
+Campañas de difusión por WhatsApp con tope de mensajes por segundo.
+
+1. `create_campaign(spec)` arma la audiencia (teléfonos únicos de `orders` y/o de
+   los clientes que escribieron en `messages`), la guarda en `campaign_recipients`
+   como pendiente y crea la fila en `campaigns` (tablas: supabase/campaigns.sql).
+2. `start_campaign(id)` la pasa a `running`. Con CAMPAIGN_BACKGROUND_SENDING la
+   toma con un lease y la envía en una tarea de fondo de este proceso: lotes de
+   destinatarios pendientes, CAMPAIGN_CONCURRENCY envíos en paralelo y como mucho
+   `messages_per_second` mensajes por segundo (cubeta de fichas). El lease se
+   renueva cada CAMPAIGN_LEASE_SECONDS / 3 mientras el worker vive, aunque un lote
+   tarde (reintentos, pausas por 429).
+3. Cada lote se marca `sending` antes de enviarse; sus resultados (wamid o error)
+   y los contadores se escriben juntos al terminarlo.
+4. `run_due_campaigns()` (endpoint /campaigns/tick, llamado por un cron) toma las
+   campañas `running` sin lease o con el lease vencido y envía durante
+   CAMPAIGN_TICK_SECONDS. Así se reanudan solas las de un worker que murió o se
+   apagó, y es la única forma de envío en serverless (Vercel congela las tareas
+   de fondo al responder), donde CAMPAIGN_BACKGROUND_SENDING viene apagado.
+
+Los que quedaron en `sending` porque el worker cayó a mitad de lote no se
+reenvían (quedan `skipped`), para no mandar dos veces la misma promoción.
+
+Además del tope de cada campaña, todas las campañas y workers de un mismo número
+comparten una cubeta en Supabase (CAMPAIGN_NUMBER_MESSAGES_PER_SECOND, RPC
+`take_send_tokens`), así que dos campañas a la vez no duplican el ritmo.
+
+Para no afectar las conversaciones en vivo, las campañas usan su propio pool de
+conexiones HTTP, escriben en Supabase sólo una vez por lote y, si WhatsApp
+responde 429, pausan todos sus envíos antes de reintentar.
+
+Mensaje de la campaña:
+    {"type": "template", "template": {"name": "promo_junio", "language": "es", "components": [...]}}
+    {"type": "text", "text": "Hola {name} ..."}   (sólo llega dentro de la ventana de 24 h)
+`{name}` se reemplaza por el primer nombre del último pedido del cliente; si no hay,
+por `name_fallback` del mensaje (WhatsApp no acepta parámetros de template vacíos,
+así que ahí el valor por defecto es "cliente").
+"""
+import asyncio
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from app.clients.http import get_http_client
+from app.clients.whatsapp import post_whatsapp_payload
+from app.core.config import (
+    CAMPAIGN_MESSAGES_PER_SECOND,
+    CAMPAIGN_CONCURRENCY,
+    CAMPAIGN_BATCH_SIZE,
+    CAMPAIGN_LEASE_SECONDS,
+    CAMPAIGN_DEFAULT_COUNTRY_CODE,
+    CAMPAIGN_NUMBER_MESSAGES_PER_SECOND,
+    CAMPAIGN_BACKGROUND_SENDING,
+    CAMPAIGN_TICK_SECONDS,
+)
+from app.core.logger import get_logger
+from app.core.metrics import Counter, register, span
+from app.core.tenants import Tenant, all_tenants, current_tenant, supabase_url, supabase_headers, use_tenant
+
+log = get_logger("campaigns")
+
+CAMPAIGN_MESSAGES = register(Counter(
+    "chatbot_campaign_messages_total", "Mensajes de campañas por resultado", labels=("outcome",),
+))
+
+# Estados de la campaña y de cada destinatario
+DRAFT, RUNNING, PAUSED, COMPLETED, CANCELLED = "draft", "running", "paused", "completed", "cancelled"
+PENDING, SENDING, SENT, FAILED, SKIPPED = "pending", "sending", "sent", "failed", "skipped"
+
+MAX_ATTEMPTS = 3
+_RETRY_BASE_SECONDS = 1.0
+# Pausa de toda la campaña cuando WhatsApp responde 429 (límite de throughput)
+_THROTTLE_PAUSE_SECONDS = 5.0
+_INSERT_CHUNK = 1000
+_AUDIENCE_PAGE = 1000
+
+# Identifica a este proceso como dueño del lease
+_WORKER_ID = uuid.uuid4().hex
+# Campañas que envía este proceso: id -> (tarea, evento de parada)
+_running: Dict[str, Tuple[asyncio.Task, asyncio.Event]] = {}
+
+
+class CampaignError(ValueError):
+    """Campaña inválida o en un estado que no permite la operación."""
+
+
+class RateLimiter:
+    """Cubeta de fichas: como mucho `rate` adquisiciones por segundo (ráfagas de hasta `burst`)."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Nadie adquiere durante `seconds` (ej. tras un 429)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SharedRateLimiter:
+    """
+    Tope por número de WhatsApp compartido entre procesos: pide fichas por bloques
+    a la cubeta de Supabase (RPC `take_send_tokens`) y las reparte entre las
+    campañas de este proceso. Si Supabase no responde, sigue al mismo ritmo con
+    fichas locales.
+    """
+
+    def __init__(self, tenant: Tenant, rate: float):
+        self.tenant = tenant
+        self.bucket = tenant.phone_number_id or tenant.id
+        self.rate = rate
+        self._tokens = 0
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self._fallback = RateLimiter(rate)
+
+    async def _take(self, wanted: int, pause_seconds: float = 0.0) -> int:
+        resp = await get_http_client().post(
+            f"{self.tenant.supabase_url}/rest/v1/rpc/take_send_tokens", headers=self.tenant.supabase_headers,
+            json={"bucket_id": self.bucket, "rate": self.rate, "wanted": wanted, "pause_seconds": pause_seconds},
+        )
+        resp.raise_for_status()
+        return int(resp.json() or 0)
+
+    def pause(self, seconds: float) -> None:
+        """Pausa el número para todos los workers (ej. tras un 429)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._fallback.pause(seconds)
+        _spawn(self._pause_remote(seconds))
+
+    async def _pause_remote(self, seconds: float) -> None:
+        try:
+            await self._take(0, pause_seconds=seconds)
+        except Exception as e:
+            log.warning("⚠️ No se pudo pausar la cubeta compartida %s: %s", self.bucket, e)
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while self._tokens < 1:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                try:
+                    # Bloques de ~1/4 s de envíos: pocas llamadas sin acaparar la cubeta
+                    granted = await self._take(max(1, int(self.rate / 4)))
+                except Exception as e:
+                    log.warning("⚠️ Cubeta compartida %s no disponible, se limita localmente: %s", self.bucket, e)
+                    await self._fallback.acquire()
+                    return
+                if granted:
+                    self._tokens += granted
+                else:
+                    await asyncio.sleep(max(1.0 / self.rate, 0.05))
+            self._tokens -= 1
+
+
+# Un tope compartido por número (tienda) en este proceso
+_number_limiters: Dict[str, SharedRateLimiter] = {}
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _number_limiter() -> SharedRateLimiter:
+    tenant = current_tenant()
+    limiter = _number_limiters.get(tenant.id)
+    if limiter is None:
+        limiter = _number_limiters[tenant.id] = SharedRateLimiter(tenant, CAMPAIGN_NUMBER_MESSAGES_PER_SECOND)
+    return limiter
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(moment: datetime) -> str:
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+def normalize_phone(raw) -> Optional[str]:
+    """Sólo dígitos, con indicativo de país (CAMPAIGN_DEFAULT_COUNTRY_CODE si falta)."""
+    digits = re.sub(r"\D", "", str(raw or ""))
+    if len(digits) < 7:
+        return None
+    if len(digits) <= 10 and CAMPAIGN_DEFAULT_COUNTRY_CODE:
+        digits = CAMPAIGN_DEFAULT_COUNTRY_CODE + digits
+    return digits
+
+
+# --- Audiencia ---
+
+async def _distinct_phones(
+    client: httpx.AsyncClient, table: str, filters: List[Tuple[str, str]], with_name: bool,
+) -> AsyncIterator[Tuple[str, Optional[str]]]:
+    """
+    (teléfono, nombre) de `table` sin repetir, por keyset sobre phone_number: cada
+    página empieza después del último teléfono visto, así que las filas repetidas
+    de un mismo cliente nunca se recorren dos veces entre páginas.
+    """
+    url = f"{supabase_url()}/rest/v1/{table}"
+    select = "phone_number,name" if with_name else "phone_number"
+    # Con nombre (pedidos), la primera fila de cada teléfono es la más reciente
+    order = "phone_number.asc,created_at.desc" if with_name else "phone_number.asc"
+    last = None
+    while True:
+        params = [("select", select), ("order", order), ("limit", str(_AUDIENCE_PAGE)), *filters]
+        params.append(("phone_number", f"gt.{last}") if last else ("phone_number", "not.is.null"))
+        resp = await client.get(url, headers=supabase_headers(), params=params)
+        resp.raise_for_status()
+        rows = resp.json()
+        for row in rows:
+            if row["phone_number"] != last:
+                last = row["phone_number"]
+                yield last, row.get("name")
+        if len(rows) < _AUDIENCE_PAGE:
+            return
+
+
+async def build_audience(audience: dict, client: httpx.AsyncClient) -> Dict[str, Optional[str]]:
+    """
+    Teléfono normalizado -> nombre. `audience`:
+      sources: ["orders", "messages"] (por defecto ambos)
+      since:   ISO 8601; sólo clientes con pedidos/mensajes desde esa fecha
+      phones:  teléfonos adicionales
+      exclude: teléfonos que no deben recibir la campaña
+    """
+    sources = audience.get("sources") or ["orders", "messages"]
+    unknown = set(sources) - {"orders", "messages"}
+    if unknown:
+        raise CampaignError(f"Fuentes de audiencia desconocidas: {', '.join(sorted(unknown))}")
+    since = audience.get("since")
+    recipients: Dict[str, Optional[str]] = {}
+
+    if "orders" in sources:
+        filters = [("created_at", f"gte.{since}")] if since else []
+        async for phone, name in _distinct_phones(client, "orders", filters, with_name=True):
+            phone = normalize_phone(phone)
+            if phone:
+                recipients[phone] = recipients.get(phone) or name
+    if "messages" in sources:
+        filters = [("role", "eq.user")] + ([("timestamp", f"gte.{since}")] if since else [])
+        async for phone, _ in _distinct_phones(client, "messages", filters, with_name=False):
+            phone = normalize_phone(phone)
+            if phone:
+                recipients.setdefault(phone, None)
+    for phone in audience.get("phones") or []:
+        phone = normalize_phone(phone)
+        if phone:
+            recipients.setdefault(phone, None)
+    for phone in audience.get("exclude") or []:
+        recipients.pop(normalize_phone(phone), None)
+    return recipients
+
+
+# --- Mensaje ---
+
+def _validate_message(message: dict) -> dict:
+    kind = (message or {}).get("type")
+    if kind == "template":
+        template = message.get("template") or {}
+        if not template.get("name"):
+            raise CampaignError("El template necesita `name`")
+        return {"type": "template", "name_fallback": message.get("name_fallback") or "cliente", "template": {
+            "name": template["name"],
+            "language": template.get("language") or "es",
+            "components": template.get("components") or [],
+        }}
+    if kind == "text":
+        if not (message.get("text") or "").strip():
+            raise CampaignError("El mensaje de texto está vacío")
+        return {"type": "text", "name_fallback": message.get("name_fallback") or "", "text": message["text"]}
+    raise CampaignError("`message.type` debe ser 'template' o 'text'")
+
+
+def _fill(value, name: str):
+    """Reemplaza {name} en todos los textos de una estructura JSON."""
+    if isinstance(value, str):
+        return value.replace("{name}", name)
+    if isinstance(value, list):
+        return [_fill(v, name) for v in value]
+    if isinstance(value, dict):
+        return {k: _fill(v, name) for k, v in value.items()}
+    return value
+
+
+def message_payload(message: dict, phone: str, name: Optional[str]) -> dict:
+    """Cuerpo para /messages de un destinatario."""
+    name = (name or "").strip().split(" ")[0] or message.get("name_fallback") or ""
+    if message["type"] == "template":
+        template = message["template"]
+        body = {"name": template["name"], "language": {"code": template["language"]}}
+        if template["components"]:
+            body["components"] = _fill(template["components"], name)
+        return {"messaging_product": "whatsapp", "to": phone, "type": "template", "template": body}
+    # Sin nombre, "Hola {name}, ..." queda "Hola, ..."
+    text = message["text"].replace(" {name}", " {name}" if name else "").replace("{name}", name)
+    return {"messaging_product": "whatsapp", "to": phone, "type": "text", "text": {"body": text}}
+
+
+# --- Persistencia ---
+
+def _headers(prefer: Optional[str] = None) -> dict:
+    headers = dict(supabase_headers())
+    if prefer:
+        headers["Prefer"] = prefer
+    return headers
+
+
+async def _insert_recipients(client: httpx.AsyncClient, campaign_id: str, recipients: Dict[str, Optional[str]]) -> None:
+    url = f"{supabase_url()}/rest/v1/campaign_recipients"
+    rows = [{"campaign_id": campaign_id, "phone_number": p, "name": n} for p, n in recipients.items()]
+    for start in range(0, len(rows), _INSERT_CHUNK):
+        resp = await client.post(url, headers=_headers("resolution=ignore-duplicates,return=minimal"),
+                                 json=rows[start:start + _INSERT_CHUNK])
+        resp.raise_for_status()
+
+
+async def _patch_campaign(client: httpx.AsyncClient, campaign_id: str, data: dict, filters=()) -> Optional[dict]:
+    """Actualiza la campaña si cumple `filters`; devuelve la fila o None si no cumplía."""
+    url = f"{supabase_url()}/rest/v1/campaigns"
+    params = [("id", f"eq.{campaign_id}"), *filters]
+    resp = await client.patch(url, headers=supabase_headers(), params=params,
+                              json={**data, "updated_at": _iso(_now())})
+    resp.raise_for_status()
+    rows = resp.json()
+    return rows[0] if rows else None
+
+
+async def _set_recipients(client: httpx.AsyncClient, campaign_id: str, filters, data: dict) -> None:
+    url = f"{supabase_url()}/rest/v1/campaign_recipients"
+    params = [("campaign_id", f"eq.{campaign_id}"), *filters]
+    resp = await client.patch(url, headers=_headers("return=minimal"), params=params,
+                              json={**data, "updated_at": _iso(_now())})
+    resp.raise_for_status()
+
+
+async def _save_results(client: httpx.AsyncClient, results: List[dict]) -> None:
+    """Un upsert por lote con el resultado de cada destinatario."""
+    if not results:
+        return
+    url = f"{supabase_url()}/rest/v1/campaign_recipients"
+    resp = await client.post(url, headers=_headers("resolution=merge-duplicates,return=minimal"),
+                             params={"on_conflict": "campaign_id,phone_number"}, json=results)
+    resp.raise_for_status()
+
+
+async def _count(client: httpx.AsyncClient, campaign_id: str, status: str) -> int:
+    url = f"{supabase_url()}/rest/v1/campaign_recipients"
+    params = {"select": "phone_number", "campaign_id": f"eq.{campaign_id}", "status": f"eq.{status}"}
+    resp = await client.get(url, headers={**_headers("count=exact"), "Range": "0-0"}, params=params)
+    resp.raise_for_status()
+    # Content-Range: 0-0/<total> (o */0 si no hay filas)
+    return int(resp.headers.get("content-range", "*/0").rsplit("/", 1)[-1] or 0)
+
+
+# --- API del servicio ---
+
+async def create_campaign(spec: dict) -> dict:
+    """
+    Crea la campaña y su lista de destinatarios. `spec`:
+      name, message (ver arriba), audience (ver `build_audience`),
+      messages_per_second (opcional, CAMPAIGN_MESSAGES_PER_SECOND por defecto)
+    """
+    name = (spec.get("name") or "").strip()
+    if not name:
+        raise CampaignError("La campaña necesita `name`")
+    message = _validate_message(spec.get("message"))
+    audience = spec.get("audience") or {}
+    mps = float(spec.get("messages_per_second") or CAMPAIGN_MESSAGES_PER_SECOND)
+    if mps <= 0:
+        raise CampaignError("`messages_per_second` debe ser mayor que 0")
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        recipients = await build_audience(audience, client)
+        if not recipients:
+            raise CampaignError("La audiencia está vacía")
+        resp = await client.post(f"{supabase_url()}/rest/v1/campaigns", headers=supabase_headers(), json={
+            "name": name,
+            "message": message,
+            "audience": audience,
+            "status": DRAFT,
+            "messages_per_second": mps,
+            "total": len(recipients),
+        })
+        resp.raise_for_status()
+        campaign = resp.json()[0]
+        await _insert_recipients(client, campaign["id"], recipients)
+    log.info("📣 Campaña %s creada: %s destinatarios", campaign["id"], len(recipients))
+    return campaign
+
+
+async def get_campaign(campaign_id: str) -> Optional[dict]:
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(f"{supabase_url()}/rest/v1/campaigns", headers=supabase_headers(),
+                                params={"select": "*", "id": f"eq.{campaign_id}"})
+        resp.raise_for_status()
+        rows = resp.json()
+    if not rows:
+        return None
+    return {**rows[0], "running_here": campaign_id in _running}
+
+
+async def list_campaigns(limit: int = 50) -> list:
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(f"{supabase_url()}/rest/v1/campaigns", headers=supabase_headers(),
+                                params={"select": "*", "order": "created_at.desc", "limit": str(limit)})
+        resp.raise_for_status()
+        return resp.json()
+
+
+async def list_recipients(
+    campaign_id: str, status: Optional[str] = None, after: Optional[str] = None, limit: int = 500,
+) -> Tuple[list, Optional[str]]:
+    """Resultados por destinatario ordenados por teléfono; devuelve (filas, cursor_siguiente)."""
+    params = [("select", "*"), ("campaign_id", f"eq.{campaign_id}"),
+              ("order", "phone_number.asc"), ("limit", str(limit))]
+    if status:
+        params.append(("status", f"eq.{status}"))
+    if after:
+        params.append(("phone_number", f"gt.{after}"))
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(f"{supabase_url()}/rest/v1/campaign_recipients",
+                                headers=supabase_headers(), params=params)
+        resp.raise_for_status()
+        rows = resp.json()
+    return rows, rows[-1]["phone_number"] if len(rows) == limit else None
+
+
+def _lease_filters(now: datetime):
+    # Libre, vencido o ya nuestro
+    return [("or", f'(lease_until.is.null,lease_until.lt."{_iso(now)}",lease_owner.eq.{_WORKER_ID})')]
+
+
+async def _claim(client: httpx.AsyncClient, campaign_id: str, statuses: Tuple[str, ...]) -> Optional[dict]:
+    """Pasa la campaña a `running` con el lease de este proceso, si está libre o vencido."""
+    now = _now()
+    return await _patch_campaign(
+        client, campaign_id,
+        {"status": RUNNING, "lease_owner": _WORKER_ID, "lease_until": _iso(now + timedelta(seconds=CAMPAIGN_LEASE_SECONDS))},
+        [("status", f"in.({','.join(statuses)})"), *_lease_filters(now)],
+    )
+
+
+def _launch(campaign: dict, deadline: Optional[float] = None) -> asyncio.Task:
+    campaign_id = campaign["id"]
+    stop = asyncio.Event()
+    task = asyncio.create_task(_run(campaign, stop, deadline))
+    _running[campaign_id] = (task, stop)
+    task.add_done_callback(lambda _: _running.pop(campaign_id, None))
+    return task
+
+
+async def start_campaign(campaign_id: str) -> dict:
+    """
+    Empieza o reanuda el envío: en segundo plano en este proceso o, sin
+    CAMPAIGN_BACKGROUND_SENDING, desde el próximo /campaigns/tick.
+    """
+    if campaign_id in _running:
+        return await get_campaign(campaign_id)
+    async with httpx.AsyncClient() as client:
+        if CAMPAIGN_BACKGROUND_SENDING:
+            campaign = await _claim(client, campaign_id, (DRAFT, PAUSED, RUNNING))
+        else:
+            campaign = await _patch_campaign(client, campaign_id, {"status": RUNNING},
+                                             [("status", f"in.({DRAFT},{PAUSED},{RUNNING})")])
+    if campaign is None:
+        raise CampaignError("La campaña no existe, ya terminó o la está enviando otro worker")
+    if not CAMPAIGN_BACKGROUND_SENDING:
+        return {**campaign, "running_here": False}
+    _launch(campaign)
+    return {**campaign, "running_here": True}
+
+
+async def _due_campaigns(client: httpx.AsyncClient) -> List[dict]:
+    """Campañas `running` de la tienda actual sin lease o con el lease vencido."""
+    resp = await client.get(
+        f"{supabase_url()}/rest/v1/campaigns", headers=supabase_headers(),
+        params=[("select", "id"), ("status", f"eq.{RUNNING}"),
+                ("or", f'(lease_until.is.null,lease_until.lt."{_iso(_now())}")'), ("order", "created_at.asc")],
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def run_due_campaigns(seconds: Optional[float] = CAMPAIGN_TICK_SECONDS) -> List[dict]:
+    """
+    Un "tick" del cron: toma las campañas `running` de todas las tiendas que nadie
+    está enviando y las envía durante `seconds` (lo pendiente queda para el
+    siguiente). Con `seconds=None` las deja enviándose en segundo plano hasta
+    terminar, sin esperarlas. Devuelve las campañas tomadas.
+    """
+    deadline = time.monotonic() + seconds if seconds is not None else None
+    claimed, tasks = [], []
+    async with httpx.AsyncClient() as client:
+        for tenant in all_tenants():
+            with use_tenant(tenant):
+                try:
+                    due = await _due_campaigns(client)
+                    for row in due:
+                        if row["id"] in _running:
+                            continue
+                        campaign = await _claim(client, row["id"], (RUNNING,))
+                        if campaign is not None:
+                            claimed.append({"id": campaign["id"], "tenant": tenant.id})
+                            # La tarea hereda la tienda del contexto
+                            tasks.append(_launch(campaign, deadline))
+                except Exception as e:
+                    log.error("❌ No se pudieron revisar las campañas de %s: %s", tenant.id, e)
+    if tasks and deadline is not None:
+        await asyncio.wait(tasks)
+    return claimed
+
+
+async def run_resume_loop() -> None:
+    """Con envío en segundo plano: retoma cada CAMPAIGN_LEASE_SECONDS las campañas sin worker vivo."""
+    while True:
+        await asyncio.sleep(CAMPAIGN_LEASE_SECONDS)
+        claimed = await run_due_campaigns(None)
+        if claimed:
+            log.info("📣 Campañas retomadas: %s", claimed)
+
+
+async def _change_status(campaign_id: str, status: str, allowed: Tuple[str, ...]) -> dict:
+    async with httpx.AsyncClient() as client:
+        campaign = await _patch_campaign(client, campaign_id, {"status": status},
+                                         [("status", f"in.({','.join(allowed)})")])
+    if campaign is None:
+        raise CampaignError(f"La campaña no existe o no se puede pasar a '{status}'")
+    # Si la envía este proceso, para en el próximo destinatario; otro worker lo nota al renovar el lease
+    if campaign_id in _running:
+        _running[campaign_id][1].set()
+    return campaign
+
+
+async def pause_campaign(campaign_id: str) -> dict:
+    return await _change_status(campaign_id, PAUSED, (DRAFT, RUNNING))
+
+
+async def cancel_campaign(campaign_id: str) -> dict:
+    return await _change_status(campaign_id, CANCELLED, (DRAFT, RUNNING, PAUSED))
+
+
+async def stop_all_campaigns(timeout: float = 10.0) -> None:
+    """Al apagar: termina el lote en curso de cada campaña y guarda sus resultados."""
+    for _, stop in _running.values():
+        stop.set()
+    tasks = [task for task, _ in _running.values()]
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+
+
+# --- Envío ---
+
+async def _send_one(
+    client: httpx.AsyncClient, campaign: dict, recipient: dict, limiter: RateLimiter,
+    number_limiter: SharedRateLimiter, stop: asyncio.Event,
+) -> dict:
+    result = {"campaign_id": campaign["id"], "phone_number": recipient["phone_number"],
+              "status": PENDING, "message_id": None, "error": None, "attempts": recipient.get("attempts") or 0}
+    payload = message_payload(campaign["message"], recipient["phone_number"], recipient.get("name"))
+    for attempt in range(MAX_ATTEMPTS):
+        await limiter.acquire()
+        if not stop.is_set():
+            await number_limiter.acquire()
+        if stop.is_set():
+            return result  # sigue pendiente para cuando se reanude
+        result["attempts"] += 1
+        with span("client.whatsapp.campaign") as s:
+            try:
+                resp = await post_whatsapp_payload(payload, client)
+            except httpx.HTTPError as e:
+                s.outcome = "http_error"
+                result["error"] = str(e)[:300] or type(e).__name__
+                retry = True
+            else:
+                if resp.status_code < 400:
+                    result.update(status=SENT, error=None,
+                                  message_id=((resp.json().get("messages") or [{}])[0]).get("id"))
+                    CAMPAIGN_MESSAGES.inc(outcome=SENT)
+                    return result
+                s.outcome = "http_error"
+                result["error"] = f"{resp.status_code}: {resp.text[:300]}"
+                retry = resp.status_code == 429 or resp.status_code >= 500
+                if resp.status_code == 429:
+                    number_limiter.pause(_THROTTLE_PAUSE_SECONDS)
+        if not retry:
+            break
+        await asyncio.sleep(_RETRY_BASE_SECONDS * 2 ** attempt)
+    result["status"] = FAILED
+    CAMPAIGN_MESSAGES.inc(outcome=FAILED)
+    return result
+
+
+async def _heartbeat(client: httpx.AsyncClient, campaign_id: str, stop: asyncio.Event) -> None:
+    """Renueva el lease cada CAMPAIGN_LEASE_SECONDS / 3, sin esperar a que termine el lote."""
+    while not stop.is_set():
+        await asyncio.sleep(CAMPAIGN_LEASE_SECONDS / 3)
+        try:
+            renewed = await _patch_campaign(
+                client, campaign_id, {"lease_until": _iso(_now() + timedelta(seconds=CAMPAIGN_LEASE_SECONDS))},
+                [("status", f"eq.{RUNNING}"), ("lease_owner", f"eq.{_WORKER_ID}")],
+            )
+        except Exception as e:
+            log.warning("⚠️ No se pudo renovar el lease de la campaña %s: %s", campaign_id, e)
+            continue
+        if renewed is None:
+            log.info("⏸️ Campaña %s pausada, cancelada o tomada por otro worker", campaign_id)
+            stop.set()
+            return
+
+
+async def _run(campaign: dict, stop: asyncio.Event, deadline: Optional[float] = None) -> None:
+    """Envía la campaña hasta terminarla, hasta `stop` o hasta `deadline` (time.monotonic)."""
+    campaign_id = campaign["id"]
+    mps = float(campaign["messages_per_second"])
+    limiter = RateLimiter(mps)
+    number_limiter = _number_limiter()
+    semaphore = asyncio.Semaphore(CAMPAIGN_CONCURRENCY)
+    limits = httpx.Limits(max_connections=CAMPAIGN_CONCURRENCY, max_keepalive_connections=CAMPAIGN_CONCURRENCY)
+    status = PAUSED
+    timer = None
+    if deadline is not None:
+        timer = asyncio.get_running_loop().call_later(max(0.0, deadline - time.monotonic()), stop.set)
+
+    async def send(recipient: dict) -> dict:
+        async with semaphore:
+            return await _send_one(client, campaign, recipient, limiter, number_limiter, stop)
+
+    heartbeat = None
+    try:
+        async with httpx.AsyncClient(timeout=15.0, limits=limits) as client:
+            heartbeat = asyncio.create_task(_heartbeat(client, campaign_id, stop))
+            # Lote interrumpido de un worker anterior: no se sabe si salió, no se reenvía
+            await _set_recipients(client, campaign_id, [("status", f"eq.{SENDING}")],
+                                  {"status": SKIPPED, "error": "interrumpido durante el envío"})
+            counts = {k: await _count(client, campaign_id, k) for k in (SENT, FAILED, SKIPPED)}
+            log.info("📣 Enviando campaña %s a %s mps (%s)", campaign_id, mps, counts)
+
+            while not stop.is_set():
+                resp = await client.get(
+                    f"{supabase_url()}/rest/v1/campaign_recipients", headers=supabase_headers(),
+                    params=[("select", "phone_number,name,attempts"), ("campaign_id", f"eq.{campaign_id}"),
+                            ("status", f"eq.{PENDING}"), ("order", "phone_number.asc"),
+                            ("limit", str(CAMPAIGN_BATCH_SIZE))],
+                )
+                resp.raise_for_status()
+                batch = resp.json()
+                if not batch:
+                    status = COMPLETED
+                    break
+                phones = ",".join(f'"{r["phone_number"]}"' for r in batch)
+                await _set_recipients(client, campaign_id, [("phone_number", f"in.({phones})")], {"status": SENDING})
+
+                results = await asyncio.gather(*(send(r) for r in batch))
+                now = _iso(_now())
+                for r in results:
+                    r["updated_at"] = now
+                    if r["status"] != PENDING:
+                        counts[r["status"]] += 1
+                await _save_results(client, results)
+
+                renewed = await _patch_campaign(
+                    client, campaign_id,
+                    counts, [("status", f"eq.{RUNNING}"), ("lease_owner", f"eq.{_WORKER_ID}")],
+                )
+                if renewed is None:
+                    log.info("⏸️ Campaña %s pausada, cancelada o tomada por otro worker", campaign_id)
+                    break
+
+            # Contadores finales y lease liberado (si sigue siendo nuestro)
+            final = {**counts, "lease_owner": None, "lease_until": None}
+            if status == COMPLETED:
+                final.update(status=COMPLETED, finished_at=_iso(_now()))
+            await _patch_campaign(client, campaign_id, final, [("lease_owner", f"eq.{_WORKER_ID}")])
+            log.info("📣 Campaña %s: %s (%s)", campaign_id, status, counts)
+    except Exception as e:
+        # El lease vence solo y el próximo tick la reanuda
+        log.error("❌ Campaña %s detenida por error: %s", campaign_id, e, exc_info=True)
+    finally:
+        if heartbeat is not None:
+            heartbeat.cancel()
+        if timer is not None:
+            timer.cancel()
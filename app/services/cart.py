@@ -0,0 +1,260 @@
+# app/services/cart.py
+"""
+Carrito por conversación, con precios calculados en el servidor.
+
+El LLM ya no suma ni arma el JSON del pedido: sólo emite operaciones cortas
+sobre el carrito, que `extract_cart_operations` separa de su respuesta:
+
+    {"cart_ops": [
+        {"op": "add", "product": "Ron Viejo de Caldas", "variant": "750ml", "quantity": 2},
+        {"op": "remove", "product": "Aguardiente Nariño", "variant": "azul"},
+        {"op": "set_quantity", "product": "Ron Viejo de Caldas", "variant": "750ml", "quantity": 1},
+        {"op": "set_customer_field", "field": "address", "value": "Cra 10 # 20-30, Pasto"},
+        {"op": "checkout"}
+    ]}
+
+Con el catálogo compacto (ver catalog_prompt.py) el ítem puede venir como
+{"op": "add", "id": "P3F9A1C-7B2E", "quantity": 2}.
+
+El carrito guarda sólo ids y cantidades; nombre, precio y stock salen siempre del
+catálogo (`price_cart`), y el pedido final se valida aquí (`build_order`) antes de
+llamar a `process_order`. Las líneas de productos que salieron del catálogo se
+quitan al cargar el carrito (`drop_unavailable_lines`), con un aviso al cliente.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from app.core.tenants import current_tenant
+from app.services.catalog import CatalogIndex, variant_text
+from app.services import catalog_prompt  # noqa: F401  (registra la traducción de ids cortos)
+from app.utils.validators import REQUIRED_FIELDS, get_missing_fields
+
+CUSTOMER_FIELDS = tuple(REQUIRED_FIELDS)
+# Tope por línea: evita pedidos absurdos por un número mal leído
+MAX_LINE_QUANTITY = 100
+
+_FIELD_LABELS = {
+    "name": "nombre completo",
+    "address": "dirección de entrega",
+    "phone": "teléfono de contacto",
+    "payment_method": "método de pago",
+}
+
+
+def _quantity(value) -> Optional[int]:
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if 0 <= quantity <= MAX_LINE_QUANTITY else None
+
+
+def _resolve(catalog: CatalogIndex, op: dict) -> Tuple[Optional[Dict], Optional[Dict], Optional[str]]:
+    """(producto, variante, problema) para el ítem que nombra una operación."""
+    short_id = op.get("id")
+    if isinstance(short_id, str) and short_id.strip():
+        product_id, variant_id = catalog.rendered("short_ids").get(short_id.strip().upper(), (None, None))
+        if variant_id in catalog.variants_by_id:
+            product, variant = catalog.variants_by_id[variant_id]
+            return product, variant, None
+        if product_id in catalog.by_id:
+            op = {**op, "product_id": product_id}
+        elif not op.get("product"):
+            return None, None, f"No encontré el producto {short_id} en el catálogo."
+    if op.get("variant_id") in catalog.variants_by_id:
+        product, variant = catalog.variants_by_id[op["variant_id"]]
+        return product, variant, None
+    product = catalog.by_id.get(op.get("product_id")) or catalog.find_product(op.get("product") or "")
+    if not product:
+        return None, None, f"No encontré '{op.get('product')}' en el catálogo."
+    variants = product.get("product_variants") or []
+    if not variants:
+        return product, None, None
+    variant = catalog.find_variant(product, op.get("variant"))
+    if variant is None and len(variants) == 1:
+        variant = variants[0]
+    if variant is None:
+        options = ", ".join(variant_text(v) for v in variants)
+        return product, None, f"¿Qué presentación de {product['name']} quieres? ({options})"
+    return product, variant, None
+
+
+def _find_line(cart: dict, product_id, variant_id) -> Optional[dict]:
+    for line in cart["lines"]:
+        if line["product_id"] == product_id and line.get("variant_id") == variant_id:
+            return line
+    return None
+
+
+def apply_operations(cart: dict, ops: List[dict], catalog: CatalogIndex) -> Tuple[bool, List[str]]:
+    """
+    Aplica las operaciones al carrito (en el lugar). Devuelve (checkout_pedido, problemas);
+    las operaciones inválidas se saltan y se explican en `problemas`.
+    """
+    checkout = False
+    problems: List[str] = []
+    for op in ops:
+        if not isinstance(op, dict):
+            continue
+        kind = op.get("op")
+        if kind == "checkout":
+            checkout = True
+        elif kind == "set_customer_field":
+            field, value = op.get("field"), op.get("value")
+            if field in CUSTOMER_FIELDS and isinstance(value, str) and value.strip():
+                cart["customer"][field] = value.strip()
+        elif kind in ("add", "remove", "set_quantity"):
+            product, variant, problem = _resolve(catalog, op)
+            if problem:
+                problems.append(problem)
+                continue
+            variant_id = variant["id"] if variant else None
+            line = _find_line(cart, product["id"], variant_id)
+            if kind == "remove":
+                if line:
+                    cart["lines"].remove(line)
+                continue
+            quantity = _quantity(op.get("quantity", 1))
+            if quantity is None:
+                problems.append(f"La cantidad para {product['name']} no es válida.")
+                continue
+            if kind == "add" and line:
+                quantity = min(line["quantity"] + quantity, MAX_LINE_QUANTITY)
+            if quantity == 0:
+                if line:
+                    cart["lines"].remove(line)
+            elif line:
+                line["quantity"] = quantity
+            else:
+                cart["lines"].append({"product_id": product["id"], "variant_id": variant_id, "quantity": quantity})
+    return checkout, problems
+
+
+def _line_item(line: dict, catalog: CatalogIndex) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """(producto, variante) de una línea del carrito; producto None si salió del catálogo."""
+    if line.get("variant_id"):
+        return catalog.variants_by_id.get(line["variant_id"], (None, None))
+    return catalog.by_id.get(line["product_id"]), None
+
+
+def drop_unavailable_lines(cart: dict, catalog: CatalogIndex) -> List[str]:
+    """
+    Quita del carrito (en el lugar) las líneas cuyo producto o variante ya no está
+    en el catálogo: no se pueden quitar con `remove` (no se resuelven) y bloquearían
+    el checkout. Devuelve el aviso para el cliente (vacío si no quitó nada); como
+    las líneas desaparecen, se avisa una sola vez.
+    """
+    kept = [line for line in cart["lines"] if _line_item(line, catalog)[0] is not None]
+    dropped = len(cart["lines"]) - len(kept)
+    if not dropped:
+        return []
+    cart["lines"] = kept
+    if dropped == 1:
+        return ["Quité de tu carrito un producto que ya no está disponible."]
+    return [f"Quité de tu carrito {dropped} productos que ya no están disponibles."]
+
+
+def price_cart(cart: dict, catalog: CatalogIndex) -> dict:
+    """
+    Líneas con nombre, precio y stock actuales del catálogo, subtotal, envío y total.
+    Las líneas que ya no están en el catálogo se omiten (ver `drop_unavailable_lines`).
+    """
+    lines, issues = [], []
+    subtotal = 0.0
+    for line in cart["lines"]:
+        product, variant = _line_item(line, catalog)
+        if product is None:
+            continue
+        source = variant if variant and variant.get("price") is not None else product
+        price_unit = source.get("price")
+        stock = (variant or product).get("stock")
+        name = product["name"]
+        v_text = variant_text(variant) if variant else None
+        display = f"{name} ({v_text})" if v_text else name
+        if price_unit is None:
+            issues.append(f"{display} no tiene precio publicado.")
+            continue
+        if stock is not None and line["quantity"] > stock:
+            issues.append(f"Sólo quedan {stock} de {display}.")
+        line_total = float(price_unit) * line["quantity"]
+        subtotal += line_total
+        lines.append({
+            "product_id": product["id"],
+            "variant_id": variant["id"] if variant else None,
+            "name": name,
+            "variant_text": v_text,
+            "display": display,
+            "quantity": line["quantity"],
+            "price_unit": float(price_unit),
+            "line_total": line_total,
+            "stock": stock,
+        })
+    shipping = current_tenant().shipping_cost if lines else 0.0
+    return {
+        "lines": lines,
+        "subtotal": subtotal,
+        "shipping_cost": shipping,
+        "total": subtotal + shipping,
+        "issues": issues,
+    }
+
+
+def missing_customer_fields(cart: dict, phone: Optional[str] = None) -> List[str]:
+    customer = dict(cart["customer"])
+    customer.setdefault("phone", phone)
+    return get_missing_fields(customer)
+
+
+def cart_summary_text(priced: dict) -> str:
+    """Resumen del carrito para el cliente (y como contexto para el LLM)."""
+    if not priced["lines"]:
+        return "🛒 Tu carrito está vacío."
+    rows = ["🛒 *Tu pedido:*"]
+    for line in priced["lines"]:
+        rows.append(f"- {line['quantity']} x {line['display']}: ${line['line_total']:,.0f}")
+    rows.append(f"Subtotal: ${priced['subtotal']:,.0f}")
+    rows.append(f"Envío: ${priced['shipping_cost']:,.0f}")
+    rows.append(f"*Total: ${priced['total']:,.0f}*")
+    return "\n".join(rows)
+
+
+def describe_missing_fields(fields: List[str]) -> str:
+    return ", ".join(_FIELD_LABELS.get(f, f) for f in fields)
+
+
+def build_order(cart: dict, catalog: CatalogIndex, phone: str) -> Tuple[Optional[dict], List[str]]:
+    """
+    Pedido listo para `process_order`, validado contra el catálogo, o (None, problemas)
+    si falta algo: carrito vacío, productos sin precio o sin stock, datos del cliente.
+    """
+    priced = price_cart(cart, catalog)
+    problems = list(priced["issues"])
+    if not priced["lines"]:
+        problems.append("Tu carrito está vacío.")
+    missing = missing_customer_fields(cart, phone)
+    if missing:
+        problems.append(f"Me falta: {describe_missing_fields(missing)}.")
+    if problems:
+        return None, problems
+
+    customer = cart["customer"]
+    order = {
+        "name": customer["name"],
+        "address": customer["address"],
+        "phone": customer.get("phone") or phone,
+        "payment_method": customer["payment_method"],
+        "products": [
+            {
+                "product_id": line["product_id"],
+                "variant_id": line["variant_id"],
+                "name": line["name"],
+                "variant_text": line["variant_text"],
+                "quantity": line["quantity"],
+                "price_unit": line["price_unit"],
+            }
+            for line in priced["lines"]
+        ],
+        "subtotal_products": priced["subtotal"],
+        "shipping_cost": priced["shipping_cost"],
+        "total": priced["total"],
+    }
+    return order, []
@@ -0,0 +1,383 @@
+# app/services/catalog.py
+"""
+Catálogo en caché con índices de búsqueda por id y por nombre.
+
+`get_catalog()` descarga los productos (con variantes e imágenes) como mucho una
+vez cada CATALOG_TTL_SECONDS y construye un `CatalogIndex` que sirve para
+resolver nombres que escribe el usuario/LLM a ids de producto y variante.
+
+Snapshot en disco: cada catálogo descargado se guarda (productos, versión y textos
+de prompt ya renderizados) en CATALOG_SNAPSHOT_PATH. Los textos van con la huella
+del código y la configuración que los generó (`_renderer_fingerprint`): tras un
+despliegue que cambie cómo se renderizan, los del snapshot se descartan y se
+vuelven a calcular. Una instancia nueva lo carga
+con una sola lectura y responde de inmediato mientras revalida contra Supabase en
+segundo plano. Si no hay snapshot local se prueba CATALOG_BUNDLED_SNAPSHOT_PATH,
+generado al desplegar con:
+
+    python -m app.services.catalog catalog_snapshot.json [id_tienda]
+
+Con varias tiendas (app/core/tenants.py) cada una tiene su propio caché y
+snapshot; el catálogo de una tienda sin mensajes durante
+TENANT_CATALOG_IDLE_SECONDS se libera de memoria y se vuelve a leer del snapshot
+la próxima vez.
+
+Cuando vence el TTL, una sola descarga por tienda va a Supabase; los requests que
+lleguen mientras tanto esperan esa misma.
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from difflib import get_close_matches
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from app.core.config import CATALOG_TTL_SECONDS, TENANT_CATALOG_IDLE_SECONDS
+from app.core.tenants import Tenant, current_tenant
+from app.core.responses import EncodedBody
+from app.core.logger import get_logger
+from app.services.products import get_all_products
+
+log = get_logger("catalog")
+
+# Máximo de respuestas serializadas que se guardan por versión del catálogo
+_MAX_ENCODED_RESPONSES = 64
+# Subirlo si cambia la estructura del snapshot (los cambios de renderizado los detecta la huella)
+_SNAPSHOT_FORMAT = 2
+
+# Textos derivados del catálogo (clave -> función(productos)); se guardan en el snapshot
+_renderers: Dict[str, Callable[[List[Dict]], object]] = {}
+# Configuración de la que depende cada texto (entra en la huella)
+_renderer_settings: Dict[str, tuple] = {}
+_fingerprint: Optional[Tuple[tuple, str]] = None
+
+
+def register_rendering(key: str, build: Callable[[List[Dict]], object], settings: Iterable = ()) -> None:
+    """
+    Registra un texto derivado del catálogo (ej. el catálogo para el prompt de ventas).
+    `settings`: valores de configuración que cambian el resultado.
+    """
+    _renderers[key] = build
+    _renderer_settings[key] = tuple(settings)
+
+
+def _module_source(module_name: str) -> bytes:
+    module = sys.modules.get(module_name)
+    try:
+        with open(module.__file__, "rb") as f:
+            return f.read()
+    except (AttributeError, TypeError, OSError):
+        return module_name.encode()
+
+
+def _renderer_fingerprint() -> str:
+    """Huella del código (módulos que registran textos y este) y la configuración de los renderizadores."""
+    global _fingerprint
+    registered = tuple(sorted((key, build.__module__, repr(_renderer_settings[key])) for key, build in _renderers.items()))
+    if _fingerprint is None or _fingerprint[0] != registered:
+        digest = hashlib.sha256(repr(registered).encode())
+        for module_name in sorted({__name__, *(entry[1] for entry in registered)}):
+            digest.update(_module_source(module_name))
+        _fingerprint = (registered, digest.hexdigest()[:16])
+    return _fingerprint[1]
+
+
+def variant_text(variant: Dict) -> str:
+    """Texto descriptivo de una variante (ej: 'Amarillo, 750ml')."""
+    options_parts = [str(value) for value in (variant.get("options") or {}).values()]
+    return ", ".join(options_parts) if options_parts else "Estándar"
+
+
+class CatalogIndex:
+    """Productos tal como los devuelve Supabase más índices derivados."""
+
+    def __init__(self, products: List[Dict], version: Optional[str] = None, renderings: Optional[Dict] = None):
+        self.products = products
+        # Versión del contenido: cambia si cambia cualquier producto, variante o imagen
+        self.version = version or hashlib.sha256(
+            orjson.dumps(products, default=str, option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()[:32]
+        # Respuestas ya serializadas (y comprimidas) por combinación de parámetros
+        self._encoded: Dict[str, EncodedBody] = {}
+        # Textos derivados (ej. catálogo para el prompt), calculados una vez por versión
+        self.renderings: Dict[str, object] = dict(renderings or {})
+        self.source = "supabase"
+        # True si el snapshot del que salió traía textos de otra huella (hay que reescribirlo)
+        self.stale_renderings = False
+        self.by_id: Dict[str, Dict] = {}
+        self.by_name: Dict[str, Dict] = {}
+        self.variants_by_id: Dict[str, Tuple[Dict, Dict]] = {}
+        for p in products:
+            self.by_id[p["id"]] = p
+            self.by_name.setdefault(p["name"].lower(), p)
+            for v in p.get("product_variants") or []:
+                self.variants_by_id[v["id"]] = (p, v)
+        self._names = list(self.by_name.keys())
+        # Orden estable por id para paginar por cursor (keyset)
+        self.sorted_ids = sorted(self.by_id, key=str)
+        self._sorted_keys = [str(i) for i in self.sorted_ids]
+
+    def page(self, after: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Productos ordenados por id, empezando después de `after`.
+        Devuelve (productos, cursor_siguiente); el cursor es None en la última página.
+        """
+        start = bisect.bisect_right(self._sorted_keys, after) if after else 0
+        end = len(self.sorted_ids) if limit is None else min(start + limit, len(self.sorted_ids))
+        ids = self.sorted_ids[start:end]
+        next_cursor = str(ids[-1]) if ids and end < len(self.sorted_ids) else None
+        return [self.by_id[i] for i in ids], next_cursor
+
+    def encoded(self, key: str, build: Callable[[], object]) -> EncodedBody:
+        """JSON de `build()` serializado una sola vez por versión del catálogo y `key`."""
+        body = self._encoded.get(key)
+        if body is None:
+            if len(self._encoded) >= _MAX_ENCODED_RESPONSES:
+                self._encoded.clear()
+            body = self._encoded[key] = EncodedBody(build())
+        return body
+
+    def rendered(self, key: str) -> object:
+        """Texto derivado registrado con `register_rendering`, calculado una vez por versión."""
+        if key not in self.renderings:
+            self.renderings[key] = _renderers[key](self.products)
+        return self.renderings[key]
+
+    def prerender(self) -> None:
+        for key in _renderers:
+            self.rendered(key)
+
+    def find_product(self, query_name: str) -> Optional[Dict]:
+        """Producto por nombre exacto (sin mayúsculas) o, si no, el más parecido."""
+        if not query_name:
+            return None
+        query_lower = query_name.strip().lower()
+        if query_lower in self.by_name:
+            return self.by_name[query_lower]
+        matches = get_close_matches(query_lower, self._names, n=1, cutoff=0.7)
+        return self.by_name[matches[0]] if matches else None
+
+    def find_variant(self, product: Dict, query_variant_text: Optional[str]) -> Optional[Dict]:
+        """Variante del producto cuyo texto contenga o se parezca a `query_variant_text`."""
+        if not product or not query_variant_text:
+            return None
+        query_lower = query_variant_text.strip().lower()
+        for v in product.get("product_variants") or []:
+            text = variant_text(v).lower()
+            if query_lower in text:
+                return v
+            option_values = [str(o).lower() for o in (v.get("options") or {}).values()]
+            matches = get_close_matches(query_lower, option_values, n=1, cutoff=0.7)
+            if matches and matches[0] in text:
+                return v
+        return None
+
+    def resolve(self, name: str, variant_query: Optional[str] = None) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """(producto, variante) para un ítem de pedido; la variante puede ser None."""
+        product = self.find_product(name)
+        return product, self.find_variant(product, variant_query)
+
+
+# --- Snapshot en disco ---
+
+def _snapshot_bytes(catalog: CatalogIndex) -> bytes:
+    return orjson.dumps({
+        "format": _SNAPSHOT_FORMAT,
+        "version": catalog.version,
+        "renderer": _renderer_fingerprint(),
+        "saved_at": time.time(),
+        "products": catalog.products,
+        "renderings": catalog.renderings,
+    }, default=str)
+
+
+def write_snapshot(catalog: CatalogIndex, path: str) -> None:
+    """Escribe el snapshot de forma atómica (archivo temporal + rename)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".catalog-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_snapshot_bytes(catalog))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path: str) -> Optional[CatalogIndex]:
+    """Catálogo guardado en `path` (una sola lectura), o None si falta o no sirve."""
+    try:
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as e:
+        log.warning("⚠️ Snapshot de catálogo ilegible (%s): %s", path, e)
+        return None
+    if not isinstance(data, dict) or data.get("format") != _SNAPSHOT_FORMAT:
+        return None
+    stale = data.get("renderer") != _renderer_fingerprint()
+    renderings = None if stale else data.get("renderings")
+    catalog = CatalogIndex(data.get("products") or [], data.get("version"), renderings)
+    catalog.source = "snapshot"
+    catalog.stale_renderings = stale
+    return catalog
+
+
+def _load_snapshot(tenant: Tenant) -> Optional[CatalogIndex]:
+    for path in (tenant.catalog_snapshot_path, tenant.catalog_bundled_snapshot_path):
+        if path:
+            catalog = read_snapshot(path)
+            if catalog is not None:
+                log.info("📦 Catálogo cargado desde snapshot %s (%s productos)", path, len(catalog.products))
+                return catalog
+    return None
+
+
+async def _save_snapshot(catalog: CatalogIndex, path: str) -> None:
+    if not path:
+        return
+    try:
+        catalog.prerender()
+        await asyncio.to_thread(write_snapshot, catalog, path)
+    except Exception as e:
+        log.warning("⚠️ No se pudo guardar el snapshot del catálogo: %s", e)
+
+
+# --- Caché en memoria ---
+
+class _TenantCatalog:
+    """Caché del catálogo de una tienda."""
+
+    def __init__(self, tenant: Tenant):
+        self.tenant = tenant
+        self.catalog: Optional[CatalogIndex] = None
+        self.loaded_at = 0.0
+        self.used_at = 0.0
+        self.snapshot_checked = False
+        # Descarga en curso, compartida por todos los que la necesiten
+        self.fetching: Optional[asyncio.Task] = None
+
+
+_states: Dict[str, _TenantCatalog] = {}
+# Referencias a las tareas en segundo plano (revalidación, escritura del snapshot)
+_background_tasks: set = set()
+
+
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _state() -> _TenantCatalog:
+    tenant = current_tenant()
+    state = _states.get(tenant.id)
+    if state is None:
+        state = _states[tenant.id] = _TenantCatalog(tenant)
+    return state
+
+
+def _release_idle(now: float, keep: _TenantCatalog) -> None:
+    """Libera los catálogos de las tiendas sin uso reciente (se recargan del snapshot)."""
+    if TENANT_CATALOG_IDLE_SECONDS <= 0:
+        return
+    for state in _states.values():
+        if state is not keep and state.catalog is not None and now - state.used_at > TENANT_CATALOG_IDLE_SECONDS:
+            log.debug("💤 Catálogo de %s liberado por inactividad", state.tenant.id)
+            state.catalog = None
+            state.snapshot_checked = False
+
+
+async def _fetch_catalog(state: _TenantCatalog) -> CatalogIndex:
+    previous = state.catalog
+    products = await get_all_products()
+    catalog = CatalogIndex(products or [])
+    changed = previous is None or previous.version != catalog.version
+    if not changed:
+        # Mismo contenido: se conservan los textos y respuestas ya calculados
+        # (los de un snapshot con otra huella ya se descartaron al leerlo)
+        previous.source = "supabase"
+        catalog = previous
+    state.catalog = catalog
+    state.loaded_at = time.monotonic()
+    if changed or catalog.stale_renderings:
+        catalog.stale_renderings = False
+        _spawn(_save_snapshot(catalog, state.tenant.catalog_snapshot_path))
+    _release_idle(state.loaded_at, state)
+    return catalog
+
+
+async def _refresh(state: _TenantCatalog) -> CatalogIndex:
+    """`_fetch_catalog` de una sola vez por tienda: quien llegue con una descarga en curso la espera."""
+    if state.fetching is None or state.fetching.done():
+        state.fetching = asyncio.create_task(_fetch_catalog(state))
+    # shield: si se cancela quien espera, la descarga sigue para los demás
+    return await asyncio.shield(state.fetching)
+
+
+async def _revalidate(state: _TenantCatalog) -> None:
+    try:
+        await _refresh(state)
+    except Exception as e:
+        log.warning("⚠️ No se pudo revalidar el catálogo del snapshot (%s): %s", state.tenant.id, e)
+
+
+async def get_catalog(force_refresh: bool = False) -> CatalogIndex:
+    """Catálogo indexado de la tienda actual, recargado de Supabase si venció el TTL."""
+    state = _state()
+    state.used_at = now = time.monotonic()
+    if state.catalog is None and not state.snapshot_checked and not force_refresh:
+        # Primera vez en esta instancia: se responde con el snapshot y se revalida aparte
+        state.snapshot_checked = True
+        snapshot = _load_snapshot(state.tenant)
+        if snapshot is not None:
+            state.catalog = snapshot
+            state.loaded_at = now
+            _spawn(_revalidate(state))
+            return snapshot
+    if force_refresh:
+        # Una descarga en curso pudo empezar antes del cambio que motiva la recarga
+        return await _fetch_catalog(state)
+    if state.catalog is None or now - state.loaded_at > CATALOG_TTL_SECONDS:
+        return await _refresh(state)
+    return state.catalog
+
+
+def cached_catalog() -> Optional[CatalogIndex]:
+    """Último catálogo cargado de la tienda actual aunque haya vencido el TTL (None si no hay)."""
+    return _state().catalog
+
+
+def invalidate_catalog() -> None:
+    """Fuerza la recarga en el próximo `get_catalog()` (tras cambios de stock/productos)."""
+    state = _state()
+    state.catalog = None
+    # El snapshot quedó desactualizado: no volver a usarlo en esta instancia
+    state.snapshot_checked = True
+
+
+async def _export(path: str, tenant_id: Optional[str] = None) -> None:
+    # Registra los textos de prompt que usa la conversación para incluirlos en el snapshot
+    import app.services.conversation  # noqa: F401
+    from app.core.tenants import get_tenant, use_tenant, default_tenant
+
+    tenant = get_tenant(tenant_id) if tenant_id else default_tenant()
+    if tenant is None:
+        raise SystemExit(f"Tienda desconocida: {tenant_id}")
+    with use_tenant(tenant):
+        # Los renderers pueden leer la tienda actual (current_tenant)
+        catalog = CatalogIndex(await get_all_products() or [])
+        catalog.prerender()
+    write_snapshot(catalog, path)
+    log.info("📦 Snapshot escrito en %s (%s productos, versión %s)", path, len(catalog.products), catalog.version)
+
+
+if __name__ == "__main__":
+    asyncio.run(_export(sys.argv[1] if len(sys.argv) > 1 else "catalog_snapshot.json", *sys.argv[2:3]))
@@ -0,0 +1,140 @@
+# app/services/catalog_prompt.py
+"""
+Codificación compacta del catálogo para los prompts.
+
+En vez del markdown con emojis y descripciones de `_build_detailed_catalog_for_llm_sales`,
+una línea por variante con un id corto:
+
+    id|producto|variante|precio|stock
+    P3F9A1C-7B2E|Ron Viejo de Caldas|750ml|42000|12
+    P3F9A1C-D410|Ron Viejo de Caldas|375ml|23000|0
+    P08E5D2|Cerveza Club Colombia|-|3500|48
+
+Los ids cortos salen del id real: P + los primeros 6 caracteres del id del
+producto y, para las variantes, un guion y los primeros 4 del id de la
+variante (se alargan sólo si dos chocan). No dependen de la posición, así que
+agregar o quitar productos no cambia los de los demás y un id que el LLM vio en
+un turno anterior sigue apuntando al mismo producto. El LLM puede usarlos en
+las operaciones del carrito ("id": "P3F9A1C-7B2E") y `short_id_map` los
+traduce a ids reales.
+
+`estimate_tokens` da un tamaño aproximado sin tokenizer, para comparar formatos.
+"""
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import PROMPT_CATALOG_INCLUDE_OUT_OF_STOCK
+from app.services.catalog import register_rendering, variant_text
+
+COMPACT_HEADER = "id|producto|variante|precio|stock"
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def _clean(value) -> str:
+    # El separador y los saltos de línea no pueden aparecer dentro de un campo
+    return str(value).replace("|", "/").replace("\n", " ").strip()
+
+
+def _number(value) -> str:
+    if value is None:
+        return "?"
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return _clean(value)
+    return str(int(number)) if number.is_integer() else f"{number:.2f}"
+
+
+def _sorted_products(products: List[Dict]) -> List[Dict]:
+    return sorted(products, key=lambda p: str(p.get("id")))
+
+
+_PRODUCT_ID_CHARS = 6
+_VARIANT_ID_CHARS = 4
+
+
+def _stable_prefixes(ids: List, size: int) -> Dict:
+    """id -> prefijo más corto (desde `size` caracteres) que no choca con el de otro id."""
+    keys = {i: re.sub(r"[^0-9A-Za-z]", "", str(i)).upper() or str(i) for i in ids}
+    prefixes = {}
+    pending = list(keys)
+    while pending:
+        groups: Dict[str, List] = {}
+        for i in pending:
+            groups.setdefault(keys[i][:size], []).append(i)
+        pending = []
+        for prefix, members in groups.items():
+            if len(members) == 1:
+                prefixes[members[0]] = prefix
+            elif all(len(keys[m]) <= size for m in members):
+                # Ids distintos que se normalizan igual ("a-b" y "ab"): no queda más que numerarlos
+                for n, m in enumerate(sorted(members, key=str), start=1):
+                    prefixes[m] = f"{prefix}{n}"
+            else:
+                pending.extend(members)
+        size += 1
+    return prefixes
+
+
+def _rows(products: List[Dict]):
+    """(id_corto, producto, variante|None) en orden estable."""
+    products = _sorted_products(products)
+    product_ids = _stable_prefixes([p["id"] for p in products], _PRODUCT_ID_CHARS)
+    for p in products:
+        short = f"P{product_ids[p['id']]}"
+        variants = sorted(p.get("product_variants") or [], key=lambda v: str(v.get("id")))
+        if not variants:
+            yield short, p, None
+        variant_ids = _stable_prefixes([v["id"] for v in variants], _VARIANT_ID_CHARS)
+        for v in variants:
+            yield f"{short}-{variant_ids[v['id']]}", p, v
+
+
+def short_id_map(products: List[Dict]) -> Dict[str, Tuple[str, Optional[str]]]:
+    """id corto -> (product_id, variant_id o None)."""
+    return {
+        short_id: (p["id"], v["id"] if v else None)
+        for short_id, p, v in _rows(products)
+    }
+
+
+def encode_catalog_compact(products: List[Dict], include_out_of_stock: bool = True) -> str:
+    """Una línea por variante (o por producto sin variantes); sin markdown ni descripciones."""
+    lines = [COMPACT_HEADER]
+    for short_id, p, v in _rows(products):
+        source = v if v and v.get("price") is not None else p
+        stock = (v or p).get("stock")
+        if not include_out_of_stock and stock is not None and stock <= 0:
+            continue
+        lines.append("|".join((
+            short_id,
+            _clean(p["name"]),
+            _clean(variant_text(v)) if v else "-",
+            _number(source.get("price")),
+            _number(stock),
+        )))
+    return "\n".join(lines)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Tokens aproximados sin tokenizer: cada palabra cuenta 1 token por cada 4
+    caracteres (redondeando hacia arriba), cada signo de puntuación 1 y cada
+    carácter fuera del plano básico (emojis) 2 más. Sirve para comparar formatos
+    entre sí, no para facturar.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        tokens += math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+    tokens += 2 * sum(1 for ch in text if ord(ch) > 0xFFFF)
+    return tokens
+
+
+register_rendering(
+    "sales_catalog_compact",
+    lambda products: encode_catalog_compact(products, PROMPT_CATALOG_INCLUDE_OUT_OF_STOCK),
+    settings=(PROMPT_CATALOG_INCLUDE_OUT_OF_STOCK,),
+)
+register_rendering("short_ids", short_id_map)
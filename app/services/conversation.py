@@ -1,35 +1,52 @@
 # app/services/conversation.py
 
+import asyncio
 from datetime import datetime
 import json
 import re
-import traceback
 from difflib import get_close_matches
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Set
 
-from app.utils.memory import user_histories
+from app.utils.memory import session_store, get_history, save_history
 from app.clients.gemini import ask_gemini_with_history
-from app.clients.whatsapp import send_whatsapp_message, send_whatsapp_image # ASUMO QUE YA SON ASYNC DEF
+from app.clients.whatsapp import send_whatsapp_message, send_whatsapp_image
 from app.services.supabase import save_message_to_supabase
-from app.services.products import get_all_products # get_recommended_products (se usará si es necesario)
-# from app.services.orders import process_order # La lógica de procesar orden se integra más con el LLM
-from app.utils.extractors import extract_order_data
+from app.services.catalog import CatalogIndex, variant_text, get_catalog, cached_catalog, register_rendering
+from app.services import catalog_prompt  # noqa: F401  (registra el catálogo compacto)
+from app.services.cart import (
+    apply_operations,
+    build_order,
+    cart_summary_text,
+    describe_missing_fields,
+    drop_unavailable_lines,
+    missing_customer_fields,
+    price_cart,
+)
+from app.services.orders import process_order
+from app.utils.memory import get_cart, save_cart, clear_cart
+from app.utils.extractors import extract_cart_operations
+from app.core.config import (
+    CONVERSATION_CATALOG_TIMEOUT_SECONDS,
+    CONVERSATION_REPLY_TIMEOUT_SECONDS,
+    SESSION_LOCK_TTL_SECONDS,
+)
+from app.core.tenants import current_tenant
+from app.core.metrics import span
+from app.core.stages import StageGraph
+from app.core.logger import get_logger
+
+log = get_logger("conversation")
 
 # --- Constantes y Configuraciones ---
-DEFAULT_SHIPPING_COST = 5000
-# Campos requeridos que el LLM debe obtener ANTES de generar el JSON de la orden.
-# El JSON de la orden tendrá más campos (productos, total, etc.)
-REQUIRED_USER_DATA_FOR_ORDER = ["name", "address", "phone", "payment_method"]
+# La respuesta debe terminar antes de que venza el bloqueo de la sesión (si su dueño dejara de renovarlo)
+_REPLY_TIMEOUT_SECONDS = min(CONVERSATION_REPLY_TIMEOUT_SECONDS, SESSION_LOCK_TTL_SECONDS * 0.8)
 
 
 # --- Funciones Auxiliares de Productos y Catálogo ---
 
 def _get_product_variant_text(variant: Dict) -> str:
     """Genera un texto descriptivo para una variante (ej: 'Amarillo, 750ml')."""
-    options_parts = []
-    for key, value in variant.get("options", {}).items():
-        options_parts.append(str(value))
-    return ", ".join(options_parts) if options_parts else "Estándar"
+    return variant_text(variant)
 
 def _find_product_in_list(products: List[Dict], query_name: str) -> Optional[Dict]:
     """Encuentra un producto por nombre (exacto o aproximado)."""
@@ -121,10 +138,16 @@ def _build_detailed_catalog_for_llm_sales(products: List[Dict]) -> str:
     return "\n\n".join(lines)
 
 
+# Se calculan una vez por versión del catálogo y viajan en el snapshot en disco
+register_rendering("image_detection_summary", _build_simplified_catalog_for_llm_image_detection)
+register_rendering("sales_catalog", _build_detailed_catalog_for_llm_sales)
+
+
 # --- Funciones de Interacción con LLM y Envío ---
 
 async def _get_llm_image_intent(
-    user_history: List[Dict], current_user_message: str, catalog_summary: List[Dict]
+    user_history: List[Dict], current_user_message: str, catalog_summary: List[Dict],
+    from_number: Optional[str] = None,
 ) -> Optional[Dict]:
     """Determina si el usuario quiere imágenes y de qué, usando el LLM."""
     prompt_instructions = [
@@ -158,8 +181,10 @@ async def _get_llm_image_intent(
     ]
 
     try:
-        llm_response_str = await ask_gemini_with_history(llm_prompt_messages)
-        print(f"🧠 Respuesta LLM (intención imagen): {llm_response_str}")
+        llm_response_str = await ask_gemini_with_history(
+            llm_prompt_messages, purpose="image_intent", conversation_id=from_number
+        )
+        log.debug("🧠 Respuesta LLM (intención imagen): %s", llm_response_str)
         
         # Extraer el JSON de la respuesta (Gemini a veces añade ```json ... ```)
         match = re.search(r"\{[\s\S]*\}", llm_response_str)
@@ -168,9 +193,9 @@ async def _get_llm_image_intent(
             if action_json.get("action") == "show_image" and action_json.get("product_name"):
                 return action_json
     except json.JSONDecodeError:
-        print(f"⚠️ Error decodificando JSON de LLM para intención de imagen: {llm_response_str}")
+        log.warning("⚠️ Error decodificando JSON de LLM para intención de imagen: %s", llm_response_str)
     except Exception as e:
-        print(f"⚠️ Error en _get_llm_image_intent: {e}\n{traceback.format_exc()}")
+        log.warning("⚠️ Error en _get_llm_image_intent: %s", e, exc_info=True)
     return None
 
 
@@ -198,7 +223,7 @@ async def _send_requested_images(
 
                 await send_whatsapp_image(from_number, url, caption=caption)
             except Exception as e_img:
-                print(f"❌ Error enviando imagen {url} para {from_number}: {e_img}")
+                log.error("❌ Error enviando imagen %s para %s: %s", url, from_number, e_img)
                 await send_whatsapp_message(from_number, "⚠️ Hubo un problema al enviar una de las imágenes, pero aquí están las otras (si hay).")
         response_text = f"Envié imágenes de {product_display_name}." # Para el historial interno
 
@@ -206,45 +231,52 @@ async def _send_requested_images(
     await save_message_to_supabase(from_number, "model", response_text) # Guardar la acción en Supabase
 
 
-async def _handle_sales_conversation_with_llm(
+def _build_sales_prompt(
     from_number: str,
     user_message_text: str,
     user_history: List[Dict],
-    all_products: List[Dict]
-):
-    """Maneja el flujo de ventas principal usando el LLM."""
-    
-    catalog_context_for_llm = _build_detailed_catalog_for_llm_sales(all_products)
+    catalog: CatalogIndex,
+    cart: Dict,
+    catalog_format: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Mensajes para el LLM vendedor: historial reciente + instrucciones, carrito y catálogo.
+    El formato del catálogo y el nombre del asistente son los de la tienda actual.
+    """
+    tenant = current_tenant()
+    compact = (catalog_format or tenant.catalog_format) == "compact"
+    if compact:
+        catalog_context_for_llm = (
+            "(una línea por variante: id|producto|variante|precio|stock; precios en COP)\n"
+            + catalog.rendered("sales_catalog_compact")
+        )
+        item_ref = "\"id\":\"<ID>\""
+    else:
+        catalog_context_for_llm = catalog.rendered("sales_catalog")
+        item_ref = "\"product\":\"<NOMBRE>\",\"variant\":\"<VARIANTE o null>\""
+    priced_cart = price_cart(cart, catalog)
+    missing_fields = missing_customer_fields(cart, from_number)
 
-    # Instrucciones detalladas para el LLM vendedor
+    # Instrucciones para el LLM vendedor: conversa y emite operaciones; no calcula precios
     sales_instructions = [
-        "Eres 'Vendebot 🤖', un asistente de ventas virtual amigable, proactivo y muy eficiente. Tu objetivo es ayudar al cliente y cerrar ventas.",
+        f"Eres '{tenant.assistant_name}', un asistente de ventas virtual de {tenant.store_name}, amigable, proactivo y muy eficiente. Tu objetivo es ayudar al cliente y cerrar ventas.",
         "Usa emojis para hacer la conversación más cercana y humana. 😊🛒🍾",
         "**TU PROCESO DE VENTA:**",
         "1.  **Saludo y Escucha Activa**: Responde al usuario amablemente. Si hace preguntas sobre productos, usa la información del catálogo proporcionado.",
-        "2.  **Identificar Intención de Compra**: Si el usuario expresa deseo de comprar ('quiero X', 'me interesa Y', 'cuánto por Z'):",
-        "    a.  Ayuda a armar el carrito: Confirma producto(s), variante(s) y cantidad(es).",
-        "    b.  Calcula el subtotal de los productos.",
-        f"    c.  Informa sobre el costo de envío fijo: COP {DEFAULT_SHIPPING_COST:,.0f}.",
-        "    d.  Presenta el TOTAL del pedido (subtotal + envío).",
-        "    e.  PREGUNTA SIEMPRE: '¿Deseas agregar algo más a tu pedido?' Puedes sugerir UN producto complementario de forma sutil si es relevante.",
-        "3.  **Recopilación de Datos (SIEMPRE DESPUÉS DE CONFIRMAR EL CARRITO Y QUE NO QUIERE MÁS PRODUCTOS)**:",
-        "    Cuando el usuario confirme que está listo para finalizar o diga 'no quiero nada más', PIDE DE FORMA CLARA Y ORDENADA los siguientes datos para el envío:",
-        "      - Nombre completo.",
-        "      - Dirección de entrega detallada (incluyendo barrio/ciudad).",
-        "      - Número de teléfono de contacto (si es diferente al de WhatsApp).",
-        "      - Método de pago (ej: 'Efectivo contra entrega', 'Transferencia Bancolombia', 'Nequi').",
-        "    *NO ASUMAS NINGÚN DATO. PÍDELOS EXPLÍCITAMENTE.*",
-        "4.  **Confirmación Final y JSON del Pedido (SOLO CUANDO TENGAS TODOS LOS DATOS DEL PUNTO 3 Y EL CARRITO ESTÉ DEFINIDO)**:",
-        "    a.  Resume el pedido completo: productos (con variante y cantidad), subtotal, envío, total, y los datos de entrega del usuario.",
-        "    b.  Pide una última confirmación: '¿Es todo correcto para procesar tu pedido?'",
-        "    c.  Si el usuario confirma, AÑADE AL FINAL DE TU MENSAJE DE CONFIRMACIÓN el siguiente bloque JSON EXACTO, rellenando los campos. NO incluyas el JSON si faltan datos o si el usuario no ha confirmado.",
-        "        ```json",
-        "        {\"order_details\":{\"name\":\"<NOMBRE_COMPLETO>\",\"address\":\"<DIRECCION_DETALLADA>\",\"phone\":\"<TELEFONO_CONTACTO>\",\"payment_method\":\"<METODO_PAGO>\",\"products\":[{\"name\":\"<NOMBRE_PROD_1>\",\"variant_text\":\"<TEXTO_VARIANTE_1 (si aplica)>\",\"quantity\":<CANT_1>,\"price_unit\":<PRECIO_UNIT_1>}, ...otros_productos],\"subtotal_products\":<SUBTOTAL_PRODS>,\"shipping_cost\":<COSTO_ENVIO>,\"total_order\":<TOTAL_PEDIDO>}}",
-        "        ```",
-        "5.  **Manejo de Stock**: Si un producto/variante está agotado o con bajo stock según el catálogo, informa y sugiere alternativas.",
-        "6.  **Preguntas Generales**: Si no hay intención de compra, solo responde preguntas usando el catálogo.",
-        "7.  **Claridad**: Si no entiendes algo, pide amablemente una aclaración.",
+        "2.  **Carrito**: Cuando el usuario quiera comprar, quitar o cambiar cantidades, registra el cambio con operaciones de carrito. NO calcules subtotales ni totales: el sistema añade el resumen con precios a tu mensaje.",
+        "    Después de un cambio pregunta: '¿Deseas agregar algo más a tu pedido?' Puedes sugerir UN producto complementario si es relevante.",
+        "3.  **Datos de envío**: Cuando el usuario diga que no quiere nada más, pide los datos que falten (nombre completo, dirección detallada con barrio/ciudad, teléfono si es distinto al de WhatsApp, método de pago). Registra cada dato que te dé con set_customer_field. NO ASUMAS NINGÚN DATO.",
+        "4.  **Confirmación**: Cuando el carrito y los datos estén completos, pide confirmación. Sólo si el usuario confirma, emite la operación checkout.",
+        "5.  **Stock**: Si un producto está agotado según el catálogo, dilo y sugiere alternativas.",
+        "6.  **Claridad**: Si no entiendes algo, pide amablemente una aclaración.",
+        "**OPERACIONES DE CARRITO** (sólo si hay cambios; al FINAL del mensaje, una sola línea):",
+        f"{{\"cart_ops\":[{{\"op\":\"add\",{item_ref},\"quantity\":<N>}},"
+        f"{{\"op\":\"remove\",{item_ref}}},"
+        f"{{\"op\":\"set_quantity\",{item_ref},\"quantity\":<N>}},"
+        "{\"op\":\"set_customer_field\",\"field\":\"name|address|phone|payment_method\",\"value\":\"<VALOR>\"},"
+        "{\"op\":\"checkout\"}]}",
+        f"**Carrito actual:**\n{cart_summary_text(priced_cart)}",
+        f"**Datos del cliente que faltan:** {describe_missing_fields(missing_fields) or 'ninguno'}",
         "**Catálogo de Referencia:**",
         catalog_context_for_llm,
         "\n**Historial de Conversación Reciente:**"
@@ -252,41 +284,208 @@ async def _handle_sales_conversation_with_llm(
 
     # El prompt para Gemini debe ser una lista de mensajes
     relevant_history = [m for m in user_history if m["role"] in ("user", "model")][-10:]
-    llm_prompt_messages = relevant_history + [
+    return relevant_history + [
         {"role": "user", "text": user_message_text + "\n\n" + "\n".join(sales_instructions)}
     ]
-    
-    llm_response_str = await ask_gemini_with_history(llm_prompt_messages)
-    print(f"🧠 Respuesta LLM (ventas): {llm_response_str}")
 
-    # `extract_order_data` debe manejar la separación del JSON y el texto limpio.
-    # También debe validar que el `order_data` (si existe) sea completo.
-    order_data, clean_bot_response = extract_order_data(llm_response_str, DEFAULT_SHIPPING_COST)
 
-    if not clean_bot_response and not order_data: # Si LLM no da respuesta usable
-        clean_bot_response = "Hmm, no estoy seguro de cómo responder a eso. ¿Podrías intentarlo de otra manera? 🤔"
+async def _handle_sales_conversation_with_llm(
+    from_number: str,
+    user_message_text: str,
+    user_history: List[Dict],
+    catalog: CatalogIndex,
+):
+    """Maneja el flujo de ventas principal usando el LLM; el carrito y los totales se calculan aquí."""
+    cart = await get_cart(from_number)
+    # Productos que salieron del catálogo: se quitan ya (y se avisa una vez) para no bloquear el checkout
+    extra_parts: List[str] = drop_unavailable_lines(cart, catalog)
+    if extra_parts:
+        await save_cart(from_number, cart)
+    llm_prompt_messages = _build_sales_prompt(from_number, user_message_text, user_history, catalog, cart)
     
-    if clean_bot_response:
-        await send_whatsapp_message(from_number, clean_bot_response)
-        user_history.append({"role": "model", "text": clean_bot_response, "time": datetime.utcnow().isoformat()})
-        await save_message_to_supabase(from_number, "model", clean_bot_response)
-
-    if order_data:
-        print(f"📦 Datos de orden extraídos y listos para guardar: {json.dumps(order_data, indent=2)}")
-        # Aquí es donde guardarías `order_data` en tu tabla de pedidos de Supabase.
-        # Ejemplo: await save_order_to_supabase_orders_table(from_number, order_data)
-        # El mensaje de "pedido procesado" ya debería haberlo dado el LLM como parte de `clean_bot_response`
-        # si siguió las instrucciones de incluir el JSON *después* de la confirmación verbal.
-        # Si no, puedes enviar un mensaje de confirmación genérico adicional aquí.
-        # await send_whatsapp_message(from_number, "✅ ¡Tu pedido ha sido registrado con éxito! Gracias por tu compra. 🎉")
-    else:
-        # Esto significa que el LLM está en una etapa de la conversación que no implica un pedido finalizado.
-        # (ej: pidiendo datos, confirmando carrito, etc.)
-        print("ℹ️ No se extrajeron datos de orden finalizados en esta interacción.")
+    llm_response_str = await ask_gemini_with_history(
+        llm_prompt_messages, purpose="sales", conversation_id=from_number
+    )
+    log.debug("🧠 Respuesta LLM (ventas): %s", llm_response_str)
+
+    cart_ops, clean_bot_response = extract_cart_operations(llm_response_str)
+    if cart_ops:
+        log.debug("🛒 Operaciones de carrito: %s", cart_ops)
+        checkout, problems = apply_operations(cart, cart_ops, catalog)
+        extra_parts.extend(problems)
+        if checkout:
+            extra_parts.extend(await _checkout(from_number, cart, catalog))
+        else:
+            await save_cart(from_number, cart)
+            if any(op.get("op") in ("add", "remove", "set_quantity") for op in cart_ops if isinstance(op, dict)):
+                priced_cart = price_cart(cart, catalog)
+                extra_parts.append(cart_summary_text(priced_cart))
+                extra_parts.extend(priced_cart["issues"])
+
+    reply = "\n\n".join(part for part in [clean_bot_response, *extra_parts] if part)
+    if not reply: # Si LLM no da respuesta usable
+        reply = "Hmm, no estoy seguro de cómo responder a eso. ¿Podrías intentarlo de otra manera? 🤔"
+
+    await send_whatsapp_message(from_number, reply)
+    user_history.append({"role": "model", "text": reply, "time": datetime.utcnow().isoformat()})
+    await save_message_to_supabase(from_number, "model", reply)
+
+
+async def _checkout(from_number: str, cart: Dict, catalog: CatalogIndex) -> List[str]:
+    """Valida el carrito, registra el pedido y devuelve los textos a añadir a la respuesta."""
+    order_data, problems = build_order(cart, catalog, from_number)
+    await save_cart(from_number, cart)
+    if not order_data:
+        return ["No pude confirmar el pedido todavía:", *problems]
+
+    log.info("📦 Pedido validado, procesando: %s", order_data)
+    # Registrar el pedido (y descontar stock) y vaciar el carrito van juntos: si se vence el
+    # tiempo de la respuesta en medio, se termina igual antes de soltar la sesión; si no, el
+    # próximo "confirmo" volvería a crear o actualizar el pedido
+    commit = asyncio.ensure_future(_commit_order(from_number, order_data))
+    try:
+        result = await asyncio.shield(commit)
+    except asyncio.CancelledError:
+        await commit
+        raise
+    if result["status"] in ("created", "updated"):
+        priced_cart = price_cart(cart, catalog)
+        # Líneas que el descuento de stock rechazó (sin stock o ya fuera del catálogo)
+        failed = [line.get("name") or "un producto" for line in result.get("stock") or [] if not line.get("ok")]
+        if failed:
+            return [
+                cart_summary_text(priced_cart),
+                f"⚠️ Registré tu pedido, pero no hay stock suficiente de: {', '.join(failed)}. "
+                "Te contactaremos para confirmar esas unidades.",
+            ]
+        return [
+            cart_summary_text(priced_cart),
+            "✅ ¡Tu pedido ha sido registrado con éxito! Gracias por tu compra. 🎉",
+        ]
+    if result["status"] == "missing":
+        return [f"Me falta: {describe_missing_fields(result['fields'])}."]
+    return ["⚠️ No pude registrar tu pedido en este momento. Inténtalo de nuevo en unos minutos, por favor."]
+
+
+async def _commit_order(from_number: str, order_data: Dict) -> Dict:
+    result = await process_order(from_number, order_data)
+    if result["status"] in ("created", "updated"):
+        await clear_cart(from_number)
+    return result
 
 
 # --- Handler Principal de Mensajes de Usuario ---
 
+_INBOUND_SAVE_ATTEMPTS = 3
+# Guardados de mensajes entrantes en curso (referencia fuerte hasta que terminan)
+_inbound_saves: Set[asyncio.Task] = set()
+
+
+async def _save_inbound_message(from_number: str, user_text: str) -> None:
+    """Guarda el mensaje del cliente con reintentos; nunca se cancela por el turno."""
+    for attempt in range(1, _INBOUND_SAVE_ATTEMPTS + 1):
+        try:
+            if await save_message_to_supabase(from_number, "user", user_text):
+                return
+        except Exception as e:
+            log.warning("⚠️ Error guardando el mensaje de %s (intento %s): %s", from_number, attempt, e)
+        if attempt < _INBOUND_SAVE_ATTEMPTS:
+            await asyncio.sleep(2 ** attempt)
+    log.error("❌ No se pudo guardar el mensaje de %s tras %s intentos", from_number, _INBOUND_SAVE_ATTEMPTS)
+
+
+def _spawn_inbound_save(from_number: str, user_text: str) -> None:
+    task = asyncio.create_task(_save_inbound_message(from_number, user_text))
+    _inbound_saves.add(task)
+    task.add_done_callback(_inbound_saves.discard)
+
+
+async def drain_inbound_saves() -> None:
+    """Espera los guardados de mensajes entrantes pendientes (al apagar)."""
+    if _inbound_saves:
+        await asyncio.gather(*_inbound_saves, return_exceptions=True)
+
+
+async def _handle_user_turn(from_number: str, user_text: str):
+    """
+    Procesa un mensaje de texto del usuario como un grafo de etapas: historial y
+    catálogo no dependen entre sí y se cargan a la vez; la respuesta espera sólo a
+    ellos. El mensaje entrante se guarda aparte, en segundo plano y con reintentos,
+    sin que el turno lo espere ni lo cancele.
+    """
+    async def hydrate_history() -> List[Dict]:
+        user_history = await get_history(from_number)
+        user_history.append({"role": "user", "text": user_text, "time": datetime.utcnow().isoformat()})
+        return user_history
+
+    async def reply(history: List[Dict], load_catalog: Optional[CatalogIndex]):
+        try:
+            await _reply_to_user(from_number, user_text, history, load_catalog)
+        finally:
+            await save_history(from_number, history)
+
+    _spawn_inbound_save(from_number, user_text)
+
+    graph = StageGraph("conversation")
+    graph.add("history", hydrate_history)
+    # Si Supabase no responde a tiempo se usa el último catálogo cargado, aunque haya vencido
+    graph.add("load_catalog", get_catalog, timeout=CONVERSATION_CATALOG_TIMEOUT_SECONDS,
+              fallback=lambda e: cached_catalog())
+    graph.add("reply", reply, after=("history", "load_catalog"), timeout=_REPLY_TIMEOUT_SECONDS)
+    await graph.run()
+
+
+async def _reply_to_user(from_number: str, user_text: str, user_history: List[Dict], catalog: Optional[CatalogIndex]):
+    """Respuesta al mensaje (imágenes y/o flujo de ventas); `user_history` ya incluye el mensaje."""
+    all_products = catalog.products if catalog is not None else []
+    if not all_products:
+        await send_whatsapp_message(from_number, "⚠️ Lo siento, estoy teniendo problemas para acceder a nuestro catálogo. Intenta más tarde.")
+        return
+
+    # 1. Comprobar si el usuario está pidiendo imágenes
+    with span("conversation.image_intent"):
+        catalog_summary_for_img_detection = catalog.rendered("image_detection_summary")
+        image_intent_details = await _get_llm_image_intent(
+            user_history, user_text, catalog_summary_for_img_detection, from_number
+        )
+
+    image_request_handled_successfully = False
+    if image_intent_details and image_intent_details.get("action") == "show_image":
+        product_name = image_intent_details.get("product_name")
+        variant_text = image_intent_details.get("variant_text")
+        
+        found_product = _find_product_in_list(all_products, product_name)
+        found_variant = None
+        if found_product and variant_text:
+            found_variant = _find_variant_in_product(found_product, variant_text)
+        
+        if found_product:
+            with span("conversation.send_images"):
+                await _send_requested_images(from_number, found_product, found_variant, user_history)
+            image_request_handled_successfully = True # Indica que se gestionó una solicitud de imagen (incluso si no se encontraron)
+            # El flujo continuará, y el LLM de ventas tendrá el contexto de que se enviaron imágenes.
+            # Se podría añadir un mensaje tipo: "¿Te gustaría añadirlo al carrito o tienes más preguntas sobre este producto?"
+            # await send_whatsapp_message(from_number, "¿Te gustaría añadir este producto al carrito o tienes más preguntas? 😊")
+            # return # Si queremos detener el flujo aquí y esperar nueva respuesta del usuario.
+            # Por ahora, dejaremos que el flujo continúe al LLM de ventas.
+        else:
+            no_product_msg = f"Hmm, mencionaste '{product_name}' pero no lo encuentro en nuestro catálogo. ¿Podrías verificar el nombre? 🤔"
+            await send_whatsapp_message(from_number, no_product_msg)
+            user_history.append({"role": "model", "text": no_product_msg, "time": datetime.utcnow().isoformat()})
+            await save_message_to_supabase(from_number, "model", no_product_msg)
+            image_request_handled_successfully = True # Se intentó manejar
+    
+    # 2. Continuar con el flujo de ventas/conversación general.
+    # El LLM de ventas recibirá el mensaje original del usuario y el historial actualizado (que puede incluir la interacción de imágenes).
+    with span("conversation.sales_llm"):
+        await _handle_sales_conversation_with_llm(
+            from_number,
+            user_text, # El mensaje original del usuario para que el LLM de ventas lo procese.
+            user_history,
+            catalog,
+        )
+
+
 async def handle_user_message(body: dict):
     try:
         entry = body.get("entry", [{}])[0]
@@ -294,72 +493,28 @@ async def handle_user_message(body: dict):
         message_obj = changes.get("value", {}).get("messages", [{}])[0]
 
         if message_obj.get("type") != "text": # Ignorar estados, multimedia del usuario, etc.
-            print(f"ℹ️ Mensaje no textual recibido (tipo: {message_obj.get('type')}). Ignorando.")
+            log.debug("ℹ️ Mensaje no textual recibido (tipo: %s). Ignorando.", message_obj.get('type'))
             return
 
         user_text = message_obj.get("text", {}).get("body", "").strip()
         from_number = message_obj.get("from")
 
         if not user_text or not from_number:
-            print("⚠️ Mensaje vacío o sin remitente. Ignorando.")
+            log.debug("⚠️ Mensaje vacío o sin remitente. Ignorando.")
             return
 
-        print(f"💬 Mensaje de {from_number}: '{user_text}'")
+        log.info("💬 Mensaje de %s: '%s'", from_number, user_text)
 
-        # Inicializar/recuperar historial
-        user_history = user_histories.setdefault(from_number, [])
-        user_history.append({"role": "user", "text": user_text, "time": datetime.utcnow().isoformat()})
-        await save_message_to_supabase(from_number, "user", user_text)
-
-        all_products = await get_all_products()
-        if not all_products:
-            await send_whatsapp_message(from_number, "⚠️ Lo siento, estoy teniendo problemas para acceder a nuestro catálogo. Intenta más tarde.")
-            return
-
-        # 1. Comprobar si el usuario está pidiendo imágenes
-        catalog_summary_for_img_detection = _build_simplified_catalog_for_llm_image_detection(all_products)
-        image_intent_details = await _get_llm_image_intent(user_history, user_text, catalog_summary_for_img_detection)
-
-        image_request_handled_successfully = False
-        if image_intent_details and image_intent_details.get("action") == "show_image":
-            product_name = image_intent_details.get("product_name")
-            variant_text = image_intent_details.get("variant_text")
-            
-            found_product = _find_product_in_list(all_products, product_name)
-            found_variant = None
-            if found_product and variant_text:
-                found_variant = _find_variant_in_product(found_product, variant_text)
-            
-            if found_product:
-                await _send_requested_images(from_number, found_product, found_variant, user_history)
-                image_request_handled_successfully = True # Indica que se gestionó una solicitud de imagen (incluso si no se encontraron)
-                # El flujo continuará, y el LLM de ventas tendrá el contexto de que se enviaron imágenes.
-                # Se podría añadir un mensaje tipo: "¿Te gustaría añadirlo al carrito o tienes más preguntas sobre este producto?"
-                # await send_whatsapp_message(from_number, "¿Te gustaría añadir este producto al carrito o tienes más preguntas? 😊")
-                # return # Si queremos detener el flujo aquí y esperar nueva respuesta del usuario.
-                # Por ahora, dejaremos que el flujo continúe al LLM de ventas.
-            else:
-                no_product_msg = f"Hmm, mencionaste '{product_name}' pero no lo encuentro en nuestro catálogo. ¿Podrías verificar el nombre? 🤔"
-                await send_whatsapp_message(from_number, no_product_msg)
-                user_history.append({"role": "model", "text": no_product_msg, "time": datetime.utcnow().isoformat()})
-                await save_message_to_supabase(from_number, "model", no_product_msg)
-                image_request_handled_successfully = True # Se intentó manejar
-        
-        # 2. Continuar con el flujo de ventas/conversación general.
-        # El LLM de ventas recibirá el mensaje original del usuario y el historial actualizado (que puede incluir la interacción de imágenes).
-        await _handle_sales_conversation_with_llm(
-            from_number,
-            user_text, # El mensaje original del usuario para que el LLM de ventas lo procese.
-            user_history,
-            all_products
-        )
+        # Un solo mensaje por usuario a la vez, aunque lleguen a workers distintos
+        async with session_store.lock(from_number):
+            with span("conversation.turn"):
+                await _handle_user_turn(from_number, user_text)
 
     except Exception as e:
-        error_message = f"❌ [ERROR CRÍTICO en handle_user_message]: {e}\n{traceback.format_exc()}"
-        print(error_message)
+        log.error("❌ [ERROR CRÍTICO en handle_user_message]: %s", e, exc_info=True)
         # Intentar notificar al usuario del error si es posible
         if 'from_number' in locals() and from_number:
             try:
                 await send_whatsapp_message(from_number, "🤖 ¡Ups! Algo no salió bien de mi lado. Por favor, inténtalo de nuevo en un momento. 🙏")
             except Exception as e_send:
-                print(f"💣 [FALLO AL ENVIAR MENSAJE DE ERROR AL USUARIO]: {e_send}")
\ No newline at end of file
+                log.error("💣 [FALLO AL ENVIAR MENSAJE DE ERROR AL USUARIO]: %s", e_send)
\ No newline at end of file
@@ -0,0 +1,271 @@
+# app/services/delivery_status.py
+"""
+Estado de entrega de los mensajes enviados, armado con los callbacks `statuses`
+del webhook (sent, delivered, read, failed).
+
+La mayoría del tráfico del webhook son estos callbacks, así que el camino es
+mínimo: `record_statuses` sólo actualiza diccionarios en memoria (sin I/O) y el
+webhook responde enseguida, sin pasar por la conversación.
+
+- Por mensaje (wamid) se guarda el estado más avanzado visto: sent < delivered <
+  read, y failed gana siempre. Los callbacks repetidos o que llegan en desorden no
+  lo hacen retroceder.
+- Por tienda se cuentan los mensajes que llegaron a cada estado y las fallas por
+  código de error de WhatsApp (ver `delivery_summary`).
+- Los cambios se escriben en Supabase por lotes (RPC `upsert_message_statuses`,
+  ver supabase/message_statuses.sql) cada DELIVERY_FLUSH_SECONDS o apenas se
+  juntan DELIVERY_FLUSH_BATCH; si el envío falla se conservan para el siguiente.
+  En serverless (DELIVERY_BACKGROUND_FLUSH apagado) no hay tarea de fondo: el
+  webhook llama `flush_statuses(tenant)` antes de responder, y /campaigns/tick
+  reintenta lo que haya quedado pendiente en la instancia.
+"""
+import asyncio
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from app.clients.http import get_http_client
+from app.core.config import (
+    DELIVERY_BACKGROUND_FLUSH,
+    DELIVERY_FLUSH_SECONDS,
+    DELIVERY_FLUSH_BATCH,
+    DELIVERY_STATES_KEPT,
+)
+from app.core.logger import get_logger
+from app.core.metrics import Counter, register, span
+from app.core.tenants import Tenant, current_tenant, get_tenant, supabase_url, supabase_headers, use_tenant
+
+log = get_logger("delivery_status")
+
+WHATSAPP_STATUSES = register(Counter(
+    "chatbot_whatsapp_statuses_total", "Callbacks de estado de WhatsApp por estado", labels=("status",),
+))
+WHATSAPP_DELIVERY_FAILURES = register(Counter(
+    "chatbot_whatsapp_delivery_failures_total", "Mensajes que WhatsApp no pudo entregar, por código de error",
+    labels=("code",),
+))
+
+_RANK = {"sent": 1, "delivered": 2, "read": 3, "failed": 4}
+# Cambios sin escribir que se aguantan si Supabase no responde; pasado eso se descartan los más viejos
+_MAX_PENDING = 50_000
+# Del estado detallado sólo se guardan los DELIVERY_STATES_KEPT más recientes, pero el rango
+# (un int por wamid) dura mucho más: así un callback repetido de un mensaje ya olvidado no
+# vuelve a contarse en `by_status`
+_RANKS_KEPT = DELIVERY_STATES_KEPT * 10
+
+
+def _status_at(timestamp) -> Optional[str]:
+    try:
+        return datetime.fromtimestamp(int(timestamp), tz=timezone.utc).isoformat()
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+class DeliveryStats:
+    def __init__(self):
+        self.states: "OrderedDict[str, dict]" = OrderedDict()
+        self.ranks: "OrderedDict[str, int]" = OrderedDict()
+        self.pending: Dict[str, dict] = {}
+        self.by_status: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, dict] = {}
+        self.callbacks = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.flush_errors = 0
+        self.flushed_at: Optional[float] = None
+
+    def record(self, status: dict) -> bool:
+        """Aplica un callback; True si hizo avanzar el estado del mensaje."""
+        self.callbacks += 1
+        message_id, value = status.get("id"), status.get("status")
+        rank = _RANK.get(value)
+        if not message_id or rank is None:
+            return False
+        WHATSAPP_STATUSES.inc(status=value)
+        current = self.states.get(message_id)
+        if self.ranks.get(message_id, 0) >= rank:
+            self.duplicates += 1
+            return False
+
+        state = {
+            "message_id": message_id,
+            "recipient": status.get("recipient_id") or (current or {}).get("recipient"),
+            "status": value,
+            "status_at": _status_at(status.get("timestamp")),
+            "error_code": None,
+            "error_title": None,
+        }
+        if value == "failed":
+            error = (status.get("errors") or [{}])[0] or {}
+            code = str(error.get("code") or "unknown")
+            state["error_code"] = error.get("code")
+            state["error_title"] = error.get("title") or error.get("message")
+            failure = self.failures.setdefault(code, {"count": 0, "title": state["error_title"]})
+            failure["count"] += 1
+            WHATSAPP_DELIVERY_FAILURES.inc(code=code)
+        self.by_status[value] += 1
+
+        self.states[message_id] = state
+        self.states.move_to_end(message_id)
+        while len(self.states) > DELIVERY_STATES_KEPT:
+            self.states.popitem(last=False)
+        self.ranks[message_id] = rank
+        self.ranks.move_to_end(message_id)
+        while len(self.ranks) > _RANKS_KEPT:
+            self.ranks.popitem(last=False)
+        self.pending[message_id] = state
+        if len(self.pending) > _MAX_PENDING:
+            self.pending.pop(next(iter(self.pending)))
+            self.dropped += 1
+        return True
+
+    def take_batch(self) -> List[dict]:
+        batch = list(self.pending.values())[:DELIVERY_FLUSH_BATCH]
+        for item in batch:
+            del self.pending[item["message_id"]]
+        return batch
+
+    def restore(self, batch: List[dict]) -> None:
+        """Devuelve a pendientes un lote que no se pudo escribir (salvo lo que ya avanzó)."""
+        for item in batch:
+            newer = self.pending.get(item["message_id"])
+            if newer is None or _RANK[newer["status"]] < _RANK[item["status"]]:
+                self.pending[item["message_id"]] = item
+
+    def summary(self) -> dict:
+        return {
+            "callbacks": self.callbacks,
+            "duplicates": self.duplicates,
+            "by_status": dict(self.by_status),
+            "failures": dict(sorted(self.failures.items(), key=lambda kv: -kv[1]["count"])),
+            "tracked_messages": len(self.states),
+            "pending_flush": len(self.pending),
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors,
+            "dropped": self.dropped,
+            "flushed_at": self.flushed_at,
+        }
+
+
+_stats: Dict[str, DeliveryStats] = {}
+_flush_task: Optional[asyncio.Task] = None
+_wake: Optional[asyncio.Event] = None
+
+
+def _stats_for(tenant: Tenant) -> DeliveryStats:
+    stats = _stats.get(tenant.id)
+    if stats is None:
+        stats = _stats[tenant.id] = DeliveryStats()
+    return stats
+
+
+def webhook_statuses(body: dict) -> List[dict]:
+    """Callbacks `statuses` de todas las entradas del webhook."""
+    statuses = []
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            statuses.extend((change.get("value") or {}).get("statuses") or [])
+    return statuses
+
+
+def has_messages(body: dict) -> bool:
+    """True si el webhook trae mensajes de clientes (lo único que necesita la conversación)."""
+    return any(
+        (change.get("value") or {}).get("messages")
+        for entry in body.get("entry") or []
+        for change in entry.get("changes") or []
+    )
+
+
+def record_statuses(statuses: List[dict], tenant: Optional[Tenant] = None) -> int:
+    """
+    Agrega los callbacks en memoria y programa su escritura (sin DELIVERY_BACKGROUND_FLUSH
+    la escritura queda a cargo de quien llama). Devuelve cuántos cambiaron algo.
+    """
+    stats = _stats_for(tenant or current_tenant())
+    changed = sum(1 for status in statuses if isinstance(status, dict) and stats.record(status))
+    if changed and DELIVERY_BACKGROUND_FLUSH:
+        _ensure_flusher()
+        if len(stats.pending) >= DELIVERY_FLUSH_BATCH:
+            _wake.set()
+    return changed
+
+
+def _ensure_flusher() -> None:
+    global _flush_task, _wake
+    if _flush_task is None or _flush_task.done():
+        _wake = asyncio.Event()
+        _flush_task = asyncio.create_task(_flush_loop())
+
+
+async def _flush_loop() -> None:
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=DELIVERY_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        await flush_statuses()
+
+
+async def _flush_tenant(tenant: Tenant, stats: DeliveryStats) -> int:
+    written = 0
+    with use_tenant(tenant):
+        while stats.pending:
+            batch = stats.take_batch()
+            try:
+                with span("delivery.flush"):
+                    resp = await get_http_client().post(
+                        f"{supabase_url()}/rest/v1/rpc/upsert_message_statuses",
+                        headers=supabase_headers(), json={"items": batch},
+                    )
+                    resp.raise_for_status()
+            except asyncio.CancelledError:
+                stats.restore(batch)
+                raise
+            except Exception as e:
+                stats.restore(batch)
+                stats.flush_errors += 1
+                log.warning("⚠️ No se pudo guardar el estado de %s mensajes (%s): %s", len(batch), tenant.id, e)
+                break
+            written += len(batch)
+            stats.flushed += len(batch)
+            stats.flushed_at = time.time()
+    return written
+
+
+async def flush_statuses(tenant: Optional[Tenant] = None) -> int:
+    """Escribe en Supabase los cambios pendientes de `tenant` (o de todas las tiendas)."""
+    written = 0
+    tenant_ids = [tenant.id] if tenant is not None else list(_stats)
+    for tenant_id in tenant_ids:
+        stats, owner = _stats.get(tenant_id), get_tenant(tenant_id)
+        if owner is not None and stats is not None and stats.pending:
+            written += await _flush_tenant(owner, stats)
+    if written:
+        log.debug("📬 Estado de entrega guardado: %s mensajes", written)
+    return written
+
+
+async def stop_flusher() -> None:
+    """Detiene la escritura periódica y guarda lo que quede pendiente."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _flush_task = None
+    await flush_statuses()
+
+
+def delivery_summary(tenant: Optional[Tenant] = None) -> dict:
+    return _stats_for(tenant or current_tenant()).summary()
+
+
+def delivery_state(message_id: str, tenant: Optional[Tenant] = None) -> Optional[dict]:
+    """Último estado conocido en este proceso (sólo los DELIVERY_STATES_KEPT más recientes)."""
+    return _stats_for(tenant or current_tenant()).states.get(message_id)
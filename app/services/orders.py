@@ -1,37 +1,171 @@
 # app/services/orders.py
 
+import base64
 from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional, Tuple
 
 import httpx
-from app.core.config import SUPABASE_URL, SUPABASE_KEY
+from app.core.tenants import supabase_url, supabase_headers
 
 from app.services.supabase import (
     save_order_to_supabase,
     get_recent_order_by_phone_number,
+    get_order_by_id,
     update_order_in_supabase
 )
-from app.services.products import update_product_stock
-from app.utils.memory import user_orders, user_pending_data
+from app.services.products import decrement_stock_bulk
+from app.services.catalog import get_catalog, invalidate_catalog
+from app.services.analytics import record_order
+from app.utils.memory import (
+    session_store,
+    ORDERS,
+    get_pending_data,
+    save_pending_data,
+    clear_pending_data,
+)
 from app.utils.validators import get_missing_fields, REQUIRED_FIELDS
+from app.core.logger import get_logger
+
+log = get_logger("orders")
 
-# Cabeceras para Supabase REST
-_order_headers = {
-    "apikey": SUPABASE_KEY,
-    "Authorization": f"Bearer {SUPABASE_KEY}",
-    "Content-Type": "application/json",
-}
+# Ventana en la que un pedido nuevo del mismo teléfono actualiza el anterior
+RECENT_ORDER_WINDOW = timedelta(minutes=5)
+# Cuánto vale un "sin pedido reciente" del índice antes de volver a preguntar a
+# Supabase (otro worker pudo crear uno desde entonces)
+NO_RECENT_ORDER_TTL = timedelta(seconds=30)
 
 async def get_all_orders():
     """
     Retorna todas las órdenes, ordenadas por `created_at` descendente.
     """
-    url = f"{SUPABASE_URL}/rest/v1/orders?select=*&order=created_at.desc"
+    url = f"{supabase_url()}/rest/v1/orders?select=*&order=created_at.desc"
     async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=_order_headers)
+        resp = await client.get(url, headers=supabase_headers())
         resp.raise_for_status()
         return resp.json()
 
 
+def _encode_cursor(order: dict) -> str:
+    raw = f"{order['created_at']}|{order['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, _, order_id = base64.urlsafe_b64decode(padded.encode()).decode().partition("|")
+    if not created_at or not order_id:
+        raise ValueError("cursor inválido")
+    return created_at, order_id
+
+
+def _orders_params(
+    date_from: Optional[str],
+    date_to: Optional[str],
+    phone: Optional[str],
+    payment_method: Optional[str],
+    cursor: Optional[str],
+    limit: int,
+) -> list:
+    """Parámetros PostgREST: filtros + keyset sobre (created_at, id) descendente."""
+    params = [("select", "*"), ("order", "created_at.desc,id.desc"), ("limit", str(limit))]
+    if date_from:
+        params.append(("created_at", f"gte.{date_from}"))
+    if date_to:
+        params.append(("created_at", f"lt.{date_to}"))
+    if phone:
+        params.append(("phone_number", f"eq.{phone}"))
+    if payment_method:
+        params.append(("payment_method", f"eq.{payment_method}"))
+    if cursor:
+        created_at, order_id = _decode_cursor(cursor)
+        params.append(("or", f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{order_id}"))'))
+    return params
+
+
+async def list_orders(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    phone: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    client: Optional[httpx.AsyncClient] = None,
+) -> Tuple[list, Optional[str]]:
+    """
+    Una página de órdenes (más recientes primero) filtradas en Supabase.
+    `date_from` es inclusivo y `date_to` exclusivo (ISO 8601).
+    Devuelve (órdenes, cursor_siguiente); el cursor es None en la última página.
+    """
+    url = f"{supabase_url()}/rest/v1/orders"
+    params = _orders_params(date_from, date_to, phone, payment_method, cursor, limit)
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            resp = await own_client.get(url, headers=supabase_headers(), params=params)
+    else:
+        resp = await client.get(url, headers=supabase_headers(), params=params)
+    resp.raise_for_status()
+    rows = resp.json()
+    next_cursor = _encode_cursor(rows[-1]) if len(rows) == limit else None
+    return rows, next_cursor
+
+
+async def iter_orders(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    phone: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    page_size: int = 500,
+) -> AsyncIterator[dict]:
+    """Recorre todas las órdenes filtradas página por página (memoria constante)."""
+    cursor = None
+    async with httpx.AsyncClient() as client:
+        while True:
+            rows, cursor = await list_orders(
+                date_from, date_to, phone, payment_method, cursor, page_size, client
+            )
+            for row in rows:
+                yield row
+            if not cursor:
+                return
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+async def _find_recent_order_id(phone: str, now: datetime):
+    """
+    Id del pedido de `phone` creado dentro de RECENT_ORDER_WINDOW, o None.
+
+    El índice local (namespace ORDERS del session store) se actualiza en cada
+    guardado, así que una entrada con pedido es autoritativa. Se consulta
+    Supabase cuando no hay entrada para ese teléfono (arranque en frío) o cuando
+    la entrada es un "sin pedido" de hace más de NO_RECENT_ORDER_TTL. Si Supabase
+    falla se propaga el error: mejor no guardar que duplicar el pedido.
+    """
+    entry = await session_store.get(ORDERS, phone)
+    if entry is not None and not entry.get("id") and now - _parse_timestamp(entry["timestamp"]) > NO_RECENT_ORDER_TTL:
+        entry = None
+    if entry is None:
+        existing = await get_recent_order_by_phone_number(phone, now - RECENT_ORDER_WINDOW)
+        if existing:
+            created = existing.get("created_at")
+            timestamp = _parse_timestamp(created) if created else now
+            await _remember_order(phone, existing.get("id"), timestamp)
+            return existing.get("id")
+        await _remember_order(phone, None, now)
+        return None
+
+    if entry.get("id") and now - _parse_timestamp(entry["timestamp"]) <= RECENT_ORDER_WINDOW:
+        return entry["id"]
+    return None
+
+
+async def _remember_order(phone: str, order_id, timestamp: datetime) -> None:
+    """Registra el último pedido de `phone` (order_id None = consultado y sin pedido reciente)."""
+    await session_store.set(ORDERS, phone, {"id": order_id, "timestamp": timestamp.isoformat()})
+
+
 async def create_order(
     phone: str,
     name: str,
@@ -45,9 +179,7 @@ async def create_order(
     """
     try:
         now = datetime.now(timezone.utc)
-        five_minutes_ago = now - timedelta(minutes=5)
-
-        existing_order = await get_recent_order_by_phone_number(phone, five_minutes_ago)
+        existing_order_id = await _find_recent_order_id(phone, now)
 
         order_payload = {
             "phone_number": phone,
@@ -58,23 +190,105 @@ async def create_order(
             "total": total,
         }
 
-        if existing_order:
-            # Actualizar pedido reciente
-            order_id = existing_order.get("id")
-            return await update_order_in_supabase(order_id, order_payload)
-        else:
-            # Crear pedido nuevo
-            order_payload["created_at"] = now.isoformat().replace("+00:00", "Z")
-            return await save_order_to_supabase(order_payload)
+        if existing_order_id:
+            # Actualizar pedido reciente (conserva su created_at y su entrada en el índice);
+            # si Supabase falla se lanza y no se crea otro
+            updated = await update_order_in_supabase(existing_order_id, order_payload)
+            if updated:
+                record_order(updated)
+                return updated
+            log.info("ℹ️ El pedido %s ya no existe; se crea uno nuevo", existing_order_id)
+
+        # Crear pedido nuevo (o el del índice ya no existe)
+        order_payload["created_at"] = now.isoformat().replace("+00:00", "Z")
+        created = await save_order_to_supabase(order_payload)
+        if created and created.get("id"):
+            await _remember_order(phone, created["id"], now)
+            record_order(created)
+        return created
 
     except Exception as e:
-        print("❌ Error al guardar pedido:", e)
+        log.error("❌ Error al guardar pedido: %s", e)
         return None
 
 # Alias para compatibilidad con conversation.py
 update_order = create_order
 
 
+def _stock_key(catalog, item: dict):
+    """(product_id, variant_id) del catálogo para una línea de pedido, o None si no se encuentra."""
+    if item.get("variant_id") in catalog.variants_by_id:
+        # Líneas que vienen del carrito: ya traen los ids del catálogo
+        product, variant = catalog.variants_by_id[item["variant_id"]]
+    elif item.get("product_id") in catalog.by_id:
+        product, variant = catalog.by_id[item["product_id"]], None
+    else:
+        product, variant = catalog.resolve(item.get("name", ""), item.get("variant_text"))
+    if not product:
+        return None
+    return product["id"], variant["id"] if variant else None
+
+
+async def _decrement_order_stock(products: list, previous_products: Optional[list] = None) -> list[dict]:
+    """
+    Resuelve cada línea del pedido contra el índice del catálogo (por ids si los trae,
+    si no por nombre) y descuenta todo en un solo request. Si el pedido reemplaza a
+    otro (`previous_products`, al actualizarlo) sólo se aplica la diferencia por línea:
+    lo que ya se descontó no se vuelve a descontar y lo que se quitó se devuelve.
+
+    Devuelve un resultado por línea del pedido; las que no se encuentran en el
+    catálogo vuelven con `ok: False, error: "not_found"` y las que no alcanzó el
+    stock con `ok: False` (no se descuentan). Una línea sin cambios vuelve `ok: True`.
+    """
+    catalog = await get_catalog()
+    results: list[dict] = [None] * len(products)
+    wanted: dict = {}
+    positions: dict = {}
+    for i, item in enumerate(products):
+        key = _stock_key(catalog, item)
+        quantity = int(item.get("quantity") or 0)
+        if key is None or quantity < 1:
+            results[i] = {"name": item.get("name"), "quantity": quantity, "ok": False, "error": "not_found"}
+            continue
+        wanted[key] = wanted.get(key, 0) + quantity
+        positions.setdefault(key, []).append(i)
+    already: dict = {}
+    for item in previous_products or []:
+        key = _stock_key(catalog, item)
+        quantity = int(item.get("quantity") or 0)
+        if key is not None and quantity > 0:
+            already[key] = already.get(key, 0) + quantity
+
+    lines, line_keys = [], []
+    for key in {**already, **wanted}:
+        # Negativo = se devuelve stock (el RPC suma)
+        delta = wanted.get(key, 0) - already.get(key, 0)
+        if delta:
+            lines.append({"product_id": key[0], "variant_id": key[1], "quantity": delta})
+            line_keys.append(key)
+
+    try:
+        applied = await decrement_stock_bulk(lines)
+    except Exception as e:
+        log.error("❌ Error descontando stock: %s", e)
+        applied = [{**line, "ok": False, "error": str(e)} for line in lines]
+
+    for key, line_result in zip(line_keys, applied):
+        for pos in positions.get(key, []):
+            # Se reporta la cantidad de la línea, no la diferencia que se envió
+            results[pos] = {**line_result, "name": products[pos].get("name"), "quantity": int(products[pos].get("quantity") or 0)}
+            if not line_result.get("ok"):
+                log.warning("⚠️ Stock insuficiente o no descontado para '%s': %s", products[pos].get('name'), line_result)
+    for pos, result in enumerate(results):
+        if result is None:
+            # Misma cantidad que en el pedido anterior: ya estaba descontado
+            results[pos] = {"name": products[pos].get("name"), "quantity": int(products[pos].get("quantity") or 0), "ok": True}
+
+    if lines:
+        invalidate_catalog()
+    return results
+
+
 async def process_order(from_number: str, order_data: dict) -> dict:
     """
     Fusiona `order_data` con el estado pendiente, valida campos, decide crear/actualizar,
@@ -84,21 +298,23 @@ async def process_order(from_number: str, order_data: dict) -> dict:
       - status: "missing" / "created" / "updated" / "error"
       - fields: lista de campos faltantes (solo si status == "missing")
       - response: resultado crudo de Supabase (para created/updated)
+      - stock: resultado del descuento de stock por línea (para created/updated);
+               `ok: False` en las líneas que no se pudieron descontar
     """
     # 1) Fusionar sólo valores explícitos (evita placeholders)
-    pending = user_pending_data.get(from_number, {})
+    pending = await get_pending_data(from_number)
     for key, value in order_data.items():
         if isinstance(value, str) and value.strip().lower().startswith("tu "):
             continue
         if value is not None:
             pending[key] = value
-    user_pending_data[from_number] = pending
 
     # 2) Convertir placeholders tipo "tu ..." en None
     for field in REQUIRED_FIELDS:
         v = pending.get(field, "")
         if isinstance(v, str) and v.strip().lower().startswith("tu "):
             pending[field] = None
+    await save_pending_data(from_number, pending)
 
     # 3) Validar datos obligatorios
     faltantes = get_missing_fields(pending)
@@ -107,8 +323,6 @@ async def process_order(from_number: str, order_data: dict) -> dict:
 
     # 4) Decide crear o actualizar
     now = datetime.now(timezone.utc)
-    five_minutes_ago = now - timedelta(minutes=5)
-    existing = await get_recent_order_by_phone_number(pending["phone"], five_minutes_ago)
 
     # Prepara payload para Supabase
     supabase_payload = {
@@ -121,21 +335,38 @@ async def process_order(from_number: str, order_data: dict) -> dict:
         "created_at": now.isoformat().replace("+00:00", "Z")
     }
 
-    if existing:
-        res = await update_order_in_supabase(existing["id"], supabase_payload)
-        action = "updated"
-    else:
-        res = await save_order_to_supabase(supabase_payload)
-        action = "created"
+    res = None
+    previous = None
+    try:
+        existing_id = await _find_recent_order_id(pending["phone"], now)
+        if existing_id:
+            # Lo que ya se descontó por ese pedido, para descontar sólo la diferencia
+            previous = await get_order_by_id(existing_id)
+            if previous:
+                res = await update_order_in_supabase(existing_id, supabase_payload)
+                action = "updated"
+            if not res:
+                previous = None
+                log.info("ℹ️ El pedido %s ya no existe; se crea uno nuevo", existing_id)
+        if not res:
+            # Sin pedido reciente (o el del índice ya no existe): crear uno nuevo
+            res = await save_order_to_supabase(supabase_payload)
+            action = "created"
+    except Exception as e:
+        # Error de Supabase: no se sabe si el pedido existe, así que no se crea otro
+        log.error("❌ Error guardando el pedido de %s: %s", pending["phone"], e)
+        return {"status": "error"}
 
     if not res or not res.get("id"):
         return {"status": "error"}
+    record_order(res)
 
-    # 5) Descontar stock y limpiar estado pendiente
-    for prod in pending["products"]:
-        await update_product_stock(prod["name"], prod["quantity"])
+    # 5) Descontar stock (una sola llamada para todo el pedido; al actualizar, sólo la
+    #    diferencia con el anterior) y limpiar estado pendiente
+    stock_results = await _decrement_order_stock(pending["products"], (previous or {}).get("products"))
 
-    user_orders[from_number] = {"id": res["id"], "timestamp": now}
-    user_pending_data.pop(from_number, None)
+    # process_order reescribe created_at, así que la ventana vuelve a empezar
+    await _remember_order(pending["phone"], res["id"], now)
+    await clear_pending_data(from_number)
 
-    return {"status": action, "response": res}
+    return {"status": action, "response": res, "stock": stock_results}
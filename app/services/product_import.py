@@ -0,0 +1,258 @@
+# app/services/product_import.py
+"""
+Importación masiva de productos desde CSV o JSON.
+
+El archivo se lee en streaming (nunca entero en memoria) y en dos pasadas:
+  1) validación de todas las filas; si hay errores no se escribe nada
+     (salvo `skip_invalid=True`, que importa sólo las válidas);
+  2) escritura por lotes de IMPORT_CHUNK_SIZE filas: una llamada a la RPC
+     `import_products` por lote (supabase/import_products.sql), con hasta
+     IMPORT_CONCURRENCY lotes en paralelo.
+
+Es idempotente: cada lote se escribe en una sola transacción (productos con sus
+variantes e imágenes, o nada) y los productos cuyo nombre ya existe se reportan
+como "exists" sin tocarlos, así que repetir una importación interrumpida la
+retoma donde quedó. El catálogo en caché se invalida una sola vez al final.
+
+La lectura del archivo (bloqueante) se hace en un hilo aparte, fuera del event loop.
+
+Columnas (CSV) / claves (JSON): name, description, price, stock,
+variants (lista JSON de {"options": {...}, "price", "stock"}), image_urls (lista JSON).
+JSON puede ser un arreglo de objetos o NDJSON (un objeto por línea).
+"""
+import asyncio
+import codecs
+import csv
+import json
+from typing import IO, Iterator, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import IMPORT_CHUNK_SIZE, IMPORT_CONCURRENCY
+from app.services.catalog import invalidate_catalog
+from app.services.products import import_products_atomic
+from app.core.logger import get_logger
+
+log = get_logger("products")
+
+_READ_SIZE = 64 * 1024
+
+
+# --- Lectura incremental ---
+
+def _iter_csv(raw: IO[bytes]) -> Iterator[dict]:
+    return csv.DictReader(codecs.iterdecode(raw, "utf-8-sig"))
+
+
+def _iter_json(raw: IO[bytes]) -> Iterator[dict]:
+    """Objetos de un arreglo JSON o de NDJSON, decodificados trozo a trozo."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    started = False  # ya se vio el '[' de apertura (o se detectó NDJSON)
+    eof = False
+    while True:
+        if not eof:
+            chunk = raw.read(_READ_SIZE)
+            eof = not chunk
+            buf += utf8.decode(chunk or b"", final=eof)
+        pos = 0
+        while True:
+            # Saltar espacios y separadores entre objetos
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and not started:
+                started = True
+                if buf[pos] == "[":
+                    pos += 1
+                    continue
+            if pos >= len(buf) or buf[pos] == "]":
+                break
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break  # objeto incompleto: leer más
+            yield obj
+            pos = end
+        buf = buf[pos:]
+        if eof:
+            if buf.strip() not in ("", "]"):
+                raise ValueError("Contenido JSON inesperado al final del archivo")
+            return
+
+
+def iter_rows(raw: IO[bytes], format: str) -> Iterator[dict]:
+    if format == "csv":
+        return _iter_csv(raw)
+    if format == "json":
+        return _iter_json(raw)
+    raise ValueError("Format must be 'csv' or 'json'")
+
+
+# --- Validación ---
+
+def _as_list(value) -> list:
+    if value in (None, ""):
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, list):
+        raise ValueError("debe ser una lista")
+    return value
+
+
+def validate_row(item) -> Tuple[Optional[dict], List[str]]:
+    """Normaliza una fila. Devuelve (fila_normalizada, []) o (None, errores)."""
+    if not isinstance(item, dict):
+        return None, ["la fila no es un objeto"]
+    errors = []
+    name = (item.get("name") or "").strip()
+    if not name:
+        errors.append("name es obligatorio")
+    price, stock = 0.0, 0
+    try:
+        price = float(item.get("price") or 0)
+        if price < 0:
+            errors.append("price debe ser no negativo")
+    except (TypeError, ValueError):
+        errors.append("price no es numérico")
+    try:
+        stock = int(item.get("stock") or 0)
+        if stock < 0:
+            errors.append("stock debe ser no negativo")
+    except (TypeError, ValueError):
+        errors.append("stock no es entero")
+
+    variants = []
+    try:
+        for v in _as_list(item.get("variants")):
+            if isinstance(v, dict) and "options" in v:
+                variant = {
+                    "options": v.get("options") or {},
+                    "price": float(v.get("price", price)),
+                    "stock": int(v.get("stock", stock)),
+                }
+                if variant["price"] < 0 or variant["stock"] < 0:
+                    errors.append(f"variante {variant['options']}: price y stock deben ser no negativos")
+                variants.append(variant)
+            else:
+                variants.append({
+                    "options": v if isinstance(v, dict) else {"option": v},
+                    "price": price,
+                    "stock": stock,
+                })
+    except (TypeError, ValueError) as e:
+        errors.append(f"variants inválido: {e}")
+
+    try:
+        image_urls = [str(u) for u in _as_list(item.get("image_urls"))]
+    except (TypeError, ValueError) as e:
+        image_urls = []
+        errors.append(f"image_urls inválido: {e}")
+
+    if errors:
+        return None, errors
+    return {
+        "name": name,
+        "description": item.get("description") or None,
+        "price": price,
+        "stock": stock,
+        "variants": variants,
+        "image_urls": image_urls,
+    }, []
+
+
+# --- Escritura por lotes ---
+
+async def _write_chunk(client: httpx.AsyncClient, chunk: List[Tuple[int, dict]]) -> List[dict]:
+    """Crea (en una transacción) los productos del lote que aún no existen, con sus variantes e imágenes."""
+    try:
+        written = await import_products_atomic([row for _, row in chunk], client)
+    except Exception as e:
+        log.error("❌ Error importando lote desde la fila %s: %s", chunk[0][0], e)
+        return [{"row": line, "name": row["name"], "status": "error", "error": str(e)} for line, row in chunk]
+    return [
+        {"row": line, "name": row["name"], "status": result["status"], "product_id": result["product_id"]}
+        for (line, row), result in zip(chunk, written)
+    ]
+
+
+def _validate_file(raw: IO[bytes], format: str) -> Tuple[int, dict]:
+    """Primera pasada: (filas, {línea: errores}). Bloqueante; corre en un hilo."""
+    invalid = {}
+    seen_names = set()
+    total = 0
+    for line, item in enumerate(iter_rows(raw, format), start=1):
+        total += 1
+        row, errors = validate_row(item)
+        if row and row["name"] in seen_names:
+            errors = [f"nombre duplicado en el archivo: {row['name']}"]
+        if errors:
+            invalid[line] = errors
+        else:
+            seen_names.add(row["name"])
+    return total, invalid
+
+
+def _iter_chunks(raw: IO[bytes], format: str, invalid: dict) -> Iterator[List[Tuple[int, dict]]]:
+    """Segunda pasada: filas válidas en lotes de IMPORT_CHUNK_SIZE."""
+    raw.seek(0)
+    chunk: List[Tuple[int, dict]] = []
+    for line, item in enumerate(iter_rows(raw, format), start=1):
+        if line in invalid:
+            continue
+        row, _ = validate_row(item)
+        chunk.append((line, row))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def import_products(raw: IO[bytes], format: str, dry_run: bool = False, skip_invalid: bool = False) -> dict:
+    """
+    Importa productos desde `raw` (archivo binario con seek, p.ej. `UploadFile.file`).
+    Devuelve un resumen con conteos por estado y el resultado de cada fila.
+    """
+    # 1) Validar todo el archivo antes de escribir
+    total, invalid = await asyncio.to_thread(_validate_file, raw, format)
+
+    results = [{"row": line, "status": "invalid", "errors": errs} for line, errs in invalid.items()]
+    if dry_run or (invalid and not skip_invalid):
+        return _summary(total, results, written=False)
+
+    # 2) Escribir por lotes con paralelismo acotado
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+    tasks = []
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        async def run(chunk):
+            try:
+                return await _write_chunk(client, chunk)
+            finally:
+                semaphore.release()
+
+        chunks = _iter_chunks(raw, format, invalid)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run(chunk)))
+
+        for chunk_results in await asyncio.gather(*tasks):
+            results.extend(chunk_results)
+
+    invalidate_catalog()
+    results.sort(key=lambda r: r["row"])
+    return _summary(total, results, written=True)
+
+
+def _summary(total: int, results: List[dict], written: bool) -> dict:
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {"rows": total, "written": written, "counts": counts, "results": results}
@@ -1,40 +1,36 @@
 # app/services/products.py
 import os
 import httpx
-from app.core.config import SUPABASE_URL, SUPABASE_KEY
+from app.core.tenants import supabase_url, supabase_headers
+from app.core.metrics import span
+from app.core.logger import get_logger
 
-# Cabeceras comunes para llamadas a Supabase REST
-headers = {
-    "apikey": SUPABASE_KEY,
-    "Authorization": f"Bearer {SUPABASE_KEY}",
-    "Content-Type": "application/json",
-    # Preferimos que devuelva el nuevo registro tras POST/PATCH
-    "Prefer": "return=representation"
-}
+log = get_logger("products")
 
 async def get_all_products():
     """
     Obtiene todos los productos, incluyendo sus variantes e imágenes.
     """
     url = (
-        f"{SUPABASE_URL}/rest/v1/products"
+        f"{supabase_url()}/rest/v1/products"
         "?select=*,product_variants(*),product_images(*)"
     )
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=headers)
-        resp.raise_for_status()
-        return resp.json()
+    with span("client.supabase.get_all_products"):
+        async with httpx.AsyncClient() as client:
+            resp = await client.get(url, headers=supabase_headers())
+            resp.raise_for_status()
+            return resp.json()
 
 async def get_product_by_id(product_id: str):
     """
     Obtiene un solo producto (por su id), con variantes e imágenes.
     """
     url = (
-        f"{SUPABASE_URL}/rest/v1/products"
+        f"{supabase_url()}/rest/v1/products"
         f"?id=eq.{product_id}&select=*,product_variants(*),product_images(*)"
     )
     async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=headers)
+        resp = await client.get(url, headers=supabase_headers())
         resp.raise_for_status()
         return resp.json()
 
@@ -48,9 +44,9 @@ async def create_product(data: dict):
       - stock       (integer, no negativo)
     Devuelve el registro creado.
     """
-    url = f"{SUPABASE_URL}/rest/v1/products"
+    url = f"{supabase_url()}/rest/v1/products"
     async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=headers, json=data)
+        resp = await client.post(url, headers=supabase_headers(), json=data)
         resp.raise_for_status()
         # Supabase devuelve lista de registros (aun cuando es uno)
         created = resp.json()
@@ -66,9 +62,9 @@ async def create_variant(variant: dict):
       - stock      (integer)
       - sku        (opcional)
     """
-    url = f"{SUPABASE_URL}/rest/v1/product_variants"
+    url = f"{supabase_url()}/rest/v1/product_variants"
     async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=headers, json=variant)
+        resp = await client.post(url, headers=supabase_headers(), json=variant)
         resp.raise_for_status()
         data = resp.json()
         return data[0] if isinstance(data, list) and data else None
@@ -81,58 +77,118 @@ async def create_variant_image(image_record: dict):
       - variant_id (uuid o null)
       - url        (string)
     """
-    url = f"{SUPABASE_URL}/rest/v1/product_images"
+    url = f"{supabase_url()}/rest/v1/product_images"
     async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=headers, json=image_record)
+        resp = await client.post(url, headers=supabase_headers(), json=image_record)
         resp.raise_for_status()
         data = resp.json()
         return data[0] if isinstance(data, list) and data else None
 
+async def _insert_many(table: str, rows: list[dict], client: httpx.AsyncClient = None) -> list[dict]:
+    """
+    Inserta varias filas en `table` con un solo POST y devuelve los registros
+    creados, en el mismo orden. Todas las filas deben tener las mismas claves.
+    """
+    if not rows:
+        return []
+    url = f"{supabase_url()}/rest/v1/{table}"
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            resp = await own_client.post(url, headers=supabase_headers(), json=rows)
+    else:
+        resp = await client.post(url, headers=supabase_headers(), json=rows)
+    resp.raise_for_status()
+    return resp.json()
+
+async def create_products_bulk(products: list[dict], client: httpx.AsyncClient = None) -> list[dict]:
+    """Inserta varios productos en un solo request (mismos campos que `create_product`)."""
+    return await _insert_many("products", products, client)
+
+async def create_variants_bulk(variants: list[dict], client: httpx.AsyncClient = None) -> list[dict]:
+    """Inserta varias variantes en un solo request (mismos campos que `create_variant`)."""
+    return await _insert_many("product_variants", variants, client)
+
+async def create_variant_images_bulk(image_records: list[dict], client: httpx.AsyncClient = None) -> list[dict]:
+    """Inserta varios registros de `product_images` en un solo request."""
+    return await _insert_many("product_images", image_records, client)
+
+async def import_products_atomic(rows: list[dict], client: httpx.AsyncClient = None) -> list[dict]:
+    """
+    Crea productos con sus variantes e imágenes en una sola transacción (RPC
+    `import_products`, ver supabase/import_products.sql). Cada fila: name,
+    description, price, stock, variants, image_urls. Devuelve un resultado por
+    fila, en el mismo orden: {name, product_id, status} con status "created" o
+    "exists" (el nombre ya estaba y no se tocó).
+    """
+    if not rows:
+        return []
+    url = f"{supabase_url()}/rest/v1/rpc/import_products"
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            resp = await own_client.post(url, headers=supabase_headers(), json={"items": rows})
+    else:
+        resp = await client.post(url, headers=supabase_headers(), json={"items": rows})
+    resp.raise_for_status()
+    return resp.json()
+
+async def get_products_by_names(names: list[str], client: httpx.AsyncClient = None) -> list[dict]:
+    """Productos (id, name) cuyo nombre sea exactamente uno de `names`."""
+    if not names:
+        return []
+    quoted = ",".join('"' + n.replace("\\", "\\\\").replace('"', '\\"') + '"' for n in names)
+    url = f"{supabase_url()}/rest/v1/products"
+    params = {"select": "id,name", "name": f"in.({quoted})"}
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            resp = await own_client.get(url, headers=supabase_headers(), params=params)
+    else:
+        resp = await client.get(url, headers=supabase_headers(), params=params)
+    resp.raise_for_status()
+    return resp.json()
+
 async def search_products_by_keyword(keyword: str):
     """
     Busca productos cuyo `name` contenga el keyword (case-insensitive).
     """
     url = (
-        f"{SUPABASE_URL}/rest/v1/products"
+        f"{supabase_url()}/rest/v1/products"
         f"?name=ilike.*{keyword}*&select=*,product_variants(*),product_images(*)"
     )
     async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=headers)
+        resp = await client.get(url, headers=supabase_headers())
         resp.raise_for_status()
         return resp.json()
 
-async def update_product_stock(product_name: str, quantity_sold: int):
+async def decrement_stock_bulk(lines: list[dict]) -> list[dict]:
     """
-    Resta `quantity_sold` del stock del primer producto cuyo nombre contenga `product_name`.
+    Descuenta el stock de varias líneas en una sola llamada (RPC `decrement_stock`,
+    ver supabase/decrement_stock.sql). Cada línea:
+      - product_id (uuid)
+      - variant_id (uuid o null; si viene, se descuenta la variante)
+      - quantity   (integer; negativo devuelve stock)
+    Devuelve un resultado por línea, en el mismo orden:
+      {line, product_id, variant_id, quantity, ok, stock}
+    `ok` es False si el stock no alcanzaba (no se descuenta nada en esa línea).
     """
-    # 1) Buscar producto
-    search_url = (
-        f"{SUPABASE_URL}/rest/v1/products"
-        f"?name=ilike.*{product_name.replace(' ', '%20')}*&select=id,stock,name"
-    )
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(search_url, headers=headers)
-        resp.raise_for_status()
-        items = resp.json()
-        if not items:
-            print(f"❌ Producto '{product_name}' no encontrado.")
-            return
-        product = items[0]
-        new_stock = max(0, product["stock"] - quantity_sold)
-
-        # 2) Actualizar stock
-        patch_url = f"{SUPABASE_URL}/rest/v1/products?id=eq.{product['id']}"
-        patch_data = {"stock": new_stock}
-        patch_resp = await client.patch(patch_url, headers=headers, json=patch_data)
-        patch_resp.raise_for_status()
-        print(f"✅ Stock actualizado for '{product['name']}': {product['stock']} → {new_stock}")
+    if not lines:
+        return []
+    url = f"{supabase_url()}/rest/v1/rpc/decrement_stock"
+    with span("client.supabase.decrement_stock"):
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(url, headers=supabase_headers(), json={"items": lines})
+            resp.raise_for_status()
+            return resp.json()
 
 
 # al final de app/services/products.py
 
-async def get_recommended_products(pedido: list):
-    """Devuelve productos recomendables según los productos del pedido."""
-    all_products = await get_all_products()
+async def get_recommended_products(pedido: list, all_products: list = None):
+    """
+    Devuelve productos recomendables según los productos del pedido.
+    `all_products` evita volver a descargar el catálogo si ya se tiene.
+    """
+    if all_products is None:
+        all_products = await get_all_products()
     pedido_keywords = [p["name"].lower() for p in pedido]
 
     recomendaciones = []
@@ -152,15 +208,15 @@ async def get_recommended_products(pedido: list):
 
 async def delete_product(product_id: str):
     """Borra un producto y devuelve True si fue exitoso."""
-    url = f"{SUPABASE_URL}/rest/v1/products?id=eq.{product_id}"
+    url = f"{supabase_url()}/rest/v1/products?id=eq.{product_id}"
     async with httpx.AsyncClient() as client:
-        resp = await client.delete(url, headers=headers)
+        resp = await client.delete(url, headers=supabase_headers())
         # 204 No Content o 200 OK
         return resp.status_code in (200, 204)
 
 async def delete_variant(variant_id: str):
     """Borra una variante por su ID."""
-    url = f"{SUPABASE_URL}/rest/v1/product_variants?id=eq.{variant_id}"
+    url = f"{supabase_url()}/rest/v1/product_variants?id=eq.{variant_id}"
     async with httpx.AsyncClient() as client:
-        resp = await client.delete(url, headers=headers)
+        resp = await client.delete(url, headers=supabase_headers())
         return resp.status_code in (200, 204)
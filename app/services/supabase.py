@@ -1,99 +1,186 @@
 # app/services/supabase.py
 import httpx
 from datetime import datetime
-from app.core.config import SUPABASE_URL, SUPABASE_KEY
-import uuid
-from typing import Tuple
-
-# Cabeceras globales para Supabase
-headers = {
-    "apikey": SUPABASE_KEY,
-    "Authorization": f"Bearer {SUPABASE_KEY}",
-    "Content-Type": "application/json",
-    "Prefer": "return=representation"
-}
+from app.core.tenants import current_tenant, supabase_url, supabase_headers
+import hashlib
+from typing import AsyncIterator, Callable, Optional, Tuple, Union
+
+from app.utils.memory import session_store, IMAGE_HASHES
+from app.core.metrics import span
+from app.core.logger import get_logger
+
+log = get_logger("supabase")
 
 def utc_iso_z():
     # Devuelve timestamp en formato ISO 8601 UTC con 'Z' (Zulu)
     return datetime.utcnow().isoformat() + "Z"
 
-async def save_message_to_supabase(phone_number: str, role: str, text: str):
-    url = f"{SUPABASE_URL}/rest/v1/messages"
+async def save_message_to_supabase(phone_number: str, role: str, text: str) -> bool:
+    """Guarda un mensaje en `messages`; False si Supabase respondió con error."""
+    url = f"{supabase_url()}/rest/v1/messages"
     payload = {
         "phone_number": phone_number,
         "role": role,
         "text": text,
         "timestamp": utc_iso_z()
     }
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, json=payload, headers=headers)
-        print("Mensaje guardado en Supabase:", resp.status_code, resp.text)
+    with span("client.supabase.save_message") as s:
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(url, json=payload, headers=supabase_headers())
+        if resp.status_code >= 400:
+            s.outcome = "http_error"
+        log.debug("Mensaje guardado en Supabase: %s %s", resp.status_code, resp.text)
+        return resp.status_code < 400
 
 async def save_order_to_supabase(order: dict):
     """
     Inserta un nuevo pedido en la tabla `orders`.
     Retorna el registro insertado o None si falla.
     """
-    url = f"{SUPABASE_URL}/rest/v1/orders"
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, json=order, headers=headers)
-        print("📝 Pedido guardado en Supabase:", resp.status_code, resp.text)
+    url = f"{supabase_url()}/rest/v1/orders"
+    with span("client.supabase.save_order") as s:
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(url, json=order, headers=supabase_headers())
+        if resp.status_code >= 400:
+            s.outcome = "http_error"
+        log.info("📝 Pedido guardado en Supabase: %s %s", resp.status_code, resp.text)
         data = resp.json()
         return data[0] if isinstance(data, list) and data else None
 
 async def get_recent_order_by_phone_number(phone_number: str, since_time: datetime):
     """
     Busca un pedido por número de teléfono creado desde `since_time` hasta ahora.
-    Retorna el primer pedido encontrado o None.
+    Retorna el primer pedido encontrado o None; si Supabase falla lanza
+    httpx.HTTPStatusError (no se puede afirmar que no haya pedido).
     """
     # Convertimos since_time a ISO con 'Z'
     since = since_time.isoformat().replace("+00:00", "Z")
-    url = f"{SUPABASE_URL}/rest/v1/orders"
+    url = f"{supabase_url()}/rest/v1/orders"
     query = f"?phone_number=eq.{phone_number}&created_at=gte.{since}&select=*"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url + query, headers=headers)
+    with span("client.supabase.get_recent_order"):
+        async with httpx.AsyncClient() as client:
+            resp = await client.get(url + query, headers=supabase_headers())
+        resp.raise_for_status()
         data = resp.json()
-        print("📦 Pedido reciente:", data)
+        log.debug("📦 Pedido reciente: %s", data)
         return data[0] if data else None
 
+async def get_order_by_id(order_id: str):
+    """
+    Pedido con ese `id`, o None si no existe; si Supabase falla lanza
+    httpx.HTTPStatusError.
+    """
+    url = f"{supabase_url()}/rest/v1/orders?id=eq.{order_id}&select=*"
+    with span("client.supabase.get_order"):
+        async with httpx.AsyncClient() as client:
+            resp = await client.get(url, headers=supabase_headers())
+        resp.raise_for_status()
+        data = resp.json()
+        return data[0] if isinstance(data, list) and data else None
+
 async def update_order_in_supabase(order_id: str, order_data: dict):
     """
     Actualiza un pedido existente dado su `id`.
-    Retorna el registro actualizado o None.
+    Retorna el registro actualizado, o None sólo si ya no existe ese pedido; si
+    Supabase falla lanza httpx.HTTPStatusError.
     """
-    url = f"{SUPABASE_URL}/rest/v1/orders?id=eq.{order_id}"
-    async with httpx.AsyncClient() as client:
-        resp = await client.patch(url, json=order_data, headers=headers)
-        print("✏️ Pedido actualizado en Supabase:", resp.status_code, resp.text)
+    url = f"{supabase_url()}/rest/v1/orders?id=eq.{order_id}"
+    with span("client.supabase.update_order"):
+        async with httpx.AsyncClient() as client:
+            resp = await client.patch(url, json=order_data, headers=supabase_headers())
+        log.info("✏️ Pedido actualizado en Supabase: %s %s", resp.status_code, resp.text)
+        resp.raise_for_status()
         data = resp.json()
         return data[0] if isinstance(data, list) and data else None
 
 
 
 
-async def upload_image_to_supabase_storage(file_data: bytes, filename: str, content_type: str) -> Tuple[bool, str]:
+ImageSource = Union[bytes, Callable[[], AsyncIterator[bytes]]]
+
+_IMAGE_BUCKET = "product-images"
+
+
+def _storage_headers(content_type: Optional[str] = None) -> dict:
+    supabase_key = current_tenant().supabase_key
+    headers = {"apikey": supabase_key, "Authorization": f"Bearer {supabase_key}"}
+    if content_type:
+        headers["Content-Type"] = content_type
+    return headers
+
+
+def _public_image_url(path: str) -> str:
+    return f"{supabase_url()}/storage/v1/object/public/{_IMAGE_BUCKET}/{path}"
+
+
+async def _stored_image_url(path: str, client: httpx.AsyncClient) -> Optional[str]:
+    """URL pública de `path` si ya está en el bucket (índice local o API de Storage autenticada)."""
+    known_url = await session_store.get(IMAGE_HASHES, path)
+    if known_url:
+        return known_url
+    # El nombre del objeto ya es el hash: basta preguntar a Storage si existe
+    info = await client.get(f"{supabase_url()}/storage/v1/object/info/{_IMAGE_BUCKET}/{path}", headers=_storage_headers())
+    if info.status_code != 200:
+        return None
+    public_url = _public_image_url(path)
+    await session_store.set(IMAGE_HASHES, path, public_url)
+    return public_url
+
+
+async def _upload_object(path: str, content, content_type: str, size: Optional[int],
+                         client: httpx.AsyncClient) -> httpx.Response:
+    headers = _storage_headers(content_type)
+    # Mismo hash = mismo contenido: sobrescribir una subida concurrente es inofensivo
+    headers["x-upsert"] = "true"
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    return await client.post(f"{supabase_url()}/storage/v1/object/{_IMAGE_BUCKET}/{path}", content=content, headers=headers)
+
+
+async def _content_hash(file_data: ImageSource) -> str:
+    """sha256 del contenido; un stream se lee por trozos (es el archivo local ya recibido)."""
+    if isinstance(file_data, bytes):
+        return hashlib.sha256(file_data).hexdigest()
+    digest = hashlib.sha256()
+    async for chunk in file_data():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def upload_image_to_supabase_storage(
+    file_data: ImageSource,
+    filename: str,
+    content_type: str,
+    size: Optional[int] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> Tuple[bool, str]:
     """
     Sube una imagen a Supabase Storage (bucket: 'product-images').
+    `file_data` puede ser bytes o una función que devuelve un iterador async de
+    trozos desde el inicio (ej. el UploadFile, ya guardado en disco local): se lee
+    una vez para calcular el hash y, sólo si hace falta subirlo, otra para enviarlo,
+    sin cargar el archivo completo; `size` permite enviar Content-Length.
+
+    Los objetos se nombran por el sha256 de su contenido (`products/<hash>.<ext>`).
+    Si ese objeto ya existe (índice local `ruta → URL` en el session store, o la
+    API de Storage lo encuentra) no se sube nada y se devuelve su URL.
     Retorna (True, url) si fue exitoso, o (False, mensaje de error) si falló.
     """
-    # Crear nombre único en el bucket
-    ext = filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{ext}"
-    path = f"products/{unique_filename}"
-    
-    url = f"{SUPABASE_URL}/storage/v1/object/product-images/{path}"
-    headers_upload = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": content_type,
-    }
+    if client is None:
+        async with httpx.AsyncClient(timeout=60.0) as own_client:
+            return await upload_image_to_supabase_storage(file_data, filename, content_type, size, own_client)
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, content=file_data, headers=headers_upload)
+    ext = filename.split(".")[-1].lower() if filename and "." in filename else "bin"
+    path = f"products/{await _content_hash(file_data)}.{ext}"
+    known_url = await _stored_image_url(path, client)
+    if known_url:
+        return True, known_url
 
-        if resp.status_code == 200:
-            public_url = f"{SUPABASE_URL}/storage/v1/object/public/product-images/{path}"
-            return True, public_url
-        else:
-            print("❌ Error subiendo imagen:", resp.status_code, resp.text)
-            return False, resp.text
+    content = file_data if isinstance(file_data, bytes) else file_data()
+    resp = await _upload_object(path, content, content_type, size, client)
+    if resp.status_code != 200:
+        log.error("❌ Error subiendo imagen: %s %s", resp.status_code, resp.text)
+        return False, resp.text
+    public_url = _public_image_url(path)
+    await session_store.set(IMAGE_HASHES, path, public_url)
+    return True, public_url
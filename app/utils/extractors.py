@@ -1,5 +1,9 @@
 # app/utils/extractors.py
 import json
+import re
+from app.core.logger import get_logger
+
+log = get_logger("extractors")
 
 def extract_order_data(text: str):
     """Extrae el bloque JSON de pedido y devuelve (order_data_dict, texto_sin_json)."""
@@ -11,5 +15,28 @@ def extract_order_data(text: str):
             parsed = json.loads(js)
             return parsed.get("order_details"), text[:idx].strip()
     except Exception as e:
-        print("⚠️ Error extrayendo JSON:", e)
+        log.warning("⚠️ Error extrayendo JSON: %s", e)
     return None, text
+
+
+# El LLM no siempre deja el JSON compacto: `{ "cart_ops"`, `{\n  "cart_ops"`...
+_CART_OPS_MARKER = re.compile(r'\{\s*"cart_ops"')
+
+
+def extract_cart_operations(text: str):
+    """
+    Extrae el bloque {"cart_ops": [...]} de la respuesta del LLM.
+    Devuelve (lista_de_operaciones, texto_sin_el_bloque); la lista es vacía si no hay bloque.
+    """
+    match = _CART_OPS_MARKER.search(text)
+    if match is None:
+        return [], text.strip()
+    idx = match.start()
+    try:
+        parsed, end = json.JSONDecoder().raw_decode(text, idx)
+    except ValueError as e:
+        log.warning("⚠️ Error extrayendo operaciones del carrito: %s", e)
+        return [], text[:idx].strip()
+    ops = parsed.get("cart_ops") if isinstance(parsed, dict) else None
+    clean = (text[:idx] + text[end:]).replace("```json", "").replace("```", "").strip()
+    return ops if isinstance(ops, list) else [], clean
@@ -1,14 +1,65 @@
-from collections import defaultdict, deque
+from app.core.config import SESSION_BACKEND, SESSION_DB_PATH, SESSION_LOCK_TTL_SECONDS
+from app.core.tenants import current_tenant
+from app.utils.session_store import ScopedSessionStore, build_session_store
 
-# Memoria temporal en RAM: guarda hasta 15 mensajes por usuario
-user_histories = defaultdict(lambda: deque(maxlen=15))
+# Espacios de nombres dentro del almacén
+HISTORY = "history"      # hasta HISTORY_MAX_MESSAGES mensajes por usuario
+ORDERS = "orders"        # último pedido por teléfono (id + timestamp), índice de pedidos recientes
+PENDING = "pending"      # datos parciales antes de confirmar: name, address, phone, payment_method, products, total
+CART = "cart"            # carrito por usuario: líneas (ids + cantidad) y datos del cliente
+CONTEXT = "context"      # contexto de conversación (último producto visto, etc.)
+IMAGE_HASHES = "image_hashes"  # ruta en Storage (products/<sha256>.<ext>) -> URL pública
 
-# Pedidos temporales confirmados (id + timestamp)
-user_orders = {}
+HISTORY_MAX_MESSAGES = 15
 
-# Datos parciales que va dando el usuario antes de confirmar
-# phone_number -> { name, address, phone, payment_method, products, total }
-user_pending_data = {}
 
-# Contexto de conversación por usuario (último producto visto, etc.)
-user_context = {}
+def _tenant_scope():
+    tenant = current_tenant()
+    return tenant.key_prefix, tenant.max_sessions
+
+
+# Almacén del estado por usuario (en RAM o compartido entre workers, según config),
+# separado por tienda y con el límite de conversaciones de cada una
+session_store = ScopedSessionStore(
+    build_session_store(SESSION_BACKEND, SESSION_DB_PATH, SESSION_LOCK_TTL_SECONDS),
+    _tenant_scope,
+    (HISTORY, ORDERS, PENDING, CART, CONTEXT),
+)
+
+
+async def get_history(phone_number: str) -> list[dict]:
+    """Historial reciente del usuario (lista nueva; guardar con `save_history`)."""
+    return list(await session_store.get(HISTORY, phone_number, []))
+
+
+async def save_history(phone_number: str, history: list[dict]) -> None:
+    await session_store.set(HISTORY, phone_number, history[-HISTORY_MAX_MESSAGES:])
+
+
+async def get_pending_data(phone_number: str) -> dict:
+    return dict(await session_store.get(PENDING, phone_number, {}))
+
+
+async def save_pending_data(phone_number: str, data: dict) -> None:
+    await session_store.set(PENDING, phone_number, data)
+
+
+async def clear_pending_data(phone_number: str) -> None:
+    await session_store.delete(PENDING, phone_number)
+
+
+def empty_cart() -> dict:
+    return {"lines": [], "customer": {}}
+
+
+async def get_cart(phone_number: str) -> dict:
+    cart = await session_store.get(CART, phone_number)
+    return {"lines": [dict(l) for l in cart["lines"]], "customer": dict(cart["customer"])} if cart else empty_cart()
+
+
+async def save_cart(phone_number: str, cart: dict) -> None:
+    await session_store.set(CART, phone_number, cart)
+
+
+async def clear_cart(phone_number: str) -> None:
+    await session_store.delete(CART, phone_number)
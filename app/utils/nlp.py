@@ -1,33 +1,71 @@
-from app.clients.gemini import ask_gemini_with_history
-
-def extract_keywords(text: str, keywords: list[str]) -> list[str]:
-    """
-    Extrae palabras clave definidas manualmente si aparecen en el texto.
-    """
-    text_lower = text.lower()
-    return [kw for kw in keywords if kw.lower() in text_lower]
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
+from app.clients.gemini import ask_gemini_with_history
+from app.utils.phrase_matcher import Match, PhraseMatcher
 
-def quiere_ver_todos_los_productos(texto: str) -> bool:
-    """
-    Detecta si el mensaje contiene frases comunes que indican que el usuario quiere ver todos los productos.
-    """
-    frases = [
+# Frases fijas por categoría; se amplían con `register_phrases`
+PHRASES: Dict[str, List[str]] = {
+    "ver_catalogo": [
         "muéstrame todos los productos",
         "quiero ver todos los productos",
         "enséñame los productos",
         "qué productos tienes",
-        "que productos tienes",
         "todo el catálogo",
         "qué vendes",
-        "que vendes",
         "qué hay disponible",
         "ver catálogo",
         "ver todos los productos",
-        "mostrar todo"
-    ]
-    texto = texto.lower()
-    return any(frase in texto for frase in frases)
+        "mostrar todo",
+    ],
+}
+
+# Versión de PHRASES: cambia con cada `register_phrases` y fuerza a reconstruir el autómata
+_phrases_version = 0
+# (versión de frases, autómata)
+_matcher: Optional[Tuple[int, PhraseMatcher]] = None
+
+
+def register_phrases(category: str, phrases: List[str]) -> None:
+    """Agrega frases a una categoría (nueva o existente)."""
+    global _phrases_version
+    PHRASES.setdefault(category, []).extend(phrases)
+    _phrases_version += 1
+
+
+def get_matcher() -> PhraseMatcher:
+    """Autómata con todas las frases de PHRASES; se reconstruye sólo si cambiaron."""
+    global _matcher
+    if _matcher is None or _matcher[0] != _phrases_version:
+        patterns = [(phrase, category) for category, phrases in PHRASES.items() for phrase in phrases]
+        _matcher = (_phrases_version, PhraseMatcher(patterns))
+    return _matcher[1]
+
+
+def find_matches(text: str, whole_words: bool = False) -> List[Match]:
+    """Todas las frases de PHRASES que aparecen en el texto, con su categoría."""
+    return get_matcher().find_all(text, whole_words=whole_words)
+
+
+@lru_cache(maxsize=32)
+def _keywords_matcher(keywords: Tuple[str, ...]) -> PhraseMatcher:
+    return PhraseMatcher((kw, kw) for kw in keywords)
+
+
+def extract_keywords(text: str, keywords: list[str]) -> list[str]:
+    """
+    Extrae palabras clave definidas manualmente si aparecen en el texto
+    (sin distinguir mayúsculas ni tildes).
+    """
+    found = {m.category for m in _keywords_matcher(tuple(keywords)).find_all(text)}
+    return [kw for kw in keywords if kw in found]
+
+
+def quiere_ver_todos_los_productos(texto: str) -> bool:
+    """
+    Detecta si el mensaje contiene frases comunes que indican que el usuario quiere ver todos los productos.
+    """
+    return any(m.category == "ver_catalogo" for m in find_matches(texto))
 
 
 async def detecta_pedido_de_productos(texto_usuario: str) -> bool:
@@ -48,5 +86,7 @@ async def detecta_pedido_de_productos(texto_usuario: str) -> bool:
 
     # Para llamar a Gemini, usamos la misma función que tu flujo principal
     # pero pasando un historial mínimo con un solo mensaje de usuario.
-    respuesta = await ask_gemini_with_history([{"role": "user", "text": prompt}])
+    respuesta = await ask_gemini_with_history(
+        [{"role": "user", "text": prompt}], purpose="catalog_request_detection"
+    )
     return "sí" in respuesta.lower()
@@ -0,0 +1,116 @@
+# app/utils/phrase_matcher.py
+"""
+Búsqueda de muchas frases a la vez (Aho-Corasick) sobre texto normalizado.
+
+Las frases y el texto se normalizan igual (minúsculas, sin tildes, espacios
+colapsados), así que "Qué vendes" encuentra "que vendes". El autómata se
+construye una vez y cada búsqueda recorre el texto una sola vez, sin importar
+cuántas frases haya: O(largo del texto + coincidencias).
+
+    matcher = PhraseMatcher([("ver catálogo", "ver_catalogo"), ("ron", "producto")])
+    matcher.find_all("Quiero ver catalogo de ron")
+    # [Match(phrase='ver catálogo', category='ver_catalogo', start=7, end=19), Match(...)]
+
+`start`/`end` son posiciones en el texto normalizado (`normalize(text)`).
+"""
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes/diacríticos y con los espacios colapsados."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _SPACES.sub(" ", stripped.casefold()).strip()
+
+
+class Match(NamedTuple):
+    phrase: str
+    category: str
+    start: int
+    end: int
+
+
+class PhraseMatcher:
+    """Autómata Aho-Corasick sobre frases normalizadas, cada una con su categoría."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        # Nodo 0 = raíz. Por nodo: transiciones, enlace de falla y salidas (frase, categoría, largo)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, str, int]]] = [[]]
+        self.size = 0
+        seen = set()
+        for phrase, category in patterns:
+            key = normalize(phrase)
+            if not key or (key, category) in seen:
+                continue
+            seen.add((key, category))
+            self._add(key, phrase, category)
+            self.size += 1
+        self._build_links()
+
+    def _add(self, key: str, phrase: str, category: str) -> None:
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((phrase, category, len(key)))
+
+    def _build_links(self) -> None:
+        # Recorrido por niveles: el enlace de falla de un nodo apunta a un nodo menos profundo
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                if node == 0:
+                    continue  # los hijos de la raíz fallan a la raíz
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                # Las frases que terminan en el nodo de falla también terminan aquí
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str, whole_words: bool = False) -> List[Match]:
+        """
+        Todas las coincidencias (pueden solaparse), en orden de aparición.
+        Con `whole_words=True` sólo cuentan las que no están pegadas a otra letra
+        o número (así "ron" no coincide dentro de "ronda").
+        """
+        normalized = normalize(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        matches: List[Match] = []
+        node = 0
+        for i, ch in enumerate(normalized):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for phrase, category, length in out[node]:
+                start, end = i - length + 1, i + 1
+                if whole_words and (
+                    (start > 0 and normalized[start - 1].isalnum())
+                    or (end < len(normalized) and normalized[end].isalnum())
+                ):
+                    continue
+                matches.append(Match(phrase, category, start, end))
+        matches.sort(key=lambda m: (m.start, -m.end))
+        return matches
+
+    def categories(self, text: str, whole_words: bool = False) -> Dict[str, List[Match]]:
+        """Coincidencias agrupadas por categoría."""
+        grouped: Dict[str, List[Match]] = {}
+        for match in self.find_all(text, whole_words):
+            grouped.setdefault(match.category, []).append(match)
+        return grouped
@@ -0,0 +1,288 @@
+# app/utils/session_store.py
+"""
+Almacén del estado de conversación (historial, pedidos pendientes, contexto).
+
+Dos implementaciones con la misma interfaz:
+  - InMemorySessionStore: dicts del proceso (un solo worker, desarrollo).
+  - SQLiteSessionStore: archivo SQLite en modo WAL compartido por todos los
+    workers/instancias que vean el mismo disco.
+
+Ambas ofrecen `lock(key)`, un bloqueo consultivo por número de teléfono para que
+dos mensajes del mismo cliente no se procesen a la vez en procesos distintos.
+La interfaz es async: SQLite corre en un hilo aparte y no bloquea el event loop.
+
+ScopedSessionStore envuelve a cualquiera de las dos para separar el estado de
+varias tiendas (prefijo por clave) y limitar cuántos usuarios guarda cada una.
+"""
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from app.core.logger import get_logger
+
+log = get_logger("session_store")
+
+
+class SessionStore(abc.ABC):
+    """Interfaz común. Los valores deben ser serializables a JSON."""
+
+    @abc.abstractmethod
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, namespace: str, key: str, value: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, namespace: str, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def lock(self, key: str):
+        """Context manager async que serializa el trabajo sobre `key`."""
+
+    @abc.abstractmethod
+    def is_locked(self, key: str) -> bool:
+        """True si en este proceso alguien tiene tomado (o espera) el bloqueo de `key`."""
+
+
+class _KeyLocks:
+    """Un asyncio.Lock por clave, que se descarta cuando nadie lo usa ni lo espera."""
+
+    def __init__(self):
+        self._locks: Dict[str, list] = {}  # clave -> [lock, usuarios]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._locks
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Estado en RAM del proceso. `get` devuelve el objeto guardado (no una copia),
+    pero los llamadores deben hacer `set` tras modificarlo igual que con SQLite.
+    """
+
+    def __init__(self):
+        self._data: dict[str, dict[str, Any]] = defaultdict(dict)
+        self._locks = _KeyLocks()
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        return self._data[namespace].get(key, default)
+
+    async def set(self, namespace: str, key: str, value: Any) -> None:
+        self._data[namespace][key] = value
+
+    async def delete(self, namespace: str, key: str) -> None:
+        self._data[namespace].pop(key, None)
+
+    def lock(self, key: str):
+        return self._locks.hold(key)
+
+    def is_locked(self, key: str) -> bool:
+        return key in self._locks
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Estado compartido en un archivo SQLite (WAL: lectores no bloquean al escritor).
+
+    El bloqueo por clave es una fila en `session_locks` con dueño y vencimiento.
+    Mientras el dueño lo tiene, lo renueva cada `lock_ttl / 3` segundos, así que
+    un turno largo no lo pierde; si el worker muere, otro lo recupera cuando
+    vence (a más tardar `lock_ttl` segundos después).
+
+    Las consultas corren en un hilo (`asyncio.to_thread`), serializadas por
+    `_db_lock` sobre una sola conexión.
+    """
+
+    def __init__(self, path: str, lock_ttl: float = 30.0, poll_interval: float = 0.05):
+        self.path = path
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._owner = uuid.uuid4().hex
+        # Bloqueos locales: evitan sondear SQLite entre corrutinas del mismo proceso
+        self._local_locks = _KeyLocks()
+        self._db_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_locks ("
+            " key TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    def _run(self, sql: str, params: tuple, fetch: bool):
+        with self._db_lock:
+            cur = self._conn.execute(sql, params)
+            return cur.fetchone() if fetch else cur.rowcount
+
+    async def _execute(self, sql: str, params: tuple = (), fetch: bool = False):
+        """Fila (con `fetch`) o filas afectadas, sin bloquear el event loop."""
+        return await asyncio.to_thread(self._run, sql, params, fetch)
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        row = await self._execute(
+            "SELECT value FROM sessions WHERE namespace = ? AND key = ?", (namespace, key), fetch=True
+        )
+        return json.loads(row[0]) if row else default
+
+    async def set(self, namespace: str, key: str, value: Any) -> None:
+        await self._execute(
+            "INSERT INTO sessions (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (namespace, key, json.dumps(value, ensure_ascii=False, default=str), time.time()),
+        )
+
+    async def delete(self, namespace: str, key: str) -> None:
+        await self._execute("DELETE FROM sessions WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def _try_acquire(self, key: str) -> bool:
+        now = time.time()
+        rowcount = await self._execute(
+            "INSERT INTO session_locks (key, owner, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at"
+            " WHERE session_locks.expires_at < ?",
+            (key, self._owner, now + self.lock_ttl, now),
+        )
+        return rowcount == 1
+
+    async def _release(self, key: str) -> None:
+        await self._execute("DELETE FROM session_locks WHERE key = ? AND owner = ?", (key, self._owner))
+
+    async def _heartbeat(self, key: str) -> None:
+        """Extiende el vencimiento del bloqueo mientras el dueño sigue trabajando."""
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            renewed = await self._execute(
+                "UPDATE session_locks SET expires_at = ? WHERE key = ? AND owner = ?",
+                (time.time() + self.lock_ttl, key, self._owner),
+            )
+            if not renewed:
+                log.warning("⚠️ Se perdió el bloqueo de la sesión %s (otro worker lo tomó)", key)
+                return
+
+    @asynccontextmanager
+    async def lock(self, key: str):
+        async with self._local_locks.hold(key):
+            while not await self._try_acquire(key):
+                await asyncio.sleep(self.poll_interval)
+            heartbeat = asyncio.create_task(self._heartbeat(key))
+            try:
+                yield
+            finally:
+                heartbeat.cancel()
+                await self._release(key)
+
+    def is_locked(self, key: str) -> bool:
+        return key in self._local_locks
+
+
+class ScopedSessionStore(SessionStore):
+    """
+    Vista de otro almacén que antepone un prefijo a cada clave y limita cuántos
+    usuarios guarda cada prefijo.
+
+    `scope()` devuelve (prefijo, máximo de usuarios; 0 = sin límite) para el
+    contexto actual. Las claves de `user_namespaces` (una por teléfono) cuentan
+    para ese máximo: al superarlo se borra, de todos esos espacios, el usuario
+    usado hace más tiempo que no tenga su bloqueo tomado.
+
+    El máximo sólo se aplica sobre InMemorySessionStore: el orden de uso vive en
+    el proceso, y con un almacén compartido un worker borraría usuarios que
+    atiende otro. SQLite, además, ya guarda en disco y no en RAM.
+    """
+
+    def __init__(self, inner: SessionStore, scope: Callable[[], Tuple[str, int]], user_namespaces: Iterable[str]):
+        self.inner = inner
+        self.scope = scope
+        self.user_namespaces = frozenset(user_namespaces)
+        self._bounded = isinstance(inner, InMemorySessionStore)
+        self._recent: dict[str, OrderedDict] = defaultdict(OrderedDict)
+
+    async def _touch(self, prefix: str, limit: int, key: str, create: bool) -> None:
+        recent = self._recent[prefix]
+        if key in recent:
+            recent.move_to_end(key)
+        elif create:
+            recent[key] = None
+        while len(recent) > limit:
+            # Quien está a mitad de un mensaje (bloqueo tomado o en espera) no se borra
+            evicted = next((k for k in recent if not self.inner.is_locked(prefix + k)), None)
+            if evicted is None:
+                break
+            del recent[evicted]
+            for namespace in self.user_namespaces:
+                await self.inner.delete(namespace, prefix + evicted)
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        prefix, limit = self.scope()
+        if limit and self._bounded and namespace in self.user_namespaces:
+            await self._touch(prefix, limit, key, create=False)
+        return await self.inner.get(namespace, prefix + key, default)
+
+    async def set(self, namespace: str, key: str, value: Any) -> None:
+        prefix, limit = self.scope()
+        await self.inner.set(namespace, prefix + key, value)
+        if limit and self._bounded and namespace in self.user_namespaces:
+            await self._touch(prefix, limit, key, create=True)
+
+    async def delete(self, namespace: str, key: str) -> None:
+        prefix, _ = self.scope()
+        await self.inner.delete(namespace, prefix + key)
+
+    def lock(self, key: str):
+        prefix, _ = self.scope()
+        return self.inner.lock(prefix + key)
+
+    def is_locked(self, key: str) -> bool:
+        prefix, _ = self.scope()
+        return self.inner.is_locked(prefix + key)
+
+
+def build_session_store(backend: str, path: Optional[str] = None, lock_ttl: float = 30.0) -> SessionStore:
+    """Crea el almacén configurado: 'memory' (por defecto) o 'sqlite'."""
+    backend = (backend or "memory").lower()
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(path or "sessions.db", lock_ttl=lock_ttl)
+    raise ValueError(f"SESSION_BACKEND desconocido: {backend}")
@@ -0,0 +1,224 @@
+"""
+Microbenchmarks del camino caliente de la conversación, sin red.
+
+Usa catálogos sintéticos (deterministas) de 10, 500 y 10.000 productos, con
+variantes e imágenes, y mide el tiempo por llamada de:
+
+    _build_detailed_catalog_for_llm_sales, _build_simplified_catalog_for_llm_image_detection,
+    _find_product_in_list (exacto y aproximado), _find_variant_in_product,
+    _get_image_urls, extract_order_data, get_missing_fields,
+    get_recommended_products y encode_catalog_compact
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.hot_path                      # corre y compara con el baseline si existe
+    python -m benchmarks.hot_path --save               # guarda los resultados como baseline
+    python -m benchmarks.hot_path --sizes 10,500 --filter find_
+    python -m benchmarks.hot_path --fail-on-regression 25   # código 1 si algo empeora más de 25 %
+
+El baseline se guarda en benchmarks/baselines/hot_path.json (uno por máquina:
+los tiempos absolutos no son comparables entre equipos distintos).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "hot_path.json")
+DEFAULT_SIZES = (10, 500, 10_000)
+
+_BRANDS = ["Ron", "Aguardiente", "Tequila", "Whisky", "Vodka", "Ginebra", "Vino", "Cerveza", "Brandy", "Mezcal"]
+_WORDS = ["Viejo", "Caldas", "Nariño", "Antioqueño", "Reserva", "Añejo", "Blanco", "Dorado", "Especial", "Premium",
+          "Clásico", "Tradicional", "Artesanal", "Imperial", "Real", "Gran", "Selecto", "Del", "Valle", "Sierra"]
+_COLORS = ["Amarillo", "Azul", "Rojo", "Verde", "Negro", "Blanco"]
+_SIZES = ["375ml", "750ml", "1000ml", "1750ml"]
+_OCCASIONS = ["asado", "fiesta", "cena", "regalo", "cóctel", "postre", "picada"]
+
+
+def synthetic_catalog(n_products: int, seed: int = 42) -> list:
+    """Productos con la forma que devuelve Supabase (variantes e imágenes anidadas)."""
+    rng = random.Random(seed)
+    products = []
+    for i in range(n_products):
+        product_id = f"p{i:06d}"
+        name = f"{rng.choice(_BRANDS)} {rng.choice(_WORDS)} {rng.choice(_WORDS)} {i}"
+        variants, images = [], []
+        for k in range(rng.randint(1, 4)):
+            variant_id = f"{product_id}-v{k}"
+            variants.append({
+                "id": variant_id,
+                "product_id": product_id,
+                "options": {"color": rng.choice(_COLORS), "tamaño": rng.choice(_SIZES)},
+                "price": rng.randrange(15_000, 250_000, 500),
+                "stock": rng.randint(0, 40),
+                "sku": f"SKU-{i}-{k}",
+            })
+            for j in range(rng.randint(0, 2)):
+                images.append({"id": f"{variant_id}-i{j}", "product_id": product_id, "variant_id": variant_id,
+                               "url": f"https://cdn.example.com/{variant_id}-{j}.jpg"})
+        for j in range(rng.randint(1, 3)):
+            images.append({"id": f"{product_id}-i{j}", "product_id": product_id, "variant_id": None,
+                           "url": f"https://cdn.example.com/{product_id}-{j}.jpg"})
+        products.append({
+            "id": product_id,
+            "name": name,
+            "description": " ".join(rng.choice(_WORDS) for _ in range(rng.randint(10, 40))),
+            "price": rng.randrange(15_000, 250_000, 500),
+            "stock": rng.randint(0, 40),
+            "recommended_for": rng.sample(_OCCASIONS, rng.randint(0, 3)),
+            "product_variants": variants,
+            "product_images": images,
+        })
+    return products
+
+
+_ORDER_RESPONSE = (
+    "¡Perfecto! Tu pedido quedó así: 2 x Ron Viejo de Caldas 750ml y 1 x Aguardiente Nariño azul. "
+    "Total COP 126.000 con envío. ¿Es todo correcto?\n"
+    '{"order_details":{"name":"Ana Pérez","address":"Cra 10 # 20-30, Pasto","phone":"3001112233",'
+    '"payment_method":"Nequi","products":[{"name":"Ron Viejo de Caldas","variant_text":"750ml","quantity":2,'
+    '"price_unit":45000},{"name":"Aguardiente Nariño","variant_text":"azul","quantity":1,"price_unit":31000}],'
+    '"subtotal_products":121000,"shipping_cost":5000,"total_order":126000}}'
+)
+
+
+def _cases(products: list):
+    """(nombre, función sin argumentos) por cada medición."""
+    from app.services.conversation import (
+        _build_detailed_catalog_for_llm_sales,
+        _build_simplified_catalog_for_llm_image_detection,
+        _find_product_in_list,
+        _find_variant_in_product,
+        _get_image_urls,
+    )
+    from app.services.catalog_prompt import encode_catalog_compact
+    from app.services.products import get_recommended_products
+    from app.utils.extractors import extract_order_data
+    from app.utils.validators import get_missing_fields
+
+    # El peor caso de búsqueda exacta es el último producto; el aproximado recorre todo con difflib
+    target = products[-1]
+    typo = target["name"][:-1].lower() + "x"
+    variant = target["product_variants"][-1]
+    variant_query = variant["options"]["tamaño"]
+    pedido = [{"name": products[len(products) // 2]["name"]}, {"name": target["name"]}]
+    pending = {"name": "Ana Pérez", "address": "Tu dirección", "phone": "3001112233", "payment_method": "TIPO_PAGO"}
+    loop = asyncio.new_event_loop()
+
+    return loop, [
+        ("build_detailed_catalog_for_llm_sales", lambda: _build_detailed_catalog_for_llm_sales(products)),
+        ("build_simplified_catalog_for_llm_image_detection",
+         lambda: _build_simplified_catalog_for_llm_image_detection(products)),
+        ("encode_catalog_compact", lambda: encode_catalog_compact(products)),
+        ("find_product_in_list_exact", lambda: _find_product_in_list(products, target["name"])),
+        ("find_product_in_list_fuzzy", lambda: _find_product_in_list(products, typo)),
+        ("find_variant_in_product", lambda: _find_variant_in_product(target, variant_query)),
+        ("get_image_urls", lambda: _get_image_urls(target, variant)),
+        ("extract_order_data", lambda: extract_order_data(_ORDER_RESPONSE)),
+        ("get_missing_fields", lambda: get_missing_fields(pending)),
+        # Incluye el costo fijo de run_until_complete (unos µs)
+        ("get_recommended_products",
+         lambda: loop.run_until_complete(get_recommended_products(pedido, products))),
+    ]
+
+
+def _time(fn, repeat: int, min_time: float) -> dict:
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    # autorange apunta a ~0.2 s; se escala si se pidió otra duración mínima
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"best_us": min(runs) * 1e6, "median_us": statistics.median(runs) * 1e6, "loops": number}
+
+
+def run(sizes, name_filter: str = "", repeat: int = 5, min_time: float = 0.2) -> dict:
+    results = {}
+    for size in sizes:
+        products = synthetic_catalog(size)
+        loop, cases = _cases(products)
+        try:
+            for name, fn in cases:
+                if name_filter and name_filter not in name:
+                    continue
+                results[f"{name}[{size}]"] = _time(fn, repeat, min_time)
+        finally:
+            loop.close()
+    return results
+
+
+def _machine() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()}
+
+
+def _load_baseline(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="tamaños de catálogo (coma)")
+    parser.add_argument("--filter", default="", help="sólo los benchmarks cuyo nombre contenga esto")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="segundos mínimos por repetición")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="guarda los resultados como nuevo baseline")
+    parser.add_argument("--fail-on-regression", type=float, default=0, metavar="PCT",
+                        help="sale con código 1 si algún benchmark empeora más de PCT %%")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    started = time.perf_counter()
+    results = run(sizes, args.filter, args.repeat, args.min_time)
+    baseline = _load_baseline(args.baseline)
+    previous = (baseline or {}).get("results", {})
+
+    regressions = []
+    for name, r in results.items():
+        before = previous.get(name)
+        if before:
+            r["change_pct"] = (r["best_us"] / before["best_us"] - 1) * 100
+            if args.fail_on_regression and r["change_pct"] > args.fail_on_regression:
+                regressions.append(name)
+
+    if args.json:
+        print(json.dumps({"machine": _machine(), "results": results}))
+    else:
+        print(f"{'benchmark':<58}{'mejor':>14}{'mediana':>14}{'vs baseline':>14}")
+        for name, r in results.items():
+            change = f"{r['change_pct']:+.1f}%" if "change_pct" in r else "-"
+            print(f"{name:<58}{r['best_us']:>11.1f} µs{r['median_us']:>11.1f} µs{change:>14}")
+        print(f"\n{len(results)} benchmarks en {time.perf_counter() - started:.1f} s"
+              + ("" if baseline else " (sin baseline; usa --save para guardarlo)"))
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        saved = {
+            "saved_at": datetime.now(timezone.utc).isoformat(),
+            "machine": _machine(),
+            "results": {**previous, **{k: {kk: vv for kk, vv in v.items() if kk != "change_pct"}
+                                         for k, v in results.items()}},
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+        print(f"Baseline guardado en {args.baseline}", file=sys.stderr)
+
+    if regressions:
+        print(f"Regresiones (> {args.fail_on_regression}%): {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""
+Prueba de carga de punta a punta con servidores locales en lugar de Gemini,
+WhatsApp (Graph API) y Supabase (PostgREST + Storage).
+
+1. Servidores de prueba (latencia y errores configurables):
+
+       python -m benchmarks.loadtest.stubs --products 500 --gemini-latency-ms 800 --gemini-error-rate 0.02
+
+2. La app apuntando a ellos (y sin la reconciliación de analítica de fondo):
+
+       GEMINI_BASE_URL=http://127.0.0.1:9101 \\
+       WHATSAPP_API_BASE_URL=http://127.0.0.1:9102/v18.0 \\
+       SUPABASE_URL=http://127.0.0.1:9103 SUPABASE_KEY=test \\
+       ANALYTICS_RECONCILE_SECONDS=0 LOG_LEVEL=WARNING \\
+       uvicorn app.main:app --port 8000
+
+3. El generador de tráfico (conversaciones de varios usuarios contra POST /webhook):
+
+       python -m benchmarks.loadtest.driver --target http://127.0.0.1:8000 --users 50 --products 500
+
+El reporte incluye throughput, p50/p95/p99 del webhook medidos por el cliente y
+p50/p95/p99 por etapa a partir del histograma de /metrics (diferencia entre el
+inicio y el fin de la corrida).
+"""
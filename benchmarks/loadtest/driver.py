@@ -0,0 +1,224 @@
+"""
+Generador de tráfico para POST /webhook: N usuarios simulados, cada uno con una
+conversación de compra completa (saludo, consulta, pedido, foto, datos, confirmación)
+y un tiempo de "pensar" aleatorio entre mensajes.
+
+    python -m benchmarks.loadtest.driver --target http://127.0.0.1:8000 --users 50
+    python -m benchmarks.loadtest.driver --users 200 --loops 3 --think-ms 300 --json
+
+Usa los mismos nombres de producto que el stub de Supabase (catálogo sintético con
+el mismo --products). Reporta throughput, latencia del webhook medida por el
+cliente (p50/p95/p99 exactos) y p50/p95/p99 por etapa estimados del histograma
+`chatbot_stage_duration_seconds` de /metrics (diferencia entre antes y después).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.hot_path import synthetic_catalog
+
+STAGE_METRIC = "chatbot_stage_duration_seconds"
+QUANTILES = (0.5, 0.95, 0.99)
+
+_NAMES = ["Ana Pérez", "Luis Gómez", "Carla Rojas", "Jorge Díaz", "Marta López", "Pedro Castro"]
+_PAYMENTS = ["Nequi", "Daviplata", "efectivo", "transferencia"]
+
+
+def _script(rng: random.Random, products: List[dict]) -> List[str]:
+    """Mensajes de una conversación de compra típica."""
+    product = rng.choice(products)
+    brand = product["name"].split()[0]
+    return [
+        rng.choice(["Hola, buenas tardes", "Buenas", "Hola! qué venden?"]),
+        f"¿Qué {brand.lower()} tienen?",
+        f"Quiero {rng.randint(1, 3)} de {product['name']}",
+        f"Me mandas una foto del {product['name']}?",
+        "Eso es todo por ahora",
+        f"Mi nombre es {rng.choice(_NAMES)}, dirección Calle {rng.randint(1, 99)} # {rng.randint(1, 99)}-"
+        f"{rng.randint(1, 99)}, pago {rng.choice(_PAYMENTS)}",
+        "Sí, confirmo",
+    ]
+
+
+def _payload(phone: str, text: str) -> dict:
+    """Cuerpo con la forma del webhook de WhatsApp Cloud API."""
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "loadtest",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": "loadtest"},
+                    "contacts": [{"profile": {"name": "Load Test"}, "wa_id": phone}],
+                    "messages": [{
+                        "from": phone,
+                        "id": f"wamid.{uuid.uuid4().hex}",
+                        "timestamp": str(int(time.time())),
+                        "type": "text",
+                        "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
+
+
+# --- Histogramas de /metrics ---
+
+_SAMPLE = re.compile(r"^(\w+)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_buckets(text: str, metric: str = STAGE_METRIC) -> Dict[str, Dict[float, float]]:
+    """{etapa: {le: acumulado}} sumando todos los `outcome` de cada etapa."""
+    buckets: Dict[str, Dict[float, float]] = defaultdict(lambda: defaultdict(float))
+    for line in text.splitlines():
+        match = _SAMPLE.match(line.strip())
+        if not match or match.group(1) != f"{metric}_bucket":
+            continue
+        labels = dict(_LABEL.findall(match.group(2) or ""))
+        le = float("inf") if labels.get("le") == "+Inf" else float(labels.get("le", "inf"))
+        buckets[labels.get("stage", "")][le] += float(match.group(3))
+    return buckets
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> Optional[float]:
+    """Igual que `histogram_quantile` de Prometheus: interpolación lineal dentro del bucket."""
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] <= 0:
+        return None
+    rank = q * buckets[bounds[-1]]
+    previous_bound, previous_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def stage_quantiles(before: str, after: str) -> Dict[str, dict]:
+    start, end = parse_buckets(before), parse_buckets(after)
+    report = {}
+    for stage, counts in sorted(end.items()):
+        delta = {le: c - start.get(stage, {}).get(le, 0.0) for le, c in counts.items()}
+        total = delta.get(float("inf"), 0.0)
+        if total <= 0:
+            continue
+        report[stage] = {"count": int(total), **{f"p{int(q * 100)}": histogram_quantile(q, delta) for q in QUANTILES}}
+    return report
+
+
+# --- Corrida ---
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+async def _user(client: httpx.AsyncClient, phone: str, script: List[str], args, rng: random.Random,
+                semaphore: asyncio.Semaphore, samples: List[Tuple[float, int]]) -> None:
+    for _ in range(args.loops):
+        for text in script:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    resp = await client.post("/webhook", json=_payload(phone, text))
+                    status = resp.status_code
+                except httpx.HTTPError:
+                    status = 0
+                samples.append((time.perf_counter() - started, status))
+            if args.think_ms > 0:
+                await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    products = synthetic_catalog(args.products)
+    samples: List[Tuple[float, int]] = []
+    semaphore = asyncio.Semaphore(args.concurrency or args.users)
+    limits = httpx.Limits(max_connections=args.concurrency or args.users)
+    async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout, limits=limits) as client:
+        before = (await client.get("/metrics")).text if args.metrics else ""
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _user(client, f"57300{i:07d}", _script(rng, products), args,
+                  random.Random(rng.random()), semaphore, samples)
+            for i in range(args.users)
+        ))
+        elapsed = time.perf_counter() - started
+        after = (await client.get("/metrics")).text if args.metrics else ""
+
+    latencies = sorted(s for s, _ in samples)
+    errors = sum(1 for _, status in samples if not 200 <= status < 300)
+    report = {
+        "users": args.users,
+        "requests": len(samples),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "webhook": {
+            "mean": statistics.mean(latencies) if latencies else None,
+            **{f"p{int(q * 100)}": _percentile(latencies, q) if latencies else None for q in QUANTILES},
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+    if args.metrics:
+        report["stages"] = stage_quantiles(before, after)
+    return report
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f} ms"
+
+
+def _print(report: dict) -> None:
+    print(f"{report['requests']} requests de {report['users']} usuarios en {report['elapsed_s']:.1f} s "
+          f"({report['throughput_rps']:.1f} req/s), {report['errors']} errores")
+    w = report["webhook"]
+    print(f"webhook (cliente): p50 {_ms(w['p50'])}  p95 {_ms(w['p95'])}  p99 {_ms(w['p99'])}  máx {_ms(w['max'])}")
+    stages = report.get("stages")
+    if stages:
+        print(f"\n{'etapa':<40}{'n':>8}{'p50':>12}{'p95':>12}{'p99':>12}")
+        for stage, row in stages.items():
+            print(f"{stage:<40}{row['count']:>8}{_ms(row['p50']):>12}{_ms(row['p95']):>12}{_ms(row['p99']):>12}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--loops", type=int, default=1, help="conversaciones por usuario")
+    parser.add_argument("--concurrency", type=int, default=0, help="máximo de requests en vuelo (default: --users)")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="media del tiempo entre mensajes de un usuario")
+    parser.add_argument("--products", type=int, default=500, help="igual que en los stubs")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-metrics", dest="metrics", action="store_false", help="no leer /metrics")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        _print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Servidores locales que imitan las APIs externas que usa el bot:
+
+- Gemini `POST /v1/models/<modelo>:generateContent` (puerto 9101): responde según
+  el tipo de prompt (intención de imagen, ventas con operaciones de carrito,
+  detección de catálogo) e incluye `usageMetadata` aproximado.
+- Graph `POST /<versión>/<phone_number_id>/messages` (puerto 9102).
+- PostgREST `/rest/v1/...` y Storage `/storage/v1/object/...` (puerto 9103), en
+  memoria, con el catálogo sintético de benchmarks.hot_path.
+
+Cada servidor tiene latencia base, jitter y tasa de errores propios. Ver
+`python -m benchmarks.loadtest.stubs --help`.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import random
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+from benchmarks.hot_path import synthetic_catalog
+
+
+class Faults:
+    """Latencia (base + jitter exponencial) y errores inyectados por servidor."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float, error_status: int, rng: random.Random):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.error_rate, self.error_status = error_rate, error_status
+        self.rng = rng
+
+    async def apply(self, extra_ms: float = 0.0) -> Optional[Response]:
+        delay = self.latency_ms + extra_ms + (self.rng.expovariate(1 / self.jitter_ms) if self.jitter_ms > 0 else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate > 0 and self.rng.random() < self.error_rate:
+            return JSONResponse({"error": {"code": self.error_status, "message": "error inyectado"}},
+                                status_code=self.error_status)
+        return None
+
+
+# --- Gemini ---
+
+_QUIERO = re.compile(r"quiero (\d+) de (.+)", re.IGNORECASE)
+_DATOS = re.compile(r"mi nombre es ([^,]+), direcci[oó]n ([^,]+), pago (.+)", re.IGNORECASE)
+
+
+def _sales_reply(user_message: str, filler: str) -> str:
+    ops = []
+    match = _QUIERO.search(user_message)
+    if match:
+        ops.append({"op": "add", "product": match.group(2).strip(), "variant": None, "quantity": int(match.group(1))})
+    match = _DATOS.search(user_message)
+    if match:
+        ops += [
+            {"op": "set_customer_field", "field": "name", "value": match.group(1).strip()},
+            {"op": "set_customer_field", "field": "address", "value": match.group(2).strip()},
+            {"op": "set_customer_field", "field": "payment_method", "value": match.group(3).strip()},
+        ]
+    if "confirmo" in user_message.lower():
+        ops.append({"op": "checkout"})
+    text = f"¡Con gusto! 😊 {filler}"
+    if ops:
+        text += "\n" + json.dumps({"cart_ops": ops}, ensure_ascii=False)
+    return text
+
+
+def gemini_app(faults: Faults, reply_chars: int, ms_per_1k_prompt_tokens: float, products: List[dict]) -> FastAPI:
+    app = FastAPI()
+    filler = ("Tenemos excelentes opciones para ti. " * (reply_chars // 36 + 1))[:reply_chars]
+    rng = faults.rng
+
+    @app.post("/v1/models/{model_action}")
+    async def generate_content(model_action: str, request: Request):
+        body = await request.json()
+        contents = body.get("contents") or []
+        prompt_text = "\n".join(p.get("text", "") for c in contents for p in c.get("parts", []))
+        prompt_tokens = len(prompt_text) // 4
+        error = await faults.apply(extra_ms=ms_per_1k_prompt_tokens * prompt_tokens / 1000)
+        if error:
+            return error
+
+        last = contents[-1]["parts"][0]["text"] if contents else ""
+        if "solicitando ver imágenes" in last:
+            wants = "foto" in last.split("current_user_message", 1)[-1][:300].lower()
+            reply = json.dumps(
+                {"action": "show_image", "product_name": rng.choice(products)["name"], "variant_text": None}
+                if wants else {"action": "continue_conversation"},
+                ensure_ascii=False,
+            )
+        else:
+            reply = _sales_reply(last.split("\n\n", 1)[0], filler)
+
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": reply}]}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": len(reply) // 4,
+                "totalTokenCount": prompt_tokens + len(reply) // 4,
+            },
+        }
+
+    return app
+
+
+# --- WhatsApp (Graph API) ---
+
+def whatsapp_app(faults: Faults) -> FastAPI:
+    app = FastAPI()
+    app.state.sent = 0
+
+    @app.post("/{version}/{phone_number_id}/messages")
+    async def send_message(version: str, phone_number_id: str, request: Request):
+        body = await request.json()
+        error = await faults.apply()
+        if error:
+            return error
+        app.state.sent += 1
+        return {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+            "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+        }
+
+    return app
+
+
+# --- Supabase (PostgREST + Storage) ---
+
+_KEYSET = re.compile(r'created_at\.lt\."([^"]+)",and\(created_at\.eq\."([^"]+)",id\.lt\."([^"]+)"\)')
+_RESERVED = {"select", "order", "limit", "offset", "or"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _matches(row: dict, column: str, expression: str) -> bool:
+    op, _, arg = expression.partition(".")
+    value = row.get(column)
+    if op == "in":
+        options = [o.strip().strip('"') for o in arg.strip("()").split(",")]
+        return str(value) in options
+    if op == "ilike":
+        return arg.strip("*").lower() in str(value or "").lower()
+    if value is None:
+        return False
+    value = str(value)
+    return {
+        "eq": value == arg, "neq": value != arg,
+        "gt": value > arg, "gte": value >= arg, "lt": value < arg, "lte": value <= arg,
+    }.get(op, True)
+
+
+def _query(rows: List[dict], params) -> List[dict]:
+    result = [
+        r for r in rows
+        if all(_matches(r, k, v) for k, v in params.multi_items() if k not in _RESERVED)
+    ]
+    keyset = _KEYSET.search(params.get("or") or "")
+    if keyset:
+        created_at, _, order_id = keyset.groups()
+        result = [r for r in result if (str(r.get("created_at")), str(r.get("id"))) < (created_at, order_id)]
+    for part in reversed((params.get("order") or "").split(",")):
+        if part:
+            column, _, direction = part.partition(".")
+            result.sort(key=lambda r: str(r.get(column) or ""), reverse=direction.startswith("desc"))
+    offset = int(params.get("offset") or 0)
+    limit = params.get("limit")
+    return result[offset: offset + int(limit)] if limit else result[offset:]
+
+
+def supabase_app(faults: Faults, products: List[dict]) -> FastAPI:
+    app = FastAPI()
+    tables: Dict[str, List[dict]] = {"products": products, "messages": [], "orders": []}
+    variants = {v["id"]: v for p in products for v in p.get("product_variants") or []}
+    by_id = {p["id"]: p for p in products}
+    objects: Dict[str, int] = {}
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        error = await faults.apply()
+        return error or _query(tables.setdefault(table, []), request.query_params)
+
+    @app.post("/rest/v1/rpc/decrement_stock")
+    async def decrement_stock(request: Request):
+        body = await request.json()
+        error = await faults.apply()
+        if error:
+            return error
+        results = []
+        for i, line in enumerate(body.get("items") or []):
+            target = variants.get(line.get("variant_id")) if line.get("variant_id") else by_id.get(line.get("product_id"))
+            quantity = int(line.get("quantity") or 0)
+            ok = bool(target) and (target.get("stock") or 0) >= quantity > 0
+            if ok:
+                target["stock"] -= quantity
+            results.append({"line": i, **line, "ok": ok, "stock": target.get("stock") if target else None})
+        return results
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        body = await request.json()
+        error = await faults.apply()
+        if error:
+            return error
+        created = []
+        for row in body if isinstance(body, list) else [body]:
+            row = {"id": str(uuid.uuid4()), "created_at": _now(), **row}
+            if table == "product_variants" and row.get("product_id") in by_id:
+                by_id[row["product_id"]].setdefault("product_variants", []).append(row)
+                variants[row["id"]] = row
+            elif table == "product_images" and row.get("product_id") in by_id:
+                by_id[row["product_id"]].setdefault("product_images", []).append(row)
+            else:
+                tables.setdefault(table, []).append(row)
+                if table == "products":
+                    row.setdefault("product_variants", [])
+                    row.setdefault("product_images", [])
+                    by_id[row["id"]] = row
+            created.append(row)
+        return JSONResponse(created, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        body = await request.json()
+        error = await faults.apply()
+        if error:
+            return error
+        rows = _query(tables.setdefault(table, []), request.query_params)
+        for row in rows:
+            row.update(body)
+        return rows
+
+    @app.delete("/rest/v1/{table}")
+    async def delete(table: str, request: Request):
+        error = await faults.apply()
+        if error:
+            return error
+        doomed = {id(r) for r in _query(tables.setdefault(table, []), request.query_params)}
+        tables[table] = [r for r in tables[table] if id(r) not in doomed]
+        return Response(status_code=204)
+
+    @app.api_route("/storage/v1/object/public/{bucket}/{path:path}", methods=["GET", "HEAD"])
+    async def public_object(bucket: str, path: str):
+        error = await faults.apply()
+        if error:
+            return error
+        key = f"{bucket}/{path}"
+        return Response(status_code=200 if key in objects else 404)
+
+    @app.post("/storage/v1/object/{bucket}/{path:path}")
+    async def upload(bucket: str, path: str, request: Request):
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        error = await faults.apply()
+        if error:
+            return error
+        objects[f"{bucket}/{path}"] = size
+        return {"Key": f"{bucket}/{path}"}
+
+    return app
+
+
+def _faults(args, name: str, default_status: int, rng: random.Random) -> Faults:
+    return Faults(
+        getattr(args, f"{name}_latency_ms"),
+        getattr(args, f"{name}_jitter_ms"),
+        getattr(args, f"{name}_error_rate"),
+        default_status,
+        rng,
+    )
+
+
+async def serve(args) -> None:
+    rng = random.Random(args.seed)
+    products = synthetic_catalog(args.products)
+    apps = [
+        (gemini_app(_faults(args, "gemini", 503, rng), args.gemini_reply_chars,
+                    args.gemini_ms_per_1k_prompt_tokens, copy.deepcopy(products)), args.gemini_port),
+        (whatsapp_app(_faults(args, "whatsapp", 500, rng)), args.whatsapp_port),
+        (supabase_app(_faults(args, "supabase", 500, rng), products), args.supabase_port),
+    ]
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host=args.host, port=port, log_level="warning", access_log=False))
+        for app, port in apps
+    ]
+    print(f"Gemini   http://{args.host}:{args.gemini_port}")
+    print(f"WhatsApp http://{args.host}:{args.whatsapp_port}/v18.0")
+    print(f"Supabase http://{args.host}:{args.supabase_port}  ({len(products)} productos)")
+    await asyncio.gather(*(s.serve() for s in servers))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--products", type=int, default=500, help="tamaño del catálogo sintético")
+    parser.add_argument("--seed", type=int, default=1)
+    for name, port, latency in (("gemini", 9101, 600.0), ("whatsapp", 9102, 120.0), ("supabase", 9103, 40.0)):
+        parser.add_argument(f"--{name}-port", type=int, default=port)
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=latency, help="latencia base")
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=latency / 4, help="media del jitter exponencial")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0, help="fracción de respuestas con error")
+    parser.add_argument("--gemini-reply-chars", type=int, default=300, help="largo del texto de ventas")
+    parser.add_argument("--gemini-ms-per-1k-prompt-tokens", type=float, default=20.0,
+                        help="latencia extra por cada 1000 tokens de prompt")
+    asyncio.run(serve(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Compara el tamaño del prompt de ventas (y, opcionalmente, la calidad de las
+respuestas) entre el catálogo en markdown y el compacto.
+
+Conversaciones grabadas: exportadas de la tabla `messages` de Supabase con
+
+    python -m benchmarks.prompt_catalog record --limit 2000 conversaciones.json
+
+Comparación (cada mensaje de usuario de cada conversación se reproduce con su
+historial previo y el carrito vacío):
+
+    python -m benchmarks.prompt_catalog compare conversaciones.json
+    python -m benchmarks.prompt_catalog compare conversaciones.json --catalog catalog_snapshot.json
+    python -m benchmarks.prompt_catalog compare conversaciones.json --live --max-turns 30
+
+Formatos: markdown (actual), compact y compact_in_stock (sin productos agotados).
+Sin --live sólo se mide el prompt (caracteres y tokens estimados). Con --live se
+envía cada prompt a Gemini y se reporta latencia, tokens reales (usageMetadata),
+operaciones de carrito que no se pudieron resolver y coincidencia de las
+operaciones con las del formato markdown.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+FORMATS = ("markdown", "compact", "compact_in_stock")
+
+
+# --- Grabación ---
+
+async def _record(path: str, limit: int) -> None:
+    import httpx
+    from app.core.tenants import supabase_url, supabase_headers
+
+    url = f"{supabase_url()}/rest/v1/messages"
+    params = {"select": "phone_number,role,text,timestamp", "order": "timestamp.desc", "limit": str(limit)}
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        resp = await client.get(url, headers=supabase_headers(), params=params)
+        resp.raise_for_status()
+        rows = resp.json()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    print(f"{len(rows)} mensajes guardados en {path}")
+
+
+def _load_conversations(path: str) -> list:
+    """Mensajes agrupados por teléfono y ordenados por fecha (JSON o NDJSON)."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    rows = json.loads(text) if text.startswith("[") else [json.loads(l) for l in text.splitlines() if l.strip()]
+    by_phone = defaultdict(list)
+    for row in rows:
+        if row.get("role") in ("user", "model") and row.get("text"):
+            by_phone[row.get("phone_number")].append(row)
+    return [
+        (phone, sorted(messages, key=lambda m: m.get("timestamp") or ""))
+        for phone, messages in sorted(by_phone.items(), key=lambda kv: str(kv[0]))
+    ]
+
+
+def _turns(conversations: list):
+    """(teléfono, historial_previo, mensaje_usuario) por cada mensaje de usuario."""
+    for phone, messages in conversations:
+        history = []
+        for message in messages:
+            if message["role"] == "user":
+                yield phone, list(history), message["text"]
+            history.append({"role": message["role"], "text": message["text"]})
+
+
+# --- Comparación ---
+
+async def _load_catalog(snapshot_path: str):
+    from app.services.catalog import get_catalog, read_snapshot
+
+    if snapshot_path:
+        catalog = read_snapshot(snapshot_path)
+        if catalog is None:
+            raise SystemExit(f"No se pudo leer el snapshot {snapshot_path}")
+        return catalog
+    return await get_catalog()
+
+
+def _catalogs_by_format(catalog) -> dict:
+    from app.services.catalog import CatalogIndex
+    from app.services.catalog_prompt import encode_catalog_compact
+
+    in_stock = CatalogIndex(catalog.products, catalog.version)
+    in_stock.renderings["sales_catalog_compact"] = encode_catalog_compact(catalog.products, include_out_of_stock=False)
+    compact = CatalogIndex(catalog.products, catalog.version)
+    compact.renderings["sales_catalog_compact"] = encode_catalog_compact(catalog.products, include_out_of_stock=True)
+    return {
+        "markdown": (catalog, "markdown"),
+        "compact": (compact, "compact"),
+        "compact_in_stock": (in_stock, "compact"),
+    }
+
+
+def _resolved_ops(ops: list, catalog) -> tuple:
+    """(operaciones resueltas como tuplas comparables, operaciones sin resolver)."""
+    from app.services.cart import apply_operations, empty_cart
+
+    resolved, failed = set(), 0
+    for op in ops:
+        if not isinstance(op, dict):
+            failed += 1
+            continue
+        if op.get("op") in ("add", "remove", "set_quantity"):
+            cart = empty_cart()
+            _, problems = apply_operations(cart, [op], catalog)
+            if problems:
+                failed += 1
+                continue
+            line = cart["lines"][0] if cart["lines"] else {}
+            resolved.add((op["op"], line.get("product_id"), line.get("variant_id"), line.get("quantity")))
+        else:
+            resolved.add((op.get("op"), op.get("field"), str(op.get("value") or "").strip().lower()))
+    return frozenset(resolved), failed
+
+
+async def _compare(args) -> None:
+    from app.clients.gemini import ask_gemini_with_history
+    from app.core.llm_usage import usage_summary
+    from app.services.cart import empty_cart
+    from app.services.catalog_prompt import estimate_tokens
+    from app.services.conversation import _build_sales_prompt
+    from app.utils.extractors import extract_cart_operations
+
+    catalog = await _load_catalog(args.catalog)
+    variants = _catalogs_by_format(catalog)
+    turns = list(_turns(_load_conversations(args.conversations)))
+    if args.max_turns:
+        turns = turns[: args.max_turns]
+    if not turns:
+        raise SystemExit("No hay mensajes de usuario en las conversaciones")
+
+    stats = {name: defaultdict(list) for name in FORMATS}
+    for i, (phone, history, user_text) in enumerate(turns):
+        baseline_ops = None
+        for name in FORMATS:
+            fmt_catalog, fmt = variants[name]
+            messages = _build_sales_prompt(phone, user_text, history, fmt_catalog, empty_cart(), catalog_format=fmt)
+            prompt_text = "\n".join(m["text"] for m in messages)
+            stats[name]["chars"].append(len(prompt_text))
+            stats[name]["est_tokens"].append(estimate_tokens(prompt_text))
+            if not args.live:
+                continue
+
+            started = time.perf_counter()
+            answer = await ask_gemini_with_history(messages, purpose=f"bench_{name}", conversation_id=f"bench-{i}")
+            stats[name]["latency"].append(time.perf_counter() - started)
+            stats[name]["answer_chars"].append(len(answer))
+            ops, _ = extract_cart_operations(answer)
+            resolved, failed = _resolved_ops(ops, fmt_catalog)
+            stats[name]["ops"].append(len(ops))
+            stats[name]["failed_ops"].append(failed)
+            if name == "markdown":
+                baseline_ops = resolved
+            else:
+                stats[name]["agrees_with_markdown"].append(1 if resolved == baseline_ops else 0)
+
+    real_tokens = {}
+    if args.live:
+        today = datetime.now(timezone.utc).date().isoformat()
+        day = usage_summary()["days"].get(today, {})
+        real_tokens = {name: day.get(f"bench_{name}", {}) for name in FORMATS}
+
+    report = {"turns": len(turns), "products": len(catalog.products), "formats": {}}
+    for name in FORMATS:
+        s = stats[name]
+        row = {
+            "prompt_chars_mean": statistics.mean(s["chars"]),
+            "prompt_est_tokens_mean": statistics.mean(s["est_tokens"]),
+        }
+        if args.live:
+            calls = real_tokens[name].get("calls") or 0
+            row.update({
+                "prompt_tokens_mean": real_tokens[name].get("prompt_tokens", 0) / calls if calls else None,
+                "completion_tokens_mean": real_tokens[name].get("completion_tokens", 0) / calls if calls else None,
+                "latency_p50": statistics.median(s["latency"]),
+                "latency_max": max(s["latency"]),
+                "answer_chars_mean": statistics.mean(s["answer_chars"]),
+                "cart_ops": sum(s["ops"]),
+                "failed_cart_ops": sum(s["failed_ops"]),
+            })
+            if s["agrees_with_markdown"]:
+                row["ops_agreement_with_markdown"] = statistics.mean(s["agrees_with_markdown"])
+        report["formats"][name] = row
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    print(f"{report['turns']} turnos, {report['products']} productos")
+    base = report["formats"]["markdown"]
+    for name, row in report["formats"].items():
+        ratio = row["prompt_est_tokens_mean"] / base["prompt_est_tokens_mean"]
+        print(f"\n{name}")
+        for key, value in row.items():
+            text = f"{value:.3f}" if isinstance(value, float) else str(value)
+            print(f"  {key:<30} {text}")
+        print(f"  {'vs markdown (tokens est.)':<30} {ratio:.2%}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    record = sub.add_parser("record", help="exporta mensajes recientes de Supabase")
+    record.add_argument("output")
+    record.add_argument("--limit", type=int, default=2000)
+
+    compare = sub.add_parser("compare", help="compara formatos de catálogo sobre conversaciones grabadas")
+    compare.add_argument("conversations")
+    compare.add_argument("--catalog", default="", help="snapshot del catálogo (default: Supabase)")
+    compare.add_argument("--live", action="store_true", help="envía los prompts a Gemini")
+    compare.add_argument("--max-turns", type=int, default=0)
+    compare.add_argument("--json", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        asyncio.run(_record(args.output, args.limit))
+    else:
+        asyncio.run(_compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark de arranque en frío.
+
+Cada corrida lanza un intérprete nuevo que importa `app.main` y responde un
+request en proceso (llamando directamente a la app ASGI, sin servidor ni red),
+y mide:
+
+- import_seconds: tiempo de `from app.main import app`
+- first_response_seconds: desde el inicio del import hasta terminar de responder
+  el primer request (incluye la carga perezosa del router de esa ruta)
+- process_seconds: vida total del proceso (incluye arranque del intérprete)
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 20 --path /webhook --path /products/
+    python -m benchmarks.startup --importtime 15   # módulos más lentos de importar
+    python -m benchmarks.startup --json            # una línea JSON por ruta
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en el proceso hijo: no importa nada de la app antes de medir
+_CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+from app.main import app
+t1 = time.perf_counter()
+path, _, query = sys.argv[1].partition("?")
+
+async def first_request():
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    status = {}
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+    await app(scope, receive, send)
+    return status.get("code")
+
+code = asyncio.run(first_request())
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_seconds": t1 - t0,
+    "first_response_seconds": t2 - t0,
+    "status": code,
+    "app_modules": sum(1 for m in sys.modules if m == "app" or m.startswith("app.")),
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def _run_once(path: str, importtime: bool) -> dict:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", _CHILD, path]
+    env = {**os.environ, "ANALYTICS_RECONCILE_SECONDS": "0"}
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"El proceso hijo falló para {path} (código {proc.returncode})")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = elapsed
+    if importtime:
+        result["_importtime"] = proc.stderr
+    return result
+
+
+def _slowest_imports(stderr: str, top: int) -> list:
+    """Módulos con mayor tiempo acumulado según `-X importtime` (microsegundos)."""
+    rows = []
+    for line in stderr.splitlines():
+        # "import time:       123 |        456 |   paquete.modulo"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def _summary(values: list) -> dict:
+    return {
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="procesos nuevos por ruta (default 10)")
+    parser.add_argument("--path", action="append", help="ruta del primer request (repetible; default / y /webhook)")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="muestra los N imports más lentos")
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args(argv)
+
+    for path in args.path or ["/", "/webhook"]:
+        runs = [_run_once(path, importtime=False) for _ in range(args.runs)]
+        report = {
+            "path": path,
+            "runs": args.runs,
+            "status": runs[-1]["status"],
+            "app_modules_loaded": runs[-1]["app_modules"],
+            "modules_loaded": runs[-1]["modules"],
+        }
+        for key in ("import_seconds", "first_response_seconds", "process_seconds"):
+            report[key] = _summary([r[key] for r in runs])
+
+        if args.importtime:
+            profiled = _run_once(path, importtime=True)
+            report["slowest_imports"] = [
+                {"module": name, "cumulative_ms": cum / 1000, "self_ms": own / 1000}
+                for cum, own, name in _slowest_imports(profiled["_importtime"], args.importtime)
+            ]
+
+        if args.json:
+            print(json.dumps(report))
+            continue
+        print(f"GET {path}  (status {report['status']}, {args.runs} corridas, "
+              f"{report['app_modules_loaded']} módulos app / {report['modules_loaded']} en total)")
+        for key in ("import_seconds", "first_response_seconds", "process_seconds"):
+            s = report[key]
+            print(f"  {key:<24} mediana {s['median'] * 1000:8.1f} ms   "
+                  f"min {s['min'] * 1000:8.1f} ms   max {s['max'] * 1000:8.1f} ms")
+        for row in report.get("slowest_imports", []):
+            print(f"    {row['cumulative_ms']:8.1f} ms  {row['module']}")
+
+
+if __name__ == "__main__":
+    main()
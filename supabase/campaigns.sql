@@ -0,0 +1,86 @@
+-- Campañas de difusión (ver app/services/campaigns.py).
+-- `campaigns` guarda la definición, el estado y los contadores; `campaign_recipients`
+-- un resultado por destinatario. Un worker "toma" la campaña con un lease
+-- (lease_owner + lease_until) que renueva mientras envía; si muere, otro puede
+-- reanudarla cuando el lease vence.
+
+create table if not exists campaigns (
+  id uuid primary key default gen_random_uuid(),
+  name text not null,
+  message jsonb not null,          -- {"type": "template", "template": {...}} o {"type": "text", "text": "..."}
+  audience jsonb not null,         -- filtros con que se armó la audiencia
+  status text not null default 'draft',  -- draft | running | paused | completed | cancelled
+  messages_per_second real not null,
+  total int not null default 0,
+  sent int not null default 0,
+  failed int not null default 0,
+  skipped int not null default 0,
+  lease_owner text,
+  lease_until timestamptz,
+  created_at timestamptz not null default now(),
+  updated_at timestamptz not null default now(),
+  finished_at timestamptz
+);
+
+create table if not exists campaign_recipients (
+  campaign_id uuid not null references campaigns(id) on delete cascade,
+  phone_number text not null,
+  name text,
+  status text not null default 'pending',  -- pending | sending | sent | failed | skipped
+  message_id text,                          -- wamid devuelto por WhatsApp
+  error text,
+  attempts int not null default 0,
+  updated_at timestamptz not null default now(),
+  primary key (campaign_id, phone_number)
+);
+
+create index if not exists campaign_recipients_status_idx
+  on campaign_recipients (campaign_id, status, phone_number);
+
+-- Tope de envío compartido por todas las campañas y workers de un mismo número de
+-- WhatsApp: cubeta de fichas por `bucket` (el phone_number_id). Cada worker pide
+-- fichas con take_send_tokens (devuelve cuántas obtuvo, 0 si hay que esperar) y,
+-- ante un 429, la pausa para todos con pause_seconds > 0.
+create table if not exists send_rate_buckets (
+  bucket text primary key,
+  tokens real not null,
+  updated_at timestamptz not null default now(),
+  paused_until timestamptz
+);
+
+create or replace function take_send_tokens(bucket_id text, rate real, wanted int, pause_seconds real default 0)
+returns int
+language plpgsql
+as $$
+declare
+  b send_rate_buckets;
+  now_ts timestamptz := clock_timestamp();
+  available real;
+  granted int;
+begin
+  insert into send_rate_buckets (bucket, tokens, updated_at)
+  values (bucket_id, 0, now_ts)
+  on conflict (bucket) do nothing;
+  select * into b from send_rate_buckets where bucket = bucket_id for update;
+
+  if pause_seconds > 0 then
+    update send_rate_buckets
+       set tokens = 0,
+           updated_at = now_ts,
+           paused_until = greatest(coalesce(paused_until, now_ts), now_ts + make_interval(secs => pause_seconds))
+     where bucket = bucket_id;
+    return 0;
+  end if;
+  if b.paused_until is not null and b.paused_until > now_ts then
+    return 0;
+  end if;
+
+  -- Ráfaga máxima: un segundo de envíos
+  available := least(rate, b.tokens + extract(epoch from now_ts - b.updated_at) * rate);
+  granted := greatest(0, least(wanted, floor(available)::int));
+  update send_rate_buckets
+     set tokens = available - granted, updated_at = now_ts
+   where bucket = bucket_id;
+  return granted;
+end;
+$$;
@@ -0,0 +1,47 @@
+-- Descuento de stock en lote para un pedido.
+-- Uso (PostgREST): POST /rest/v1/rpc/decrement_stock  {"items": [{"product_id": ..., "variant_id": ..., "quantity": ...}]}
+-- Todas las líneas se aplican en una sola transacción. Una línea cuyo stock no
+-- alcanza no se descuenta (nunca queda negativo) y se reporta con ok = false.
+-- Una cantidad negativa devuelve stock (al actualizar un pedido se envía sólo la
+-- diferencia con el anterior, que puede ser negativa si se quitaron unidades).
+
+create or replace function decrement_stock(items jsonb)
+returns setof jsonb
+language plpgsql
+as $$
+declare
+  item jsonb;
+  idx int := 0;
+  qty int;
+  new_stock int;
+begin
+  for item in select value from jsonb_array_elements(items) loop
+    qty := (item->>'quantity')::int;
+    new_stock := null;
+
+    if item->>'variant_id' is not null then
+      update product_variants
+         set stock = stock - qty
+       where id = (item->>'variant_id')::uuid
+         and stock >= qty
+      returning stock into new_stock;
+    else
+      update products
+         set stock = stock - qty
+       where id = (item->>'product_id')::uuid
+         and stock >= qty
+      returning stock into new_stock;
+    end if;
+
+    return next jsonb_build_object(
+      'line', idx,
+      'product_id', item->'product_id',
+      'variant_id', item->'variant_id',
+      'quantity', qty,
+      'ok', new_stock is not null,
+      'stock', new_stock
+    );
+    idx := idx + 1;
+  end loop;
+end;
+$$;
@@ -0,0 +1,46 @@
+-- Importación masiva de productos (ver app/services/product_import.py).
+-- Uso (PostgREST): POST /rest/v1/rpc/import_products
+--   {"items": [{"name": ..., "description": ..., "price": ..., "stock": ...,
+--               "variants": [{"options": {...}, "price": ..., "stock": ...}],
+--               "image_urls": ["https://..."]}]}
+-- Cada producto se crea junto con sus variantes e imágenes en la misma
+-- transacción: o queda completo o no queda nada, así que repetir una importación
+-- interrumpida nunca deja productos sin sus hijos. Los nombres que ya existen no
+-- se tocan y se reportan con status = 'exists'.
+
+create or replace function import_products(items jsonb)
+returns setof jsonb
+language plpgsql
+as $$
+declare
+  item jsonb;
+  variant jsonb;
+  image_url text;
+  existing_id uuid;
+  new_id uuid;
+begin
+  for item in select value from jsonb_array_elements(items) loop
+    select id into existing_id from products where name = item->>'name' limit 1;
+    if existing_id is not null then
+      return next jsonb_build_object('name', item->>'name', 'product_id', existing_id, 'status', 'exists');
+      continue;
+    end if;
+
+    insert into products (name, description, price, stock)
+    values (item->>'name', item->>'description', (item->>'price')::numeric, (item->>'stock')::int)
+    returning id into new_id;
+
+    for variant in select value from jsonb_array_elements(coalesce(item->'variants', '[]'::jsonb)) loop
+      insert into product_variants (product_id, options, price, stock)
+      values (new_id, coalesce(variant->'options', '{}'::jsonb), (variant->>'price')::numeric, (variant->>'stock')::int);
+    end loop;
+
+    for image_url in select value from jsonb_array_elements_text(coalesce(item->'image_urls', '[]'::jsonb)) loop
+      insert into product_images (product_id, variant_id, variant_label, url)
+      values (new_id, null, null, image_url);
+    end loop;
+
+    return next jsonb_build_object('name', item->>'name', 'product_id', new_id, 'status', 'created');
+  end loop;
+end;
+$$;
@@ -0,0 +1,67 @@
+-- Estado de entrega de los mensajes enviados (callbacks `statuses` del webhook).
+-- Uso (PostgREST): POST /rest/v1/rpc/upsert_message_statuses
+--   {"items": [{"message_id": ..., "recipient": ..., "status": ..., "status_at": ..., "error_code": ..., "error_title": ...}]}
+-- El estado sólo avanza (sent < delivered < read; failed gana siempre), así que
+-- lotes que lleguen en desorden no lo hacen retroceder. También copia el estado
+-- a `campaign_recipients` cuando el mensaje salió de una campaña.
+
+create table if not exists message_statuses (
+  message_id text primary key,  -- wamid
+  recipient text,
+  status text not null,         -- sent | delivered | read | failed
+  status_at timestamptz,
+  error_code int,
+  error_title text,
+  updated_at timestamptz not null default now()
+);
+
+alter table campaign_recipients add column if not exists delivery_status text;
+alter table campaign_recipients add column if not exists delivery_error text;
+create index if not exists campaign_recipients_message_id_idx on campaign_recipients (message_id);
+
+create or replace function message_status_rank(status text)
+returns int
+language sql
+immutable
+as $$
+  select case status when 'sent' then 1 when 'delivered' then 2 when 'read' then 3 when 'failed' then 4 else 0 end
+$$;
+
+create or replace function upsert_message_statuses(items jsonb)
+returns int
+language plpgsql
+as $$
+declare
+  item jsonb;
+  changed int := 0;
+begin
+  for item in select value from jsonb_array_elements(items) loop
+    insert into message_statuses as m (message_id, recipient, status, status_at, error_code, error_title, updated_at)
+    values (
+      item->>'message_id',
+      item->>'recipient',
+      item->>'status',
+      (item->>'status_at')::timestamptz,
+      (item->>'error_code')::int,
+      item->>'error_title',
+      now()
+    )
+    on conflict (message_id) do update
+      set status = excluded.status,
+          status_at = excluded.status_at,
+          error_code = coalesce(excluded.error_code, m.error_code),
+          error_title = coalesce(excluded.error_title, m.error_title),
+          updated_at = now()
+      where message_status_rank(excluded.status) > message_status_rank(m.status);
+
+    if found then
+      changed := changed + 1;
+      update campaign_recipients
+         set delivery_status = item->>'status',
+             delivery_error = coalesce(item->>'error_title', delivery_error)
+       where message_id = item->>'message_id';
+    end if;
+  end loop;
+  return changed;
+end;
+$$;